@@ -0,0 +1,241 @@
+"""Task CRUD endpoints served through the async SQLAlchemy engine.
+
+Enabled with USE_ASYNC_DB=true (see main.py); the sync handlers in main.py
+remain the fallback. Reads are awaited directly on the AsyncSession, writes
+reuse the shared mutations in crud.py through `run_sync`.
+"""
+from datetime import timedelta
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+import events
+import search
+from auth import get_async_db, get_current_user_async
+from models import Task as TaskModel, User
+from schemas.schemas import (
+    TaskBatchRequest,
+    TaskBatchResponse,
+    TaskChanges,
+    TaskCompletedUpdate,
+    TaskCreate,
+    TaskRead,
+    TaskSearchHit,
+    TaskStats,
+)
+
+
+router = APIRouter()
+
+
+async def _get_owned_task(db: AsyncSession, user: User, task_id: int) -> TaskModel:
+    task = (await db.execute(crud.task_select(user.id, task_id))).scalars().first()
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found or not authorized")
+    return task
+
+
+@router.get("/tasks", response_model=List[TaskRead])
+async def get_tasks(
+    request: Request,
+    response: Response,
+    sort_by: Optional[str] = None,
+    sort_order: Optional[str] = "asc",
+    completed: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=crud.TASKS_PAGE_MAX),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    """Retrieves tasks for the current user; see the sync handler in main.py."""
+    try:
+        result = await db.run_sync(
+            crud.list_tasks_page, current_user.id, request.headers.get("if-none-match"),
+            sort_by, sort_order, completed, limit, cursor, fields,
+        )
+    except (crud.InvalidFields, crud.InvalidCursor) as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    headers = crud.cache_headers(result.etag)
+    if result.rows is None:
+        return Response(status_code=304, headers=headers)
+    if result.next_cursor:
+        headers["X-Next-Cursor"] = result.next_cursor
+    if result.projected:
+        return JSONResponse(result.rows, headers=headers)
+    response.headers.update(headers)
+    return result.rows
+
+
+@router.post("/tasks", response_model=TaskRead)
+async def create_task(
+    task: TaskCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    """Creates a new task for the current user."""
+    return await db.run_sync(crud.create_task, current_user.id, task)
+
+
+@router.post("/tasks/batch", response_model=TaskBatchResponse)
+async def batch_tasks(
+    batch: TaskBatchRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    """Applies create/update/complete/delete operations in one transaction.
+
+    All or nothing: if any operation is invalid the batch is rejected with
+    422 and per-operation errors, and nothing is written.
+    """
+    applied, results = await db.run_sync(crud.apply_task_batch, current_user.id, batch.operations)
+    response = TaskBatchResponse(applied=applied, results=results)
+    if not applied:
+        return JSONResponse(status_code=422, content=jsonable_encoder(response))
+    return response
+
+
+@router.get("/tasks/search", response_model=List[TaskSearchHit])
+async def search_tasks(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=search.SEARCH_PAGE_MAX),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    """Full-text search over title, description and address, best matches first.
+
+    The last word matches as a prefix. The cursor for the next page is
+    returned in the X-Next-Cursor header.
+    """
+    try:
+        hits, next_cursor = await db.run_sync(search.search_tasks, current_user.id, q, limit, cursor)
+    except crud.InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return hits
+
+
+@router.get("/tasks/stats", response_model=TaskStats)
+async def get_task_stats(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    """Task counts by priority and completion, plus overdue open tasks.
+
+    Served from the task_stats counters kept up to date by every mutation.
+    """
+    return await db.run_sync(crud.task_stats, current_user.id)
+
+
+@router.get("/tasks/due", response_model=List[TaskRead])
+async def get_due_tasks(
+    within: int = Query(3600, ge=1, le=crud.DUE_WITHIN_MAX_SECONDS),
+    include_overdue: bool = False,
+    limit: int = Query(50, ge=1, le=crud.DUE_PAGE_MAX),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    """Open tasks due within the next `within` seconds, earliest first.
+
+    All-day tasks count for their whole day; `include_overdue` adds tasks
+    whose deadline has already passed.
+    """
+    stmt = crud.due_tasks_select(current_user.id, timedelta(seconds=within), include_overdue, limit)
+    return (await db.execute(stmt)).scalars().all()
+
+
+@router.get("/tasks/stream")
+async def stream_tasks(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    """Server-Sent Events: created/updated/deleted events for the user's tasks.
+
+    See events.sse_stream for the wire format.
+    """
+    subscription = events.bus.subscribe(current_user.id)
+    # Authentication is done; do not hold a DB connection for the whole stream
+    await db.close()
+    return StreamingResponse(
+        events.sse_stream(subscription, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/tasks/changes", response_model=TaskChanges)
+async def get_task_changes(
+    since: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    """Delta sync: tasks written and ids deleted after version `since`.
+
+    Start with since=0 (or after a reset) and pass the returned `version`
+    next time.
+    """
+    return await db.run_sync(crud.task_changes, current_user.id, since)
+
+
+@router.get("/tasks/{task_id}", response_model=TaskRead)
+async def get_task(
+    task_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    """Retrieves a specific task by ID for the current user (ETag / If-None-Match aware)."""
+    etag, task, not_modified = await db.run_sync(
+        crud.get_task_if_modified, current_user.id, task_id, request.headers.get("if-none-match")
+    )
+    if not_modified:
+        return Response(status_code=304, headers=crud.cache_headers(etag))
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found or not authorized")
+    response.headers.update(crud.cache_headers(etag))
+    return task
+
+
+@router.put("/tasks/{task_id}", response_model=TaskRead)
+async def update_task(
+    task_id: int,
+    updated_task: TaskCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    """Updates an existing task by ID for the current user."""
+    task = await _get_owned_task(db, current_user, task_id)
+    return await db.run_sync(crud.update_task, task, updated_task)
+
+
+@router.patch("/tasks/{task_id}/completed", response_model=TaskRead)
+async def set_task_completed(
+    task_id: int,
+    payload: TaskCompletedUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    """Toggle or set task completion state for the current user's task."""
+    task = await _get_owned_task(db, current_user, task_id)
+    return await db.run_sync(crud.set_task_completed, task, payload.completed)
+
+
+@router.delete("/tasks/{task_id}")
+async def delete_task(
+    task_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    """Deletes a task by ID for the current user."""
+    task = await _get_owned_task(db, current_user, task_id)
+    await db.run_sync(crud.delete_task, task)
+    return {"detail": "Task deleted"}
@@ -2,22 +2,26 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+import asyncio
+import logging
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Generator, Optional, Any
+from typing import AsyncGenerator, Generator, Optional, Any, Dict, Set, Tuple
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
-import requests
-
-from google.oauth2 import id_token as google_id_token
-from google.auth.transport import requests as google_requests
+from sqlalchemy import inspect as sa_inspect, select
+from sqlalchemy.orm import Session, make_transient_to_detached
 
 from models import User
-from database.database import SessionLocal
+from database.database import SessionLocal, get_async_sessionmaker
 
 
 SECRET_KEY = os.environ.get("SECRET_KEY", "dev_secret_change_me")
@@ -31,8 +35,24 @@ GOOGLE_CLIENT_ID = os.environ.get(
 GOOGLE_CLIENT_SECRET = os.environ.get("GOOGLE_CLIENT_SECRET", "")
 GOOGLE_DEV_ALLOW_INSECURE = os.environ.get("GOOGLE_DEV_ALLOW_INSECURE", "false").lower() in {"1", "true", "yes"}
 GOOGLE_OAUTH_TOKEN_URL = "https://oauth2.googleapis.com/token"
+GOOGLE_OAUTH2_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+GOOGLE_CERTS_PREWARM = os.environ.get("GOOGLE_CERTS_PREWARM", "true").lower() in {"1", "true", "yes"}
+# Refresh Google access tokens this many seconds before they expire
+GOOGLE_TOKEN_REFRESH_SKEW_SECONDS = int(os.environ.get("GOOGLE_TOKEN_REFRESH_SKEW_SECONDS", "300"))
+
+# Identity cache used by get_current_user (per process)
+AUTH_CACHE_TTL_SECONDS = float(os.environ.get("AUTH_CACHE_TTL_SECONDS", "30"))
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get("AUTH_CACHE_MAX_ENTRIES", "1024"))
+
+# Password hashing: bcrypt cost and the dedicated executor that runs it
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", "32"))
+PASSWORD_HASH_RETRY_AFTER_SECONDS = int(os.environ.get("PASSWORD_HASH_RETRY_AFTER_SECONDS", "1"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
 
@@ -44,6 +64,11 @@ def get_db() -> Generator:
         db.close()
 
 
+async def get_async_db() -> AsyncGenerator:
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+
 def verify_password(plain_password: str, hashed_password: Any) -> bool:
     if not hashed_password:
         return False
@@ -58,6 +83,53 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: Any) -> Tuple[bool, Optional[str]]:
+    """Verify a password and return a replacement hash when the stored one is outdated
+    (e.g. BCRYPT_ROUNDS changed since it was created)."""
+    if not hashed_password:
+        return False, None
+    try:
+        hashed_value = str(hashed_password)
+    except Exception:
+        return False, None
+    return pwd_context.verify_and_update(plain_password, hashed_value)
+
+
+_password_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+# Admission limit: running + queued hash jobs
+_password_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+
+
+async def _run_password_job(fn, *args):
+    """Run bcrypt work on the dedicated executor, or fail fast with 503 when it is saturated."""
+    slots = _password_slots
+    if not slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service is busy, please retry shortly",
+            headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER_SECONDS)},
+        )
+    try:
+        future = _password_executor.submit(fn, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _f: slots.release())
+    return await asyncio.wrap_future(future)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_password_job(get_password_hash, password)
+
+
+async def verify_and_update_password_async(
+    plain_password: str, hashed_password: Any
+) -> Tuple[bool, Optional[str]]:
+    return await _run_password_job(verify_and_update_password, plain_password, hashed_password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -66,27 +138,252 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+class IdentityCache:
+    """Bounded LRU cache mapping bearer tokens to detached user snapshots.
+
+    An entry lives for at most `ttl` seconds and never beyond the JWT's own
+    expiry. Writes to a user row must call `invalidate_user` so the change is
+    visible on the next request handled by this process.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str, User]]" = OrderedDict()
+        self._tokens_by_email: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def epoch(self) -> int:
+        """Invalidation counter; pass it back to `put` to drop racing inserts."""
+        return self._epoch
+
+    def get(self, token: str) -> Optional[User]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, _email, snapshot = entry
+            if expires_at <= now:
+                self._discard(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return snapshot
+
+    def put(self, token: str, user: User, token_exp: Optional[float], epoch: int) -> None:
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        lifetime = self.ttl
+        if token_exp is not None:
+            lifetime = min(lifetime, float(token_exp) - time.time())
+        if lifetime <= 0:
+            return
+        snapshot = _detached_user_snapshot(user)
+        with self._lock:
+            # An invalidation ran while the caller was loading the row.
+            if epoch != self._epoch:
+                return
+            self._discard(token)
+            self._entries[token] = (time.monotonic() + lifetime, snapshot.email, snapshot)
+            self._tokens_by_email.setdefault(snapshot.email, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                self.evictions += 1
+
+    def invalidate_user(self, email: Optional[str]) -> None:
+        with self._lock:
+            self._epoch += 1
+            if not email:
+                return
+            for token in list(self._tokens_by_email.get(email, ())):
+                self._discard(token)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._tokens_by_email.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            }
+
+    def _discard(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._tokens_by_email.get(entry[1])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_email[entry[1]]
+
+
+def _detached_user_snapshot(user: User) -> User:
+    """Copy the loaded columns of `user` into a clean, detached instance."""
+    values = {attr.key: getattr(user, attr.key) for attr in sa_inspect(User).column_attrs}
+    snapshot = User(**values)
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+
+identity_cache = IdentityCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
+
+
+def invalidate_user_cache(user: Optional[User]) -> None:
+    """Drop cached identities for `user`; call after any write to the user row."""
+    identity_cache.invalidate_user(getattr(user, "email", None))
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _token_subject(token: str) -> Tuple[str, dict]:
+    """Decode a bearer token, returning its `sub` (the user's email) and claims."""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub") or ""
         if email is None:
-            raise credentials_exception
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    return email, payload
+
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    email, payload = _token_subject(token)
+
+    cached = identity_cache.get(token)
+    if cached is not None:
+        # Attach a fresh copy to this session without a round trip
+        return db.merge(cached, load=False)
+
+    epoch = identity_cache.epoch
     user = db.query(User).filter(User.email == email).first()
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    identity_cache.put(token, user, payload.get("exp"), epoch)
+    return user
+
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db=Depends(get_async_db)):
+    """get_current_user for handlers running on the async engine."""
+    email, payload = _token_subject(token)
+
+    cached = identity_cache.get(token)
+    if cached is not None:
+        return await db.run_sync(lambda sync_db: sync_db.merge(cached, load=False))
+
+    epoch = identity_cache.epoch
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
+    if user is None:
+        raise _credentials_exception()
+    identity_cache.put(token, user, payload.get("exp"), epoch)
     return user
 
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+def _cache_lifetime(headers) -> int:
+    """Seconds a response may be reused according to its Cache-Control/Age headers."""
+    cache_control = (headers.get("Cache-Control") or "").lower()
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = _MAX_AGE_RE.search(cache_control)
+    if not match:
+        return 0
+    try:
+        age = int(headers.get("Age") or 0)
+    except ValueError:
+        age = 0
+    return max(int(match.group(1)) - age, 0)
+
+
+class CachingGoogleRequest:
+    """google-auth transport (a google.auth.transport.Request) that keeps one HTTP
+    session alive and caches GET responses (the signing-cert documents) for as
+    long as Cache-Control allows."""
+
+    def __init__(self, session=None):
+        # HTTP and Google client modules are imported on first use, not at worker startup
+        from google.auth.transport import requests as google_requests  # pylint: disable=import-outside-toplevel
+
+        self._transport = google_requests.Request(session=session)
+        self._cache: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url, method="GET", body=None, headers=None, **kwargs):
+        if method.upper() != "GET" or body is not None:
+            return self._transport(url, method=method, body=body, headers=headers, **kwargs)
+
+        with self._lock:
+            cached = self._cache.get(url)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        response = self._transport(url, method=method, headers=headers, **kwargs)
+        lifetime = _cache_lifetime(response.headers) if response.status == 200 else 0
+        if lifetime > 0:
+            with self._lock:
+                self._cache[url] = (time.monotonic() + lifetime, response)
+        return response
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+_google_transport: Optional[CachingGoogleRequest] = None
+_google_transport_lock = threading.Lock()
+
+
+def get_google_transport() -> CachingGoogleRequest:
+    """Process-wide transport shared by every Google ID token verification."""
+    global _google_transport
+    if _google_transport is None:
+        with _google_transport_lock:
+            if _google_transport is None:
+                _google_transport = CachingGoogleRequest()
+    return _google_transport
+
+
+def prewarm_google_certs() -> bool:
+    """Fetch Google's signing certs ahead of the first /auth/google call."""
+    try:
+        response = get_google_transport()(GOOGLE_OAUTH2_CERTS_URL, method="GET", timeout=10)
+        return response.status == 200
+    except Exception as exc:
+        logger.warning("Could not pre-warm Google signing certs: %s", exc)
+        return False
+
+
 def verify_google_id_token_and_get_email(google_id_token_str: str) -> str:
+    from google.oauth2 import id_token as google_id_token  # pylint: disable=import-outside-toplevel
+
     try:
-        request_adapter = google_requests.Request()
+        request_adapter = get_google_transport()
         idinfo = google_id_token.verify_oauth2_token(
             google_id_token_str,
             request_adapter,
@@ -133,6 +430,7 @@ def save_google_tokens_for_user(
     db.add(user)
     db.commit()
     db.refresh(user)
+    invalidate_user_cache(user)
 
 
 def is_valid_refresh_token(refresh_token: str) -> bool:
@@ -186,6 +484,8 @@ def refresh_access_token_with_refresh_token(refresh_token: str):
         "grant_type": "refresh_token",
     }
 
+    import requests  # pylint: disable=import-outside-toplevel
+
     try:
         resp = requests.post(GOOGLE_OAUTH_TOKEN_URL, data=payload, timeout=10)
     except requests.exceptions.RequestException as e:
@@ -220,6 +520,114 @@ def refresh_access_token_with_refresh_token(refresh_token: str):
 
     return resp.json()
 
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls sharing a key into a single execution.
+
+    The first caller runs `fn`; callers arriving while it is in flight block
+    and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Any, _Flight] = {}
+
+    def do(self, key: Any, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+        return flight.result
+
+
+google_refresh_flight = SingleFlight()
+
+
+def google_token_needs_refresh(user: User, skew_seconds: Optional[int] = None) -> bool:
+    """True when the stored access token expires within the refresh skew window."""
+    if not user.google_token_expiry:
+        return False
+    skew = GOOGLE_TOKEN_REFRESH_SKEW_SECONDS if skew_seconds is None else skew_seconds
+    return user.google_token_expiry <= datetime.utcnow() + timedelta(seconds=skew)
+
+
+def refresh_google_tokens_for_user(
+    db: Session,
+    user: User,
+    stale_access_token: Optional[str] = None,
+    force: bool = False,
+    skew_seconds: Optional[int] = None,
+) -> str:
+    """
+    Refresh the user's Google access token and persist it, returning the new token.
+
+    Concurrent callers for the same user share one outbound refresh. Before
+    calling Google the leader re-reads the row, so a refresh already committed
+    by another request (or worker) is reused instead of repeated:
+    - stale_access_token: the token Google just rejected; any other stored token wins.
+    - force: always call Google (manual refresh).
+    - skew_seconds: refresh window used for the re-check (default GOOGLE_TOKEN_REFRESH_SKEW_SECONDS).
+    """
+    def _refresh() -> str:
+        db.refresh(user)
+        if not force and user.google_access_token:
+            if stale_access_token is not None:
+                if user.google_access_token != stale_access_token:
+                    return user.google_access_token
+            elif not google_token_needs_refresh(user, skew_seconds):
+                return user.google_access_token
+
+        refreshed = refresh_access_token_with_refresh_token(user.google_refresh_token)
+        new_access = refreshed.get("access_token")
+        expires_in = refreshed.get("expires_in", 3600)
+        save_google_tokens_for_user(
+            db, user, new_access, refresh_token=refreshed.get("refresh_token"), expires_in=expires_in
+        )
+        return new_access
+
+    return google_refresh_flight.do(user.id, _refresh)
+
+
+def get_google_access_token(db: Session, user: User) -> Optional[str]:
+    """Return a usable access token, refreshing it first when it is about to expire."""
+    if not user.google_access_token:
+        return None
+    if user.google_refresh_token and google_token_needs_refresh(user):
+        try:
+            return refresh_google_tokens_for_user(db, user)
+        except HTTPException:
+            # Still inside the skew window: let Google decide, the 401 path retries
+            if user.google_token_expiry and user.google_token_expiry > datetime.utcnow():
+                return user.google_access_token
+            raise
+    return user.google_access_token
+
+
 def exchange_code_for_tokens(code: str) -> dict:
     if not GOOGLE_CLIENT_SECRET:
         raise HTTPException(status_code=500, detail="Missing GOOGLE_CLIENT_SECRET in environment")
@@ -232,6 +640,8 @@ def exchange_code_for_tokens(code: str) -> dict:
         "grant_type": "authorization_code",
     }
 
+    import requests  # pylint: disable=import-outside-toplevel
+
     resp = requests.post("https://oauth2.googleapis.com/token", data=payload)
     if not resp.ok:
         raise HTTPException(status_code=resp.status_code, detail=f"Google token exchange failed: {resp.text}")
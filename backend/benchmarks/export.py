@@ -0,0 +1,95 @@
+"""Export benchmark: time and peak Python memory of a user's task export.
+
+Builds a throwaway SQLite database through the migrations, gives one user
+synthetic tasks and drains each export generator the way the response
+would, at every size in `--rows` (the user's tasks grow between runs).
+Time per 1k rows shows whether a format scales linearly; peak memory comes
+from a separate run under tracemalloc, which slows the code it traces.
+Run from backend/:
+
+    python -m benchmarks.export --rows 1000 10000 100000 --formats pdf
+"""
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+
+def _populate(engine, first: int, rows: int, rng: random.Random) -> None:
+    from models import Task, User  # pylint: disable=import-outside-toplevel
+
+    start = datetime(2025, 1, 1)
+    vocabulary = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(5_000)]
+    with engine.begin() as conn:
+        if first == 0:
+            conn.execute(insert(User), [{"id": 1, "email": "bench@example.com", "hashed_password": "x"}])
+        batch = []
+        for i in range(first, rows):
+            batch.append({
+                "title": " ".join(rng.choices(vocabulary, k=rng.randint(1, 6))),
+                "description": " ".join(rng.choices(vocabulary, k=rng.randint(0, 40))),
+                "deadline": start + timedelta(minutes=i),
+                "priority": rng.choice(("High", "Medium", "Low")),
+                "completed": i % 3 == 0,
+                "user_id": 1,
+            })
+            if len(batch) == 10_000:
+                conn.execute(insert(Task), batch)
+                batch.clear()
+        if batch:
+            conn.execute(insert(Task), batch)
+
+
+def _drain(chunks) -> int:
+    return sum(len(chunk) for chunk in chunks)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--formats", nargs="+", default=["csv", "excel", "pdf"])
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc runs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'export.db')}"
+        # pylint: disable=import-outside-toplevel
+        import exports
+        from database.database import engine
+        from database.migrations import upgrade
+
+        upgrade(engine)
+        formats = {
+            "csv": lambda: exports.iter_csv(exports.iter_export_rows(engine, 1)),
+            "excel": lambda: exports.iter_excel(engine, 1),
+            "pdf": lambda: exports.iter_pdf(engine, 1),
+        }
+        rng = random.Random(42)
+        loaded = 0
+        for rows in sorted(args.rows):
+            _populate(engine, loaded, rows, rng)
+            loaded = rows
+            for name in args.formats:
+                started = time.perf_counter()
+                size = _drain(formats[name]())
+                elapsed = time.perf_counter() - started
+                line = (f"{name:>5}: {rows:>8} rows, {size / 1e6:8.1f} MB in {elapsed:7.2f}s"
+                        f" ({elapsed * 1000 / rows * 1000:7.1f} ms per 1k rows)")
+                if not args.no_memory:
+                    tracemalloc.start()
+                    _drain(formats[name]())
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    line += f", peak {peak / 1e6:7.1f} MB"
+                print(line)
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Full-text search benchmark: FTS5 (search.search_tasks) vs a LIKE scan.
+
+Builds a throwaway SQLite database through the migrations, fills it with
+synthetic tasks (the FTS triggers index them on insert) and times the same
+word lookups both ways. Run from backend/:
+
+    python -m benchmarks.search --rows 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import string
+import tempfile
+import time
+
+from sqlalchemy import insert, or_, select
+from sqlalchemy.orm import Session
+
+
+def _words(rng: random.Random, count: int):
+    return ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(count)]
+
+
+def _populate(engine, rows: int, users: int, vocabulary, rng: random.Random) -> None:
+    from models import Task, User  # pylint: disable=import-outside-toplevel
+
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": i, "email": f"bench{i}@example.com", "hashed_password": "x"} for i in range(1, users + 1)
+        ])
+        batch = []
+        for i in range(rows):
+            batch.append({
+                "title": " ".join(rng.choices(vocabulary, k=4)),
+                "description": " ".join(rng.choices(vocabulary, k=30)),
+                "address": " ".join(rng.choices(vocabulary, k=3)),
+                "priority": "Medium",
+                "user_id": i % users + 1,
+            })
+            if len(batch) == 10_000:
+                conn.execute(insert(Task), batch)
+                batch.clear()
+        if batch:
+            conn.execute(insert(Task), batch)
+
+
+def _time(fn, runs):
+    samples = []
+    for args in runs:
+        started = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'search.db')}"
+        # pylint: disable=import-outside-toplevel
+        import search
+        from database.database import engine
+        from database.migrations import upgrade
+        from models import Task
+
+        upgrade(engine)
+        rng = random.Random(42)
+        vocabulary = _words(rng, 20_000)
+        started = time.perf_counter()
+        _populate(engine, args.rows, args.users, vocabulary, rng)
+        print(f"inserted {args.rows} rows (indexed by triggers) in {time.perf_counter() - started:.1f}s")
+
+        runs = [(rng.randint(1, args.users), rng.choice(vocabulary)) for _ in range(args.queries)]
+
+        def fts(user_id, word):
+            with Session(engine) as db:
+                return search.search_tasks(db, user_id, word, 20)
+
+        def like_user(user_id, word):
+            pattern = f"%{word}%"
+            with Session(engine) as db:
+                return db.execute(select(Task).where(
+                    Task.user_id == user_id,
+                    or_(Task.title.like(pattern), Task.description.like(pattern), Task.address.like(pattern)),
+                ).limit(20)).scalars().all()
+
+        def like_table(_user_id, word):
+            pattern = f"%{word}%"
+            with Session(engine) as db:
+                return db.execute(select(Task.id).where(
+                    or_(Task.title.like(pattern), Task.description.like(pattern), Task.address.like(pattern)),
+                )).all()
+
+        for name, fn in (("fts5 + bm25, one user", fts), ("LIKE, one user", like_user), ("LIKE, whole table", like_table)):
+            median, worst = _time(fn, runs if fn is not like_table else runs[:5])
+            print(f"{name:>22}: median {median:8.2f} ms  max {worst:8.2f} ms")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
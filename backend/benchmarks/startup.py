@@ -0,0 +1,68 @@
+"""Worker startup benchmark: `import main` time and first-request latency.
+
+Each run is a fresh interpreter against a throwaway SQLite database, so the
+numbers include module imports, schema setup in the lifespan hook and the
+first routed request. Run from backend/:
+
+    python -m benchmarks.startup --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+_PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    t2 = time.perf_counter()
+    res = client.get("/me")
+    t3 = time.perf_counter()
+heavy = [m for m in ("openpyxl", "reportlab", "requests", "google.auth") if m in sys.modules]
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "lifespan_ms": (t2 - t1) * 1000,
+    "first_request_ms": (t3 - t2) * 1000,
+    "status": res.status_code,
+    "heavy_modules_loaded": heavy,
+}))
+"""
+
+
+def run_once() -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.update({
+            "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            "GOOGLE_CERTS_PREWARM": "false",
+            "GOOGLE_TOKEN_RENEWAL_ENABLED": "false",
+        })
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE],
+            cwd=BACKEND_DIR, env=env, check=True, capture_output=True, text=True,
+        ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    for key in ("import_ms", "lifespan_ms", "first_request_ms"):
+        values = [r[key] for r in results]
+        print(f"{key:>18}: median {statistics.median(values):8.1f}  min {min(values):8.1f}  max {max(values):8.1f}")
+    print(f"{'heavy modules':>18}: {results[-1]['heavy_modules_loaded'] or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,767 @@
+"""Task queries and mutations shared by the sync and async API paths.
+
+Statement builders return 2.0-style `select()` objects so both a `Session`
+and an `AsyncSession` can execute them. Mutations take a sync `Session`; the
+async handlers call them through `AsyncSession.run_sync`. Each mutation
+bumps the user's data version and task_stats in its transaction and
+publishes a task event (events.py) once committed.
+"""
+import base64
+import binascii
+import hashlib
+import json
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import Select, and_, case, delete, func, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from pydantic import ValidationError
+
+import events
+from models import Task as TaskModel, TaskStat, TaskTombstone, User, priority_rank_for
+from schemas.schemas import (
+    TaskBatchOperation,
+    TaskBatchResult,
+    TaskCompletedUpdate,
+    TaskCreate,
+    TaskRead,
+)
+
+
+def data_version_select(user_id: int) -> Select:
+    """The user's data version, read fresh (the authenticated User may be a cached snapshot)."""
+    return select(User.data_version).where(User.id == user_id)
+
+
+def bump_data_version(db: Session, user_id: int) -> int:
+    """Mark the user's tasks as changed and return the new version.
+
+    Call inside the mutating transaction and stamp the written rows with the
+    result. The UPDATE holds the user's row lock until commit, so versions
+    become visible in increasing order.
+    """
+    return db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(data_version=User.data_version + 1)
+        .returning(User.data_version)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
+
+
+def tasks_etag(user_id: int, data_version: int, *variant: Any) -> str:
+    """Weak ETag for a task response; `variant` distinguishes query parameters."""
+    tag = f"{user_id}.{data_version}"
+    if variant:
+        tag += "." + hashlib.sha1(repr(variant).encode()).hexdigest()[:12]
+    return f'W/"{tag}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against `etag`."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+def cache_headers(etag: str) -> dict:
+    """Headers for conditional task responses: clients always revalidate."""
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def parse_completed_filter(completed: Optional[str]) -> Optional[bool]:
+    """'true' | 'false' | anything else (no filter)."""
+    if completed is None:
+        return None
+    if completed.lower() == "true":
+        return True
+    if completed.lower() == "false":
+        return False
+    return None
+
+
+TASKS_PAGE_MAX = 500
+
+
+# (priority, completed): the key of one task_stats counter
+StatKey = Tuple[str, bool]
+
+# An all-day task is due for the whole day starting at its deadline
+ALL_DAY_SPAN = timedelta(days=1)
+
+
+def _moved(before: StatKey, after: StatKey) -> Counter:
+    if before == after:
+        return Counter()
+    return Counter({before: -1, after: 1})
+
+
+# Fields a `fields=` projection may ask for: everything TaskRead exposes
+TASK_FIELDS = tuple(TaskRead.model_fields)
+
+
+class InvalidCursor(ValueError):
+    """Cursor is malformed or was issued for a different sort."""
+
+
+class InvalidFields(ValueError):
+    """`fields=` names something that is not a task field."""
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Requested field names in TaskRead order, or None for the full payload."""
+    if not fields:
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested.difference(TASK_FIELDS)
+    if unknown:
+        raise InvalidFields(f"Unknown task fields: {', '.join(sorted(unknown))}")
+    return [name for name in TASK_FIELDS if name in requested] or None
+
+
+def projection_columns(field_names: Sequence[str], sort_by: Optional[str], sort_order: Optional[str]) -> list:
+    """Columns to select for a projection: the fields plus the sort keys the cursor needs."""
+    _, keys, _ = _sort_spec(sort_by, sort_order)
+    columns = [getattr(TaskModel, name) for name in field_names]
+    return columns + [key for key in keys if key.key not in field_names]
+
+
+def project_rows(rows: Sequence[Any], field_names: Sequence[str]) -> List[dict]:
+    """JSON-ready dicts holding only `field_names` from column rows."""
+    page = []
+    for row in rows:
+        item = {}
+        for name in field_names:
+            value = getattr(row, name)
+            item[name] = value.isoformat() if isinstance(value, datetime) else value
+        page.append(item)
+    return page
+
+
+def _sort_spec(sort_by: Optional[str], sort_order: Optional[str]):
+    """(mode, key columns, descending) for a GET /tasks sort.
+
+    All keys run in the same direction so one of the tasks indexes can be
+    scanned either way.
+    """
+    if sort_by == "priority":
+        # "desc" means most urgent first, i.e. ascending rank
+        return "priority", [TaskModel.priority_rank, TaskModel.deadline, TaskModel.id], sort_order != "desc"
+    if sort_by == "deadline":
+        # Interpreting "desc" as: items with closer deadlines should come first.
+        return "deadline", [TaskModel.deadline, TaskModel.id], sort_order != "desc"
+    return "insertion", [TaskModel.id], sort_order != "asc"
+
+
+def task_sort_columns(sort_by: Optional[str], sort_order: Optional[str]):
+    """ORDER BY clauses for GET /tasks; each matches one of the tasks indexes.
+
+    NULL deadlines sort as the smallest value: SQLite's native order, and on
+    Postgres the sort indexes declare deadline NULLS FIRST to match.
+    """
+    _, keys, descending = _sort_spec(sort_by, sort_order)
+    if descending:
+        return [key.desc().nulls_last() if key is TaskModel.deadline else key.desc() for key in keys]
+    return [key.asc().nulls_first() if key is TaskModel.deadline else key.asc() for key in keys]
+
+
+def _keyset_segments(keys, values: Sequence[Any], descending: bool):
+    """WHERE clauses covering the rows after `values` in ORDER BY `keys`.
+
+    The tuple comparison (k1, k2, ..) > (v1, v2, ..) is split into disjoint
+    segments returned in result order: same prefix and a later last key
+    first, a later first key last. Each segment is a single range on one of
+    the tasks indexes, so a page costs the same at any depth; NULL
+    deadlines (the smallest value) get a segment of their own instead of an
+    OR that would defeat the index range.
+    """
+    segments = []
+    for i in reversed(range(len(keys))):
+        prefix = [column.is_(None) if value is None else column == value for column, value in zip(keys[:i], values[:i])]
+        column, value = keys[i], values[i]
+        if descending:
+            ranges = [] if value is None else [column < value]
+            if value is not None and column is TaskModel.deadline:
+                ranges.append(column.is_(None))
+        else:
+            ranges = [column.is_not(None) if value is None else column > value]
+        segments.extend(and_(*prefix, clause) for clause in ranges)
+    return segments
+
+
+def _encode_key(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def pack_cursor(payload: dict) -> str:
+    """Opaque, URL-safe form of a JSON cursor payload."""
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def unpack_cursor(cursor: str) -> dict:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError) as exc:
+        raise InvalidCursor("Malformed cursor") from exc
+    if not isinstance(payload, dict):
+        raise InvalidCursor("Malformed cursor")
+    return payload
+
+
+def encode_cursor(task: TaskModel, sort_by: Optional[str], sort_order: Optional[str]) -> str:
+    """Opaque cursor pointing just after `task` in the given sort."""
+    mode, keys, descending = _sort_spec(sort_by, sort_order)
+    return pack_cursor({
+        "s": mode,
+        "d": descending,
+        "k": [_encode_key(getattr(task, key.key)) for key in keys],
+    })
+
+
+def decode_cursor(cursor: str, sort_by: Optional[str], sort_order: Optional[str]) -> List[Any]:
+    """Key values stored in `cursor`; raises InvalidCursor on any mismatch."""
+    mode, keys, descending = _sort_spec(sort_by, sort_order)
+    payload = unpack_cursor(cursor)
+    try:
+        values = payload["k"]
+        matches = payload["s"] == mode and payload["d"] == descending and len(values) == len(keys)
+        values = [
+            datetime.fromisoformat(value) if key is TaskModel.deadline and value is not None else value
+            for key, value in zip(keys, values)
+        ]
+    except (ValueError, KeyError, TypeError) as exc:
+        raise InvalidCursor("Malformed cursor") from exc
+    if not matches:
+        raise InvalidCursor("Cursor does not match the requested sort")
+    return values
+
+
+def tasks_select(
+    user_id: int,
+    completed: Optional[bool] = None,
+    sort_by: Optional[str] = None,
+    sort_order: Optional[str] = "asc",
+    columns: Optional[Sequence[Any]] = None,
+) -> Select:
+    """Tasks of one user in GET /tasks order; `columns` selects plain rows instead of ORM objects."""
+    stmt = select(*columns) if columns else select(TaskModel)
+    stmt = stmt.where(TaskModel.user_id == user_id)
+    if completed is not None:
+        stmt = stmt.where(TaskModel.completed.is_(completed))
+    return stmt.order_by(*task_sort_columns(sort_by, sort_order))
+
+
+def tasks_page_selects(
+    user_id: int,
+    completed: Optional[bool] = None,
+    sort_by: Optional[str] = None,
+    sort_order: Optional[str] = "asc",
+    after: Optional[Sequence[Any]] = None,
+    columns: Optional[Sequence[Any]] = None,
+) -> List[Select]:
+    """Statements returning, in order, the tasks after the decoded cursor `after`.
+
+    Run them one by one until the page is full (keyset pagination, no OFFSET).
+    Without a cursor this is just `tasks_select`.
+    """
+    stmt = tasks_select(user_id, completed, sort_by, sort_order, columns)
+    if after is None:
+        return [stmt]
+    _, keys, descending = _sort_spec(sort_by, sort_order)
+    return [stmt.where(segment) for segment in _keyset_segments(keys, after, descending)]
+
+
+def tasks_page(
+    rows: Sequence[TaskModel],
+    limit: Optional[int],
+    sort_by: Optional[str],
+    sort_order: Optional[str],
+):
+    """Split up to `limit + 1` fetched rows into (page, next cursor or None)."""
+    if limit is None or len(rows) <= limit:
+        return list(rows), None
+    page = list(rows[:limit])
+    return page, encode_cursor(page[-1], sort_by, sort_order)
+
+
+class TasksPage(NamedTuple):
+    """One GET /tasks response; `rows` is None when If-None-Match matched."""
+
+    etag: str
+    rows: Optional[list]
+    next_cursor: Optional[str] = None
+    # rows are dicts of the requested fields rather than Task objects
+    projected: bool = False
+
+
+def list_tasks_page(
+    db: Session,
+    user_id: int,
+    if_none_match: Optional[str] = None,
+    sort_by: Optional[str] = None,
+    sort_order: Optional[str] = "asc",
+    completed: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+) -> TasksPage:
+    """GET /tasks for both API paths (the async one calls it through `run_sync`).
+
+    The weak ETag comes from the user's data version, so a matching
+    If-None-Match is answered before any task is read. Raises InvalidFields
+    or InvalidCursor for a bad `fields` or `cursor`.
+    """
+    field_names = parse_fields(fields)
+    data_version = db.execute(data_version_select(user_id)).scalar_one()
+    etag = tasks_etag(user_id, data_version, sort_by, sort_order, completed, limit, cursor, field_names)
+    if etag_matches(if_none_match, etag):
+        return TasksPage(etag, None)
+
+    after = decode_cursor(cursor, sort_by, sort_order) if cursor is not None else None
+    columns = projection_columns(field_names, sort_by, sort_order) if field_names else None
+    rows: list = []
+    for stmt in tasks_page_selects(user_id, parse_completed_filter(completed), sort_by, sort_order, after, columns):
+        if limit is not None:
+            # one row past the page tells whether there is a next one
+            if len(rows) > limit:
+                break
+            stmt = stmt.limit(limit + 1 - len(rows))
+        result = db.execute(stmt)
+        rows.extend(result.all() if columns else result.scalars().all())
+    page, next_cursor = tasks_page(rows, limit, sort_by, sort_order)
+    if field_names:
+        return TasksPage(etag, project_rows(page, field_names), next_cursor, projected=True)
+    return TasksPage(etag, page, next_cursor)
+
+
+DUE_WITHIN_MAX_SECONDS = 366 * 24 * 3600
+DUE_PAGE_MAX = 200
+
+
+def due_tasks_select(
+    user_id: int,
+    within: timedelta,
+    include_overdue: bool = False,
+    limit: int = 50,
+    now: Optional[datetime] = None,
+) -> Select:
+    """Open tasks due between now and now + `within`, earliest deadline first.
+
+    An all-day task is due for its whole day, so it still counts while that
+    day is running; with `include_overdue`, tasks whose deadline (or day)
+    has already passed are included too. One range on
+    ix_tasks_user_completed_deadline; the all-day check only filters the
+    last day before `now`.
+    """
+    now = now or datetime.utcnow()
+    stmt = select(TaskModel).where(
+        TaskModel.user_id == user_id,
+        TaskModel.completed.is_(False),
+        TaskModel.deadline <= now + within,
+    )
+    if not include_overdue:
+        stmt = stmt.where(
+            TaskModel.deadline >= now - ALL_DAY_SPAN,
+            or_(TaskModel.deadline >= now, TaskModel.all_day.is_(True)),
+        )
+    # NULLS FIRST like the sort indexes, which Postgres otherwise cannot use for the order
+    return stmt.order_by(TaskModel.deadline.asc().nulls_first(), TaskModel.id).limit(limit)
+
+
+def task_select(user_id: int, task_id: int) -> Select:
+    return select(TaskModel).where(TaskModel.id == task_id, TaskModel.user_id == user_id)
+
+
+def get_task(db: Session, user_id: int, task_id: int) -> Optional[TaskModel]:
+    return db.execute(task_select(user_id, task_id)).scalars().first()
+
+
+def get_task_if_modified(
+    db: Session, user_id: int, task_id: int, if_none_match: Optional[str] = None
+) -> Tuple[str, Optional[TaskModel], bool]:
+    """GET /tasks/{id} for both API paths: (etag, task or None if not found, not modified).
+
+    Shares the data-version ETag of the task list; a match skips the read.
+    """
+    etag = tasks_etag(user_id, db.execute(data_version_select(user_id)).scalar_one())
+    if etag_matches(if_none_match, etag):
+        return etag, None, True
+    return etag, get_task(db, user_id, task_id), False
+
+
+def _publish(kind: str, task: TaskModel) -> None:
+    payload = TaskRead.model_validate(task).model_dump(mode="json")
+    events.publish_task_event(kind, task.user_id, task.change_version, task=payload)
+
+
+def create_task(db: Session, user_id: int, task: TaskCreate) -> TaskModel:
+    payload = task.model_dump()
+    # ensure all_day default
+    if 'all_day' not in payload or payload.get('all_day') is None:
+        payload['all_day'] = False
+    version = bump_data_version(db, user_id)
+    db_task = TaskModel(**payload, user_id=user_id, change_version=version)
+    db.add(db_task)
+    apply_stat_deltas(db, user_id, Counter({(db_task.priority, db_task.completed): 1}))
+    db.commit()
+    db.refresh(db_task)
+    _publish("created", db_task)
+    return db_task
+
+
+def update_task(db: Session, task: TaskModel, updated_task: TaskCreate) -> TaskModel:
+    before = (task.priority, task.completed)
+    for key, value in updated_task.model_dump().items():
+        # preserve existing values if None provided
+        if value is None:
+            continue
+        setattr(task, key, value)
+    task.change_version = bump_data_version(db, task.user_id)
+    apply_stat_deltas(db, task.user_id, _moved(before, (task.priority, task.completed)))
+    db.commit()
+    db.refresh(task)
+    _publish("updated", task)
+    return task
+
+
+def set_task_completed(db: Session, task: TaskModel, completed: bool) -> TaskModel:
+    before = (task.priority, task.completed)
+    task.completed = completed
+    task.change_version = bump_data_version(db, task.user_id)
+    apply_stat_deltas(db, task.user_id, _moved(before, (task.priority, completed)))
+    db.commit()
+    db.refresh(task)
+    _publish("updated", task)
+    return task
+
+
+def set_google_event_id(db: Session, task: TaskModel, event_id: str) -> TaskModel:
+    task.google_event_id = event_id
+    task.change_version = bump_data_version(db, task.user_id)
+    db.commit()
+    db.refresh(task)
+    _publish("updated", task)
+    return task
+
+
+def delete_task(db: Session, task: TaskModel) -> None:
+    version = bump_data_version(db, task.user_id)
+    db.add(TaskTombstone(user_id=task.user_id, task_id=task.id, version=version))
+    apply_stat_deltas(db, task.user_id, Counter({(task.priority, task.completed): -1}))
+    db.delete(task)
+    db.commit()
+    events.publish_task_event("deleted", task.user_id, version, task_id=task.id)
+
+
+def _validate_batch(
+    db: Session, user_id: int, operations: Sequence[TaskBatchOperation]
+) -> tuple[List[TaskBatchResult], List[Any], Dict[int, StatKey]]:
+    """Per-operation results (errors filled in), the validated payloads and
+    the current (priority, completed) of every targeted task."""
+    results = [TaskBatchResult(index=i, op=op.op, ok=True, id=op.id) for i, op in enumerate(operations)]
+    payloads: List[Any] = [None] * len(operations)
+
+    targeted = [op.id for op in operations if op.op != "create" and op.id is not None]
+    owned: Dict[int, StatKey] = {}
+    if targeted:
+        owned = {
+            row.id: (row.priority, row.completed)
+            for row in db.execute(
+                select(TaskModel.id, TaskModel.priority, TaskModel.completed)
+                .where(TaskModel.user_id == user_id, TaskModel.id.in_(set(targeted)))
+            )
+        }
+    seen = set()
+
+    for i, op in enumerate(operations):
+        result = results[i]
+        if op.op != "create":
+            if op.id is None:
+                result.ok, result.error = False, "id is required"
+                continue
+            if op.id in seen:
+                result.ok, result.error = False, "Task appears more than once in the batch"
+                continue
+            seen.add(op.id)
+            if op.id not in owned:
+                result.ok, result.error = False, "Task not found or not authorized"
+                continue
+        if op.op == "delete":
+            continue
+        schema = TaskCompletedUpdate if op.op == "complete" else TaskCreate
+        try:
+            payloads[i] = schema.model_validate(op.data or {})
+        except ValidationError as exc:
+            result.ok, result.error = False, exc.errors(include_url=False, include_context=False)
+    return results, payloads, owned
+
+
+def _task_row(payload: TaskCreate, skip_none: bool) -> dict:
+    row = {key: value for key, value in payload.model_dump().items() if not (skip_none and value is None)}
+    if "priority" in row:
+        # bulk statements bypass the Task.priority validator
+        row["priority_rank"] = priority_rank_for(row["priority"])
+    return row
+
+
+def apply_task_batch(
+    db: Session, user_id: int, operations: Sequence[TaskBatchOperation]
+) -> tuple[bool, List[TaskBatchResult]]:
+    """Validate every operation, then apply all of them in one transaction.
+
+    Nothing is written unless every operation is valid. Writes are grouped
+    into one bulk INSERT .. RETURNING, one executemany UPDATE by primary key,
+    one UPDATE per completion value and one DELETE, followed by a single
+    SELECT for the returned tasks. Each task may be targeted once per batch.
+    """
+    results, payloads, current = _validate_batch(db, user_id, operations)
+    if not all(result.ok for result in results):
+        return False, results
+
+    creates = [(i, payloads[i]) for i, op in enumerate(operations) if op.op == "create"]
+    updates = [(i, op.id, payloads[i]) for i, op in enumerate(operations) if op.op == "update"]
+    completions = [(i, op.id, payloads[i].completed) for i, op in enumerate(operations) if op.op == "complete"]
+    deletes = [op.id for op in operations if op.op == "delete"]
+    version = bump_data_version(db, user_id)
+
+    deltas: Counter = Counter()
+    for _, payload in creates:
+        deltas[(payload.priority, bool(payload.completed))] += 1
+    for _, task_id, payload in updates:
+        priority, completed = current[task_id]
+        after = (
+            priority if payload.priority is None else payload.priority,
+            completed if payload.completed is None else payload.completed,
+        )
+        deltas.update(_moved(current[task_id], after))
+    for _, task_id, completed in completions:
+        deltas.update(_moved(current[task_id], (current[task_id][0], completed)))
+    for task_id in deletes:
+        deltas[current[task_id]] -= 1
+    apply_stat_deltas(db, user_id, deltas)
+
+    if creates:
+        rows = []
+        for _, payload in creates:
+            row = _task_row(payload, skip_none=False)
+            # ensure all_day default
+            if row.get("all_day") is None:
+                row["all_day"] = False
+            rows.append({**row, "user_id": user_id, "change_version": version})
+        new_ids = db.execute(
+            insert(TaskModel).returning(TaskModel.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+        for (i, _), task_id in zip(creates, new_ids):
+            results[i].id = task_id
+    if updates:
+        # preserve existing values if None provided, as PUT /tasks/{id} does
+        db.execute(
+            update(TaskModel),
+            [
+                {"id": task_id, **_task_row(payload, skip_none=True), "change_version": version}
+                for _, task_id, payload in updates
+            ],
+        )
+    for completed in (True, False):
+        ids = [task_id for _, task_id, value in completions if value is completed]
+        if ids:
+            db.execute(
+                update(TaskModel)
+                .where(TaskModel.user_id == user_id, TaskModel.id.in_(ids))
+                .values(completed=completed, change_version=version)
+                .execution_options(synchronize_session=False)
+            )
+    if deletes:
+        db.execute(
+            insert(TaskTombstone),
+            [{"user_id": user_id, "task_id": task_id, "version": version} for task_id in deletes],
+        )
+        db.execute(
+            delete(TaskModel)
+            .where(TaskModel.user_id == user_id, TaskModel.id.in_(deletes))
+            .execution_options(synchronize_session=False)
+        )
+
+    returned = [results[i].id for i, _ in creates] + [task_id for _, task_id, _ in updates + completions]
+    if returned:
+        tasks = db.execute(
+            select(TaskModel).where(TaskModel.id.in_(returned)).execution_options(populate_existing=True)
+        ).scalars()
+        by_id = {task.id: TaskRead.model_validate(task) for task in tasks}
+        for result in results:
+            if result.op != "delete":
+                result.task = by_id.get(result.id)
+    db.commit()
+    for result in results:
+        if result.op == "delete":
+            events.publish_task_event("deleted", user_id, version, task_id=result.id)
+        elif result.task is not None:
+            kind = "created" if result.op == "create" else "updated"
+            events.publish_task_event(kind, user_id, version, task=result.task.model_dump(mode="json"))
+    return True, results
+
+
+def task_changes(db: Session, user_id: int, since: int) -> dict:
+    """Tasks written and ids deleted after version `since`, for GET /tasks/changes.
+
+    `reset` is set when tombstones the client would need were already
+    compacted (or `since` is from the future); the client must then reload
+    the full list and continue from `version`. Deletions are listed
+    separately and should be applied before the changed tasks, since SQLite
+    can reuse the id of a deleted task.
+    """
+    version, floor = db.execute(
+        select(User.data_version, User.sync_floor).where(User.id == user_id)
+    ).one()
+    if since < floor or since > version:
+        return {"version": version, "reset": True, "changed": [], "deleted": []}
+    changed = db.execute(
+        select(TaskModel)
+        .where(TaskModel.user_id == user_id, TaskModel.change_version > since)
+        .order_by(TaskModel.change_version, TaskModel.id)
+    ).scalars().all()
+    deleted = db.execute(
+        select(TaskTombstone.task_id)
+        .where(TaskTombstone.user_id == user_id, TaskTombstone.version > since)
+        .order_by(TaskTombstone.version)
+    ).scalars().all()
+    return {"version": version, "reset": False, "changed": changed, "deleted": list(dict.fromkeys(deleted))}
+
+
+def compact_tombstones(db: Session, older_than: datetime) -> int:
+    """Drop tombstones deleted before `older_than`; returns how many.
+
+    Each affected user's sync_floor moves up to the newest dropped version,
+    so clients that synced before it are told to reset.
+    """
+    expired = TaskTombstone.deleted_at < older_than
+    newest_dropped = (
+        select(func.max(TaskTombstone.version))
+        .where(TaskTombstone.user_id == User.id, expired)
+        .scalar_subquery()
+    )
+    db.execute(
+        update(User)
+        .where(User.id.in_(select(TaskTombstone.user_id).where(expired)))
+        .values(sync_floor=case((newest_dropped > User.sync_floor, newest_dropped), else_=User.sync_floor))
+        .execution_options(synchronize_session=False)
+    )
+    dropped = db.execute(delete(TaskTombstone).where(expired).execution_options(synchronize_session=False)).rowcount
+    db.commit()
+    return dropped
+
+
+def _upsert(db: Session):
+    """Dialect insert supporting ON CONFLICT (SQLite and Postgres)."""
+    return (postgresql if db.get_bind().dialect.name == "postgresql" else sqlite).insert(TaskStat.__table__)
+
+
+def apply_stat_deltas(db: Session, user_id: int, deltas: Counter) -> None:
+    """Add `deltas` to the user's task_stats counters inside the current transaction."""
+    rows = [
+        {"user_id": user_id, "priority": priority, "completed": completed, "count": delta}
+        for (priority, completed), delta in deltas.items()
+        if delta
+    ]
+    if not rows:
+        return
+    stmt = _upsert(db)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "priority", "completed"],
+        set_={"count": TaskStat.__table__.c.count + stmt.excluded.count},
+    )
+    db.execute(stmt, rows)
+
+
+def _overdue_count(db: Session, user_id: int, now: datetime) -> int:
+    """Open tasks past their deadline; all-day tasks only once their day is over.
+
+    Two range counts on ix_tasks_user_completed_deadline: everything more
+    than a day late, plus timed tasks within the last day.
+    """
+    open_tasks = and_(TaskModel.user_id == user_id, TaskModel.completed.is_(False))
+    day_ago = now - ALL_DAY_SPAN
+    late = db.execute(
+        select(func.count()).where(open_tasks, TaskModel.deadline < day_ago)
+    ).scalar_one()
+    recent = db.execute(
+        select(func.count()).where(
+            open_tasks, TaskModel.deadline >= day_ago, TaskModel.deadline < now, TaskModel.all_day.is_(False)
+        )
+    ).scalar_one()
+    return late + recent
+
+
+def task_stats(db: Session, user_id: int, now: Optional[datetime] = None) -> dict:
+    """Counts for GET /tasks/stats, read from the task_stats counters."""
+    by_priority: Dict[str, dict] = {}
+    for priority, completed, count in db.execute(
+        select(TaskStat.priority, TaskStat.completed, TaskStat.count).where(TaskStat.user_id == user_id)
+    ):
+        bucket = by_priority.setdefault(priority, {"total": 0, "completed": 0, "open": 0})
+        bucket["total"] += count
+        bucket["completed" if completed else "open"] += count
+    return {
+        "total": sum(b["total"] for b in by_priority.values()),
+        "completed": sum(b["completed"] for b in by_priority.values()),
+        "open": sum(b["open"] for b in by_priority.values()),
+        "overdue": _overdue_count(db, user_id, now or datetime.utcnow()),
+        "by_priority": {priority: b for priority, b in by_priority.items() if b["total"]},
+    }
+
+
+def reconcile_task_stats(db: Session, user_ids: Iterable[int]) -> int:
+    """Rewrite drifted task_stats rows of `user_ids` from a GROUP BY over tasks.
+
+    Returns the number of counters corrected. Starts with a no-op UPDATE of
+    the users rows: every mutation bumps users.data_version first, so this
+    waits for in-flight writes and blocks new ones until commit.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+    db.execute(
+        update(User)
+        .where(User.id.in_(user_ids))
+        .values(data_version=User.data_version)
+        .execution_options(synchronize_session=False)
+    )
+    actual = {
+        (row.user_id, row.priority, row.completed): row.count
+        for row in db.execute(
+            select(TaskModel.user_id, TaskModel.priority, TaskModel.completed, func.count().label("count"))
+            .where(TaskModel.user_id.in_(user_ids))
+            .group_by(TaskModel.user_id, TaskModel.priority, TaskModel.completed)
+        )
+    }
+    stored = {
+        (row.user_id, row.priority, row.completed): row.count
+        for row in db.execute(select(TaskStat).where(TaskStat.user_id.in_(user_ids))).scalars()
+    }
+    fixes = [
+        {"user_id": key[0], "priority": key[1], "completed": key[2], "count": count}
+        for key, count in actual.items()
+        if stored.get(key) != count
+    ]
+    stale = [key for key, count in stored.items() if key not in actual]
+    if fixes:
+        stmt = _upsert(db)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["user_id", "priority", "completed"], set_={"count": stmt.excluded.count}
+            ),
+            fixes,
+        )
+    for user_id, priority, completed in stale:
+        db.execute(delete(TaskStat).where(
+            TaskStat.user_id == user_id, TaskStat.priority == priority, TaskStat.completed.is_(completed)
+        ))
+    db.commit()
+    return len(fixes) + len(stale)
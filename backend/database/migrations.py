@@ -0,0 +1,302 @@
+"""Versioned schema migrations.
+
+The applied version is stored in the one-row `schema_version` table. Deploys
+should run the migrations explicitly before starting workers:
+
+    python -m database.migrations upgrade
+
+At startup the app only calls `ensure_schema`, which reads the stored version
+once and returns when it is current; a schema that is behind stops the
+worker unless AUTO_MIGRATE is set.
+
+Every migration must be idempotent: on a fresh database `upgrade` creates the
+tables from the models first, then runs all migrations on top of them.
+"""
+import argparse
+import os
+import sys
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from sqlalchemy import Column, Integer, MetaData, Table, bindparam, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+
+from database.database import Base, engine as default_engine
+
+
+# Apply pending migrations at startup instead of failing. For local dev with
+# a single worker only: migrations take no lock, and workers booting together
+# would run the same ALTER TABLE concurrently.
+AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE", "false").lower() in {"1", "true", "yes"}
+
+_version_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    _version_metadata,
+    Column("version", Integer, nullable=False),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    """Register a migration; versions must be added in increasing order."""
+    def register(fn: Callable[[Connection], None]):
+        if MIGRATIONS and MIGRATIONS[-1].version >= version:
+            raise ValueError(f"Migration {version} registered out of order")
+        MIGRATIONS.append(Migration(version, description, fn))
+        return fn
+    return register
+
+
+def _add_missing_columns(conn: Connection, table: str, columns: dict) -> None:
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    for name, ddl in columns.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def _create_index(conn: Connection, name: str, table: str, columns: List[str]) -> None:
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+
+def _deadline(conn: Connection) -> str:
+    # Index column matching the GET /tasks null ordering (see models._deadline_sort_indexes)
+    return "deadline NULLS FIRST" if conn.dialect.name == "postgresql" else "deadline"
+
+
+_DEADLINE_SORT_INDEXES = {
+    "ix_tasks_user_deadline": ["user_id", "deadline", "id"],
+    "ix_tasks_user_completed_deadline": ["user_id", "completed", "deadline", "id"],
+    "ix_tasks_user_priority": ["user_id", "priority_rank", "deadline", "id"],
+    "ix_tasks_user_completed_priority": ["user_id", "completed", "priority_rank", "deadline", "id"],
+}
+
+
+def _create_deadline_sort_indexes(conn: Connection) -> None:
+    for name, columns in _DEADLINE_SORT_INDEXES.items():
+        _create_index(conn, name, "tasks", [_deadline(conn) if c == "deadline" else c for c in columns])
+
+
+@migration(1, "Columns added before versioned migrations existed")
+def _legacy_columns(conn: Connection) -> None:
+    _add_missing_columns(conn, "tasks", {
+        "completed": "BOOLEAN NOT NULL DEFAULT FALSE",
+        "google_event_id": "TEXT",
+        "all_day": "BOOLEAN NOT NULL DEFAULT FALSE",
+        "address": "TEXT",
+        "latitude": "FLOAT",
+        "longitude": "FLOAT",
+    })
+    _add_missing_columns(conn, "users", {
+        "google_access_token": "TEXT",
+        "google_refresh_token": "TEXT",
+        "google_token_expiry": "TIMESTAMP",
+    })
+
+
+@migration(2, "Index users.google_token_expiry for the token renewal job")
+def _google_token_expiry_index(conn: Connection) -> None:
+    _create_index(conn, "ix_users_google_token_expiry", "users", ["google_token_expiry"])
+
+
+@migration(3, "tasks.priority_rank and composite indexes for the /tasks sort paths")
+def _priority_rank(conn: Connection) -> None:
+    existing = {c["name"] for c in inspect(conn).get_columns("tasks")}
+    if "priority_rank" not in existing:
+        conn.execute(text("ALTER TABLE tasks ADD COLUMN priority_rank INTEGER NOT NULL DEFAULT 2"))
+        conn.execute(text(
+            "UPDATE tasks SET priority_rank = CASE priority "
+            "WHEN 'High' THEN 1 WHEN 'Medium' THEN 2 WHEN 'Low' THEN 3 ELSE 4 END"
+        ))
+    _create_index(conn, "ix_tasks_user_id_id", "tasks", ["user_id", "id"])
+    _create_index(conn, "ix_tasks_user_completed_id", "tasks", ["user_id", "completed", "id"])
+    _create_deadline_sort_indexes(conn)
+
+
+@migration(4, "users.data_version for conditional GET on the task endpoints")
+def _user_data_version(conn: Connection) -> None:
+    _add_missing_columns(conn, "users", {"data_version": "INTEGER NOT NULL DEFAULT 0"})
+
+
+@migration(5, "tasks.change_version, users.sync_floor and task_tombstones for delta sync")
+def _delta_sync(conn: Connection) -> None:
+    # task_tombstones itself is created from the models by upgrade()
+    existing = {c["name"] for c in inspect(conn).get_columns("tasks")}
+    _add_missing_columns(conn, "users", {"sync_floor": "INTEGER NOT NULL DEFAULT 0"})
+    if "change_version" not in existing:
+        conn.execute(text("ALTER TABLE tasks ADD COLUMN change_version INTEGER NOT NULL DEFAULT 0"))
+        # Stamp existing tasks with a fresh version so `since=0` returns them
+        conn.execute(text("UPDATE users SET data_version = data_version + 1"))
+        conn.execute(text(
+            "UPDATE tasks SET change_version = "
+            "(SELECT data_version FROM users WHERE users.id = tasks.user_id)"
+        ))
+    _create_index(conn, "ix_tasks_user_change_version", "tasks", ["user_id", "change_version"])
+
+
+_FTS_COLUMNS = "new.title, new.description, new.address, 'u' || new.user_id"
+
+
+@migration(6, "Full-text search: tasks_fts (SQLite FTS5) or tasks.search_vector (Postgres)")
+def _task_search(conn: Connection) -> None:
+    if conn.dialect.name == "postgresql":
+        existing = {c["name"] for c in inspect(conn).get_columns("tasks")}
+        if "search_vector" not in existing:
+            conn.execute(text(
+                "ALTER TABLE tasks ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+                "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+                "setweight(to_tsvector('simple', coalesce(description, '')), 'B') || "
+                "setweight(to_tsvector('simple', coalesce(address, '')), 'C')) STORED"
+            ))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tasks_search_vector ON tasks USING GIN (search_vector)"))
+        return
+    if conn.dialect.name != "sqlite":
+        return
+    # `owner` holds 'u<user_id>' so searches intersect with one user's rows
+    # inside the index instead of filtering every match afterwards.
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5("
+        "title, description, address, owner, tokenize = 'unicode61 remove_diacritics 2')"
+    ))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts (rowid, title, description, address, owner) VALUES (new.id, {_FTS_COLUMNS});
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            DELETE FROM tasks_fts WHERE rowid = old.id;
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_update
+        AFTER UPDATE OF title, description, address, user_id ON tasks BEGIN
+            DELETE FROM tasks_fts WHERE rowid = old.id;
+            INSERT INTO tasks_fts (rowid, title, description, address, owner) VALUES (new.id, {_FTS_COLUMNS});
+        END
+    """))
+    conn.execute(text("DELETE FROM tasks_fts"))
+    conn.execute(text(
+        "INSERT INTO tasks_fts (rowid, title, description, address, owner) "
+        "SELECT id, title, description, address, 'u' || user_id FROM tasks"
+    ))
+
+
+@migration(7, "task_stats counters for GET /tasks/stats")
+def _task_stats(conn: Connection) -> None:
+    # task_stats itself is created from the models by upgrade(); fill it from tasks
+    conn.execute(text("DELETE FROM task_stats"))
+    conn.execute(text(
+        "INSERT INTO task_stats (user_id, priority, completed, count) "
+        "SELECT user_id, priority, completed, COUNT(*) FROM tasks GROUP BY user_id, priority, completed"
+    ))
+
+
+
+@migration(8, "Index open tasks by deadline for the reminder scheduler")
+def _reminder_index(conn: Connection) -> None:
+    _create_index(conn, "ix_tasks_completed_deadline", "tasks", ["completed", "deadline", "id"])
+
+
+
+@migration(9, "export_jobs for POST /exports")
+def _export_jobs(conn: Connection) -> None:
+    # export_jobs itself is created from the models by upgrade()
+    _create_index(conn, "ix_export_jobs_user_status", "export_jobs", ["user_id", "status"])
+    _create_index(conn, "ix_export_jobs_expires_at", "export_jobs", ["expires_at"])
+
+
+@migration(10, "Postgres: deadline NULLS FIRST in the /tasks sort indexes")
+def _deadline_nulls_first(conn: Connection) -> None:
+    if conn.dialect.name != "postgresql":
+        return
+    # Databases migrated before the sort indexes declared NULLS FIRST
+    stale = conn.execute(text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = 'tasks' "
+        "AND indexname IN :names AND indexdef NOT LIKE '%NULLS FIRST%'"
+    ).bindparams(bindparam("names", expanding=True)), {"names": list(_DEADLINE_SORT_INDEXES)}).scalars().all()
+    for name in stale:
+        conn.execute(text(f"DROP INDEX {name}"))
+    _create_deadline_sort_indexes(conn)
+
+
+def head_version() -> int:
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def current_version(bind: Engine) -> Optional[int]:
+    """Stored schema version, or None for a database that was never stamped."""
+    try:
+        with bind.connect() as conn:
+            return conn.execute(select(schema_version.c.version)).scalar()
+    except DBAPIError:
+        return None
+
+
+def upgrade(bind: Engine = default_engine) -> int:
+    """Apply every pending migration, each in its own transaction. Returns the new version."""
+    # Register every model on Base.metadata before create_all
+    import models  # noqa: F401  pylint: disable=import-outside-toplevel,unused-import
+
+    with bind.begin() as conn:
+        _version_metadata.create_all(conn)
+        version = conn.execute(select(schema_version.c.version)).scalar()
+        if version is None:
+            conn.execute(schema_version.insert().values(version=0))
+            version = 0
+        if version < head_version():
+            # Tables that do not exist yet are created straight from the models
+            Base.metadata.create_all(conn)
+
+    for step in MIGRATIONS:
+        if step.version <= version:
+            continue
+        with bind.begin() as conn:
+            step.apply(conn)
+            conn.execute(schema_version.update().values(version=step.version))
+        version = step.version
+    return version
+
+
+def ensure_schema(bind: Engine = default_engine, auto_upgrade: bool = AUTO_MIGRATE) -> int:
+    """Startup check: one query when the schema is current, otherwise upgrade or fail."""
+    version = current_version(bind)
+    head = head_version()
+    if version == head:
+        return version
+    if version is not None and version > head:
+        raise RuntimeError(f"Database schema version {version} is newer than this code (expects {head})")
+    if not auto_upgrade:
+        raise RuntimeError(
+            f"Database schema version {version} is behind {head}; "
+            "run `python -m database.migrations upgrade`"
+        )
+    return upgrade(bind)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="SmartTask schema migrations")
+    parser.add_argument("command", choices=["upgrade", "current"], nargs="?", default="upgrade")
+    args = parser.parse_args(argv)
+
+    if args.command == "current":
+        print(f"current: {current_version(default_engine)} head: {head_version()}")
+        return 0
+    before = current_version(default_engine)
+    after = upgrade(default_engine)
+    print(f"schema upgraded from {before} to {after}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""Task change events pushed to clients over Server-Sent Events.
+
+crud.py publishes an event after every committed task mutation. Events go
+through a `Broker`, which hands them to the `EventBus` of every worker; the
+bus fans them out to that worker's subscribers (open GET /tasks/stream
+connections), each with its own bounded queue. In-process listeners (the
+reminder scheduler) see every user's events as they are delivered.
+
+`LocalBroker` delivers within the current process only. It stands in for a
+shared broker (Redis pub/sub, Postgres LISTEN/NOTIFY, ...) until one is
+deployed: with several workers, a client only sees changes made through the
+worker it is connected to and should fall back to GET /tasks/changes.
+`HubBroker` on a `LocalHub` shows the cross-worker shape: each worker's
+broker publishes to the hub, and the hub delivers to every worker's bus.
+"""
+import abc
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per connection; when a slow client falls behind the
+# oldest events are dropped and it is told to resync.
+SSE_QUEUE_SIZE = int(os.environ.get("SSE_QUEUE_SIZE", "100"))
+# Comment line sent on idle connections so proxies do not time them out
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", "15"))
+# Reconnect delay suggested to EventSource clients, in milliseconds
+SSE_RETRY_MS = int(os.environ.get("SSE_RETRY_MS", "3000"))
+
+
+class Subscription:
+    """One stream's queue. Filled on its event loop, drained by `get`."""
+
+    def __init__(self, bus: "EventBus", user_id: int, loop: asyncio.AbstractEventLoop, size: int):
+        self.bus = bus
+        self.user_id = user_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+        self.dropped = 0
+
+    def _put(self, event: dict) -> None:
+        # Runs on self.loop only
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        """Next event, or None when nothing arrived within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """In-process fan-out of events to the subscribers of each user."""
+
+    def __init__(self, queue_size: int = SSE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self._listeners: List[Callable[[int, dict], None]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """Register a subscriber; call from the event loop that will consume it."""
+        subscription = Subscription(self, user_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def add_listener(self, listener: Callable[[int, dict], None]) -> None:
+        """Call `listener(user_id, event)` for every delivered event, on the delivering thread."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[int, dict], None]) -> None:
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self, user_id: Optional[int] = None) -> int:
+        with self._lock:
+            if user_id is not None:
+                return len(self._subscribers.get(user_id, ()))
+            return sum(len(s) for s in self._subscribers.values())
+
+    def deliver(self, user_id: int, event: dict) -> None:
+        """Queue `event` for the user's subscribers. Safe to call from any thread."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(user_id, event)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Event listener failed")
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, event)
+            except RuntimeError:
+                # Event loop already closed: the connection is gone
+                self.unsubscribe(subscription)
+
+
+class Broker(abc.ABC):
+    """Carries events between workers; every worker delivers them to its bus."""
+
+    def __init__(self, deliver: Callable[[int, dict], None]):
+        self.deliver = deliver
+
+    @abc.abstractmethod
+    def publish(self, user_id: int, event: dict) -> None:
+        """Send `event` to every worker, this one included."""
+
+
+class LocalBroker(Broker):
+    """Single-process broker: publishing is delivering."""
+
+    def publish(self, user_id: int, event: dict) -> None:
+        self.deliver(user_id, event)
+
+
+class LocalHub:
+    """In-process stand-in for a shared channel (a Redis pub/sub channel,
+    a Postgres NOTIFY channel): every attached worker receives every event."""
+
+    def __init__(self):
+        self._workers: List[Callable[[int, dict], None]] = []
+        self._lock = threading.Lock()
+
+    def attach(self, deliver: Callable[[int, dict], None]) -> None:
+        with self._lock:
+            self._workers.append(deliver)
+
+    def detach(self, deliver: Callable[[int, dict], None]) -> None:
+        with self._lock:
+            if deliver in self._workers:
+                self._workers.remove(deliver)
+
+    def publish(self, user_id: int, event: dict) -> None:
+        with self._lock:
+            workers = list(self._workers)
+        for deliver in workers:
+            try:
+                deliver(user_id, event)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Event delivery to a worker failed")
+
+
+class HubBroker(Broker):
+    """Broker of one worker on a shared hub: publishes to the hub, which
+    delivers to the bus of every attached worker."""
+
+    def __init__(self, hub: LocalHub, deliver: Callable[[int, dict], None]):
+        super().__init__(deliver)
+        self.hub = hub
+        hub.attach(deliver)
+
+    def publish(self, user_id: int, event: dict) -> None:
+        self.hub.publish(user_id, event)
+
+    def close(self) -> None:
+        self.hub.detach(self.deliver)
+
+
+bus = EventBus()
+broker: Broker = LocalBroker(bus.deliver)
+
+
+def publish(user_id: int, event: dict) -> None:
+    try:
+        broker.publish(user_id, event)
+    except Exception:  # pylint: disable=broad-except
+        # Delivery is best effort; the change itself is already committed
+        logger.exception("Could not publish %s event for user %s", event.get("type"), user_id)
+
+
+def publish_task_event(kind: str, user_id: int, version: int, task: Optional[dict] = None,
+                       task_id: Optional[int] = None) -> None:
+    """Publish a created/updated (with the TaskRead payload) or deleted (with the id) event."""
+    event = {"type": kind, "version": version}
+    if task is not None:
+        event["task"] = task
+    else:
+        event["id"] = task_id
+    publish(user_id, event)
+
+
+def _sse(event: str, data: dict, event_id: Optional[int] = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append("data: " + json.dumps(data, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
+
+async def sse_stream(
+    subscription: Subscription,
+    is_disconnected: Callable[[], Awaitable[bool]],
+    heartbeat: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """Encode a subscription as an SSE body.
+
+    Task events are sent as `event: task` with the data version as `id`, so
+    a reconnecting client can catch up with GET /tasks/changes?since=<id>.
+    When its queue overflowed the client gets `event: resync` and should do
+    exactly that. Deadline reminders are sent as `event: reminder`, without
+    an id: they are not part of the change log.
+    """
+    heartbeat = SSE_HEARTBEAT_SECONDS if heartbeat is None else heartbeat
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n: connected\n\n"
+        while not await is_disconnected():
+            event = await subscription.get(heartbeat)
+            if subscription.dropped:
+                yield _sse("resync", {"dropped": subscription.dropped})
+                subscription.dropped = 0
+            if event is None:
+                yield ": ping\n\n"
+            elif event["type"] == "reminder":
+                yield _sse("reminder", event)
+            else:
+                yield _sse("task", event, event["version"])
+    finally:
+        subscription.close()
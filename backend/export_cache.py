@@ -0,0 +1,167 @@
+"""On-disk cache of rendered task exports.
+
+An export is addressed by (user, format, filters, data version). The user's
+data version changes with every task mutation (crud.bump_data_version), so
+an entry never has to be invalidated: a changed task list simply asks for a
+new key, and stale entries age out of the LRU.
+
+A miss is streamed to the client as it is rendered and written to the cache
+at the same time; it is only published (renamed into place) once complete.
+Each entry has a sidecar holding the SHA-256 of its bytes, served as a
+strong ETag: Excel and PDF renders embed timestamps, so the key alone does
+not identify the bytes. Entries are read through an open handle, so an
+eviction by another worker cannot cut a download short. Least recently used
+entries (by mtime, touched on every hit) are evicted once the directory
+grows past EXPORT_CACHE_MAX_BYTES; partial files a crashed worker left
+behind go after EXPORT_CACHE_PART_MAX_AGE_SECONDS.
+
+Data versions only move forward within one database: clear EXPORT_CACHE_DIR
+when a database is restored or recreated.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import uuid
+import time
+from typing import BinaryIO, Callable, Iterable, Iterator, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CACHE_DIR = os.environ.get("EXPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "smarttask-export-cache"))
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get("EXPORT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Eviction frees space down to this share of the budget, so it does not run on every write
+EXPORT_CACHE_LOW_WATER = 0.9
+# Bump when the rendering changes, so older renders stop being served
+EXPORT_CACHE_RENDER_VERSION = 1
+# Partial files untouched for this long were left by a crashed worker
+EXPORT_CACHE_PART_MAX_AGE_SECONDS = float(os.environ.get("EXPORT_CACHE_PART_MAX_AGE_SECONDS", "3600"))
+
+_ETAG_SUFFIX = ".sha256"
+_PART_SUFFIX = ".part"
+
+
+class CachedExport(NamedTuple):
+    file: BinaryIO
+    size: int
+    etag: str
+
+
+def cache_key(user_id: int, fmt: str, completed: Optional[bool], data_version: int) -> str:
+    return hashlib.sha256(
+        json.dumps([EXPORT_CACHE_RENDER_VERSION, user_id, fmt, completed, data_version]).encode()
+    ).hexdigest()
+
+
+def _path(key: str) -> str:
+    return os.path.join(EXPORT_CACHE_DIR, key)
+
+
+def lookup(key: str) -> Optional[CachedExport]:
+    """The cached export for `key`, opened for reading, or None."""
+    path = _path(key)
+    try:
+        # The sidecar is written last and removed first
+        with open(path + _ETAG_SUFFIX, encoding="ascii") as sidecar:
+            digest = sidecar.read().strip()
+        file = open(path, "rb")  # pylint: disable=consider-using-with
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return CachedExport(file, os.fstat(file.fileno()).st_size, f'"{digest}"')
+
+
+def read_chunks(entry: CachedExport, chunk_size: int) -> Iterator[bytes]:
+    with entry.file:
+        while chunk := entry.file.read(chunk_size):
+            yield chunk
+
+
+def tee(key: str, chunks: Iterable[bytes], still_current: Optional[Callable[[], bool]] = None) -> Iterator[bytes]:
+    """Pass `chunks` through while writing them to the cache under `key`.
+
+    The entry is published only if every chunk was produced and sent; a
+    failed render or a client that disconnects leaves nothing behind.
+    `still_current` is asked once the render is complete: the rows are read
+    after the key was computed, so if the data changed in between the bytes
+    may not match the key, and they are served but not cached.
+    """
+    path = _path(key)
+    temp = f"{path}.{uuid.uuid4().hex}"
+    partial = temp + _PART_SUFFIX
+    sidecar_partial = temp + _ETAG_SUFFIX + _PART_SUFFIX
+    try:
+        os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+        output = open(partial, "wb")  # pylint: disable=consider-using-with
+    except OSError:
+        logger.exception("Export cache unavailable; serving uncached")
+        yield from chunks
+        return
+
+    published = False
+    digest = hashlib.sha256()
+    try:
+        with output:
+            for chunk in chunks:
+                output.write(chunk)
+                digest.update(chunk)
+                yield chunk
+        if still_current is None or still_current():
+            os.replace(partial, path)
+            with open(sidecar_partial, "w", encoding="ascii") as sidecar:
+                sidecar.write(digest.hexdigest())
+            os.replace(sidecar_partial, path + _ETAG_SUFFIX)
+            published = True
+    finally:
+        if not published:
+            for name in (partial, sidecar_partial):
+                if os.path.exists(name):
+                    os.remove(name)
+    try:
+        evict()
+    except OSError:
+        logger.exception("Export cache eviction failed")
+
+
+def evict(max_bytes: Optional[int] = None) -> int:
+    """Delete least recently used entries until the cache fits; returns how many.
+
+    Partial files older than EXPORT_CACHE_PART_MAX_AGE_SECONDS are removed too.
+    """
+    max_bytes = EXPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    part_cutoff = time.time() - EXPORT_CACHE_PART_MAX_AGE_SECONDS
+    entries = []
+    total = 0
+    with os.scandir(EXPORT_CACHE_DIR) as scan:
+        for entry in scan:
+            if entry.name.endswith(_ETAG_SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+                if entry.name.endswith(_PART_SUFFIX):
+                    if stat.st_mtime < part_cutoff:
+                        os.remove(entry.path)
+                    continue
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    if total <= max_bytes:
+        return 0
+
+    evicted = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes * EXPORT_CACHE_LOW_WATER:
+            break
+        for name in (path + _ETAG_SUFFIX, path):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+        total -= size
+        evicted += 1
+    return evicted
@@ -0,0 +1,212 @@
+"""Task exports rendered in the background (POST /exports).
+
+A job row is written by the request, which returns at once; the export is
+rendered by `run_export` in a small process pool (EXPORT_WORKERS per API
+worker process), so neither request workers nor the API process's GIL are
+held by a large PDF. The
+worker reports progress in the job row itself, which any API worker can
+read, and writes the artifact under EXPORT_DIR. Jobs and artifacts expire
+EXPORT_TTL_SECONDS after they finish and are removed by the cleanup job
+(jobs.export_cleanup_job).
+
+Workers open the database by URL, so the API must not use an in-memory
+SQLite database.
+"""
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional
+
+from sqlalchemy import Engine, delete, func, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+import exports
+from database.database import build_engine
+from models import ExportJob
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = os.environ.get("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "smarttask-exports"))
+# Export processes per API worker process: every uvicorn/gunicorn worker starts
+# its own pool, so a host runs up to (API workers x EXPORT_WORKERS) renders,
+# all competing with request handling. Keep it small.
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", "1"))
+# How long a finished export can be downloaded
+EXPORT_TTL_SECONDS = float(os.environ.get("EXPORT_TTL_SECONDS", "3600"))
+# Jobs a user may have waiting or running at once
+EXPORT_MAX_ACTIVE_PER_USER = int(os.environ.get("EXPORT_MAX_ACTIVE_PER_USER", "3"))
+
+ACTIVE_STATUSES = ("pending", "running")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+class TooManyExports(Exception):
+    """The user already has EXPORT_MAX_ACTIVE_PER_USER jobs in progress."""
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the API process has threads and open connections
+            _pool = ProcessPoolExecutor(max_workers=EXPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown() -> None:
+    """Stop the pool; jobs not started yet stay pending until they expire."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def artifact_path(job_id: str, fmt: str) -> str:
+    return os.path.join(EXPORT_DIR, f"{job_id}.{exports.EXPORT_FORMATS[fmt][1]}")
+
+
+def finished_artifact(job: ExportJob) -> Optional[str]:
+    """Path of a done job's file, or None if it is gone (purged or lost with its disk)."""
+    path = artifact_path(job.id, job.format)
+    return path if job.status == "done" and os.path.exists(path) else None
+
+
+@lru_cache(maxsize=None)
+def _worker_engine(url: str) -> Engine:
+    # One engine per worker process and database; workers hold no idle connections
+    return build_engine(url, poolclass=NullPool)
+
+
+def _finish(bind: Engine, job_id: str, ttl_seconds: float, **values) -> bool:
+    now = datetime.utcnow()
+    with Session(bind) as db:
+        result = db.execute(
+            update(ExportJob)
+            .where(ExportJob.id == job_id)
+            .values(finished_at=now, expires_at=now + timedelta(seconds=ttl_seconds), **values)
+        )
+        db.commit()
+    return result.rowcount > 0
+
+
+def run_export(url: str, job_id: str, user_id: int, fmt: str, completed: Optional[bool], ttl_seconds: float) -> int:
+    """Render one export to its artifact file. Runs in a pool worker process."""
+    bind = _worker_engine(url)
+    with Session(bind) as db:
+        db.execute(update(ExportJob).where(ExportJob.id == job_id).values(status="running"))
+        db.commit()
+
+    path = artifact_path(job_id, fmt)
+    partial = path + ".part"
+    try:
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        with open(partial, "wb") as output:
+            for chunk in exports.iter_export(fmt, bind, user_id, completed):
+                output.write(chunk)
+        os.replace(partial, path)
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.exception("Export job %s failed", job_id)
+        if os.path.exists(partial):
+            os.remove(partial)
+        _finish(bind, job_id, ttl_seconds, status="failed", error=str(exc) or type(exc).__name__)
+        return 0
+
+    size = os.path.getsize(path)
+    if not _finish(bind, job_id, ttl_seconds, status="done", size=size):
+        # Purged while it was rendering: nobody can download it
+        os.remove(path)
+    return size
+
+
+def _check_outcome(bind: Engine, job_id: str, ttl_seconds: float, future: Future) -> None:
+    # run_export records its own failures; this catches the ones it cannot
+    # (worker killed, pool shut down, database unreachable from the worker)
+    if future.cancelled():
+        error = "Export cancelled"
+    elif future.exception() is not None:
+        error = str(future.exception()) or type(future.exception()).__name__
+    else:
+        return
+    try:
+        with Session(bind) as db:
+            db.execute(
+                update(ExportJob)
+                .where(ExportJob.id == job_id, ExportJob.status.in_(ACTIVE_STATUSES))
+                .values(status="failed", error=error, finished_at=datetime.utcnow(),
+                        expires_at=datetime.utcnow() + timedelta(seconds=ttl_seconds))
+            )
+            db.commit()
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Could not record the failure of export job %s", job_id)
+
+
+def create_job(db: Session, user_id: int, fmt: str, completed: Optional[bool] = None) -> ExportJob:
+    """Record an export job and hand it to the pool."""
+    active = db.execute(
+        select(func.count()).select_from(ExportJob)
+        .where(ExportJob.user_id == user_id, ExportJob.status.in_(ACTIVE_STATUSES))
+    ).scalar_one()
+    if active >= EXPORT_MAX_ACTIVE_PER_USER:
+        raise TooManyExports()
+
+    now = datetime.utcnow()
+    job = ExportJob(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        format=fmt,
+        completed=completed,
+        status="pending",
+        created_at=now,
+        # Until it finishes; a job that never runs is purged eventually
+        expires_at=now + timedelta(seconds=EXPORT_TTL_SECONDS),
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    job_id = job.id
+    bind = db.get_bind()
+    url = bind.url.render_as_string(hide_password=False)
+    future = _executor().submit(run_export, url, job_id, user_id, fmt, completed, EXPORT_TTL_SECONDS)
+    future.add_done_callback(lambda f: _check_outcome(bind, job_id, EXPORT_TTL_SECONDS, f))
+    return job
+
+
+def get_job(db: Session, user_id: int, job_id: str, now: Optional[datetime] = None) -> Optional[ExportJob]:
+    """The user's job, unless it does not exist or has expired."""
+    job = db.get(ExportJob, job_id)
+    if job is None or job.user_id != user_id or job.expires_at <= (now or datetime.utcnow()):
+        return None
+    return job
+
+
+def purge_expired(db: Session, now: Optional[datetime] = None, batch_size: int = 500) -> int:
+    """Delete expired jobs and their artifacts, through the index on expires_at."""
+    now = now or datetime.utcnow()
+    purged = 0
+    while True:
+        jobs = db.execute(
+            select(ExportJob.id, ExportJob.format).where(ExportJob.expires_at <= now).limit(batch_size)
+        ).all()
+        if not jobs:
+            return purged
+        for job in jobs:
+            path = artifact_path(job.id, job.format)
+            for leftover in (path, path + ".part"):
+                try:
+                    os.remove(leftover)
+                except FileNotFoundError:
+                    pass
+        db.execute(delete(ExportJob).where(ExportJob.id.in_([job.id for job in jobs])))
+        db.commit()
+        purged += len(jobs)
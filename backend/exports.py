@@ -0,0 +1,413 @@
+"""Rendering of task exports (CSV, Excel, PDF).
+
+All three are streamed: rows are read in batches and encoded as they are
+sent (Excel and PDF through a temp file, since both need a finished file).
+openpyxl and reportlab are imported inside the renderers, so workers that
+never export do not pay for them at startup.
+"""
+import csv
+import io
+import os
+import tempfile
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from sqlalchemy import Engine, Row, Select, func, select
+from sqlalchemy.orm import Session
+
+from models import Task as TaskModel
+
+
+EXPORT_HEADERS = ['ID', 'Title', 'Description', 'Deadline', 'Priority', 'Completed']
+# Rows fetched per round trip, and size of the chunks a streamed export is sent in
+EXPORT_BATCH_ROWS = int(os.environ.get("EXPORT_BATCH_ROWS", "1000"))
+EXPORT_CHUNK_BYTES = int(os.environ.get("EXPORT_CHUNK_BYTES", str(64 * 1024)))
+# PDF cells longer than this are cut before wrapping (bounds the layout work);
+# cells still taller than a page are trimmed further by _PdfLayout.cell
+PDF_CELL_MAX_CHARS = int(os.environ.get("PDF_CELL_MAX_CHARS", "1000"))
+PDF_PARAGRAPH_CACHE_SIZE = 512
+PDF_TITLE = "SmartTask - Export Tasks"
+
+
+def _export_filter(user_id: int, completed: Optional[bool]) -> list:
+    criteria = [TaskModel.user_id == user_id]
+    if completed is not None:
+        criteria.append(TaskModel.completed.is_(completed))
+    return criteria
+
+
+def export_select(user_id: int, completed: Optional[bool] = None) -> Select:
+    """The exported columns of a user's tasks, in id order.
+
+    Served by ix_tasks_user_id_id, or ix_tasks_user_completed_id when
+    filtered on completion.
+    """
+    return (
+        select(
+            TaskModel.id,
+            TaskModel.title,
+            TaskModel.description,
+            TaskModel.deadline,
+            TaskModel.priority,
+            TaskModel.completed,
+        )
+        .where(*_export_filter(user_id, completed))
+        .order_by(TaskModel.id)
+    )
+
+
+def iter_export_rows(bind: Engine, user_id: int, completed: Optional[bool] = None) -> Iterator[Row]:
+    """Stream export rows `EXPORT_BATCH_ROWS` at a time on a session of its own.
+
+    Export responses are produced after the request's session has been
+    closed, so they cannot borrow it. `yield_per` uses a server-side cursor
+    where the driver has one (psycopg) and fetches in batches elsewhere.
+    """
+    with Session(bind) as db:
+        result = db.execute(export_select(user_id, completed).execution_options(yield_per=EXPORT_BATCH_ROWS))
+        yield from result
+
+
+def iter_csv(rows: Iterable[Row]) -> Iterator[bytes]:
+    """Encode rows as CSV, yielding chunks of about `EXPORT_CHUNK_BYTES`."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADERS)
+    for task in rows:
+        writer.writerow([
+            task.id,
+            task.title,
+            task.description or '',
+            task.deadline.strftime('%Y-%m-%d %H:%M:%S') if task.deadline else '',
+            task.priority,
+            'Yes' if task.completed else 'No'
+        ])
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def export_column_widths(db: Session, user_id: int, completed: Optional[bool] = None) -> List[int]:
+    """Excel column widths: longest value per column (header included) + 2, at most 50.
+
+    Computed in SQL, in one aggregate over the rows being exported: a
+    write-only sheet writes its column definitions before the first row.
+    """
+    lengths = db.execute(
+        select(
+            func.max(TaskModel.id),
+            func.max(func.length(TaskModel.title)),
+            func.max(func.length(func.coalesce(TaskModel.description, ''))),
+            func.count(TaskModel.deadline),
+            func.max(func.length(TaskModel.priority)),
+        ).where(*_export_filter(user_id, completed))
+    ).one()
+    max_id, title, description, deadlines, priority = lengths
+    values = [
+        len(str(max_id)) if max_id is not None else 0,
+        title or 0,
+        description or 0,
+        len('YYYY-mm-dd HH:MM:SS') if deadlines else 0,
+        priority or 0,
+        len('Yes'),
+    ]
+    return [min(max(len(header), value) + 2, 50) for header, value in zip(EXPORT_HEADERS, values)]
+
+
+def iter_excel(bind: Engine, user_id: int, completed: Optional[bool] = None) -> Iterator[bytes]:
+    """Build the .xlsx in write-only mode, spooled to a temp file, and stream it.
+
+    Rows are appended as they are fetched (`EXPORT_BATCH_ROWS` at a time)
+    and written straight to disk by openpyxl, so memory does not grow with
+    the number of tasks.
+    """
+    # pylint: disable=import-outside-toplevel
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment
+    from openpyxl.utils import get_column_letter
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Tasks")
+
+    # Style for header
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_alignment = Alignment(horizontal="center", vertical="center")
+
+    with tempfile.TemporaryFile() as output:
+        with Session(bind) as db:
+            for col, width in enumerate(export_column_widths(db, user_id, completed), 1):
+                ws.column_dimensions[get_column_letter(col)].width = width
+
+            header = []
+            for value in EXPORT_HEADERS:
+                cell = WriteOnlyCell(ws, value=value)
+                cell.font = header_font
+                cell.fill = header_fill
+                cell.alignment = header_alignment
+                header.append(cell)
+            ws.append(header)
+
+            rows = db.execute(export_select(user_id, completed).execution_options(yield_per=EXPORT_BATCH_ROWS))
+            for task in rows:
+                ws.append([
+                    task.id,
+                    task.title,
+                    task.description or '',
+                    task.deadline.strftime('%Y-%m-%d %H:%M:%S') if task.deadline else '',
+                    task.priority,
+                    'Yes' if task.completed else 'No',
+                ])
+        wb.save(output)
+
+        output.seek(0)
+        while chunk := output.read(EXPORT_CHUNK_BYTES):
+            yield chunk
+
+
+class _PdfLayout:
+    """Page geometry, column widths and styles of the PDF export.
+
+    Built once per process (see `_pdf_layout`): the fixed column widths mean
+    reportlab never has to measure the whole table, and row heights can be
+    worked out row by row to cut the table into page-sized chunks.
+    """
+
+    def __init__(self):
+        # pylint: disable=import-outside-toplevel
+        from reportlab.lib import colors
+        from reportlab.lib.enums import TA_CENTER
+        from reportlab.lib.pagesizes import landscape, letter
+        from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+        from reportlab.platypus import Paragraph, Table, TableStyle
+
+        class CachedParagraph(Paragraph):
+            """Keeps its line breaks: a table wraps each cell to measure it and again to draw it."""
+
+            _wrapped = None
+
+            def wrap(self, availWidth, availHeight):
+                if self._wrapped is None or self._wrapped[0] != availWidth:
+                    self._wrapped = (availWidth, super().wrap(availWidth, availHeight))
+                return self._wrapped[1]
+
+        self.paragraph = CachedParagraph
+        self.pagesize = landscape(letter)
+        self.margin = 72  # one inch, as platypus document templates use
+        # Frame padding is 6pt on every side
+        self.width = self.pagesize[0] - 2 * self.margin - 12
+        self.height = self.pagesize[1] - 2 * self.margin - 12
+
+        styles = getSampleStyleSheet()
+        self.title_style = styles['Title']
+        title_height = Paragraph(PDF_TITLE, self.title_style).wrap(self.width, self.height)[1]
+        self.title_height = title_height + self.title_style.spaceAfter + 12
+        self.cell_style = ParagraphStyle('TaskCell', parent=styles['Normal'], alignment=TA_CENTER)
+        self.table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 14),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ])
+
+        # Fixed columns fit the header or their widest value; title and
+        # description share what is left, and wrap.
+        def fit(header, widest):
+            return max(stringWidth(header, 'Helvetica-Bold', 14), stringWidth(widest, 'Helvetica', 10)) + 12
+
+        fixed = {0: fit('ID', '0000000'), 3: fit('Deadline', '0000-00-00 00:00'),
+                 4: fit('Priority', 'Medium'), 5: fit('Completed', 'Yes')}
+        free = self.width - sum(fixed.values())
+        self.col_widths = [fixed[0], free * 0.4, free * 0.6, fixed[3], fixed[4], fixed[5]]
+        self.text_widths = [w - 12 for w in self.col_widths]
+        self.string_width = stringWidth
+
+        def measure(data):
+            table = Table(data, colWidths=self.col_widths)
+            table.setStyle(self.table_style)
+            return table.wrap(self.width, self.height)[1]
+
+        self.header_height = measure([EXPORT_HEADERS])
+        self.row_height = measure([EXPORT_HEADERS, ['0'] * len(EXPORT_HEADERS)]) - self.header_height
+        self.padding = 6  # top + bottom padding of a body cell
+        # Tallest wrapped cell that still fits a page under the header, grid lines included
+        self.max_cell_height = self.height - self.header_height - self.padding - 4
+
+    def cell(self, text: str, col: int) -> Tuple[object, float]:
+        """`text` as a wrapped Paragraph and its height, cut short to fit one page.
+
+        Rows cannot be split across pages, so an overlong cell is trimmed to
+        the longest prefix whose wrapped height fits (found by bisection;
+        wrapped height grows with the prefix).
+        """
+        def build(value):
+            paragraph = self.paragraph(escape(value).replace('\n', '<br/>'), self.cell_style)
+            return paragraph, paragraph.wrap(self.text_widths[col], self.height)[1]
+
+        built = build(text)
+        if built[1] <= self.max_cell_height:
+            return built
+        fitted = build('\u2026')
+        low, high = 0, len(text) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            candidate = build(text[:middle].rstrip() + '\u2026')
+            if candidate[1] <= self.max_cell_height:
+                fitted, low = candidate, middle
+            else:
+                high = middle - 1
+        return fitted
+
+
+@lru_cache(maxsize=1)
+def _pdf_layout() -> _PdfLayout:
+    return _PdfLayout()
+
+
+def _pdf_rows(layout: _PdfLayout, rows: Iterable[Row]) -> Iterator[Tuple[list, float]]:
+    """PDF table rows with their heights; long text becomes wrapped Paragraphs.
+
+    Paragraphs are cached by text for the export, so repeated titles and
+    descriptions are built and measured once.
+    """
+    paragraphs: Dict[Tuple[int, str], Tuple[object, float]] = {}
+    for i, task in enumerate(rows, start=1):
+        cells = [
+            str(i),
+            task.title,
+            task.description or '',
+            task.deadline.strftime('%Y-%m-%d %H:%M') if task.deadline else '',
+            task.priority,
+            'Yes' if task.completed else 'No'
+        ]
+        height = layout.row_height
+        for col in (1, 2):
+            text = cells[col]
+            if '\n' not in text and layout.string_width(text, 'Helvetica', 10) <= layout.text_widths[col]:
+                continue
+            key = (col, text)
+            if key not in paragraphs:
+                if len(paragraphs) >= PDF_PARAGRAPH_CACHE_SIZE:
+                    paragraphs.clear()
+                if len(text) > PDF_CELL_MAX_CHARS:
+                    text = text[:PDF_CELL_MAX_CHARS] + '\u2026'
+                paragraphs[key] = layout.cell(text, col)
+            cells[col], cell_height = paragraphs[key]
+            height = max(height, cell_height + layout.padding)
+        yield cells, height
+
+
+def _pdf_pages(layout: _PdfLayout, rows: Iterable[Row]) -> Iterator[list]:
+    """Flowables of the PDF export, one page at a time: a page-sized table
+    (the first one under the title)."""
+    # pylint: disable=import-outside-toplevel
+    from reportlab.platypus import Paragraph, Spacer, Table
+
+    def page_table(data):
+        table = Table(data, colWidths=layout.col_widths, repeatRows=1)
+        table.setStyle(layout.table_style)
+        return table
+
+    page = [Paragraph(PDF_TITLE, layout.title_style), Spacer(1, 12)]
+    available = layout.height - layout.title_height - layout.header_height
+    data = [list(EXPORT_HEADERS)]
+    for cells, height in _pdf_rows(layout, rows):
+        # Slack for the grid lines; a row that still does not fit is split
+        # onto the next page by _draw_pdf, header repeated
+        if height > available - 2 and len(data) > 1:
+            yield page + [page_table(data)]
+            page, data = [], [list(EXPORT_HEADERS)]
+            available = layout.height - layout.header_height
+        data.append(cells)
+        available -= height
+    yield page + [page_table(data)]
+
+
+def _draw_pdf(canvas, layout: _PdfLayout, pages: Iterable[list]) -> int:
+    """Draw each page's flowables on a new page of `canvas`; returns the page count.
+
+    Pages are pulled from `pages` one at a time, so only the page being drawn
+    is held in memory. A flowable that does not fit is split onto further
+    pages, as a document template would.
+    """
+    # pylint: disable=import-outside-toplevel
+    from reportlab.platypus import Frame
+    from reportlab.platypus.doctemplate import LayoutError
+
+    count = 0
+    for flowables in pages:
+        pending = list(flowables)
+        while pending:
+            frame = Frame(layout.margin, layout.margin, layout.width + 12, layout.height + 12)
+            placed = False
+            while pending:
+                if frame.add(pending[0], canvas, trySplit=1):
+                    pending.pop(0)
+                    placed = True
+                    continue
+                parts = frame.split(pending[0], canvas)
+                if not parts:
+                    if not placed:
+                        raise LayoutError(f"{pending[0]!r} does not fit on an empty page")
+                    break
+                pending[0:1] = parts
+                if not frame.add(pending.pop(0), canvas, trySplit=1):
+                    raise LayoutError(f"Split part of {parts[0]!r} does not fit")
+                placed = True
+                break
+            canvas.showPage()
+            count += 1
+    return count
+
+
+def iter_pdf(bind: Engine, user_id: int, completed: Optional[bool] = None) -> Iterator[bytes]:
+    """Draw the PDF one page-sized table at a time, spooled to a temp file, and stream it.
+
+    Rows are packed into page-sized tables, each with the header row, and
+    each table is drawn straight onto its page, so reportlab only ever lays
+    out one page of rows at a time and build time grows linearly with the
+    number of tasks.
+    """
+    # pylint: disable=import-outside-toplevel
+    from reportlab.pdfgen.canvas import Canvas
+
+    layout = _pdf_layout()
+    with tempfile.TemporaryFile() as output:
+        with Session(bind) as db:
+            rows = db.execute(export_select(user_id, completed).execution_options(yield_per=EXPORT_BATCH_ROWS))
+            canvas = Canvas(output, pagesize=layout.pagesize)
+            _draw_pdf(canvas, layout, _pdf_pages(layout, rows))
+            canvas.save()
+        output.seek(0)
+        while chunk := output.read(EXPORT_CHUNK_BYTES):
+            yield chunk
+
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "excel": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "pdf": ("application/pdf", "pdf"),
+}
+
+
+def iter_export(fmt: str, bind: Engine, user_id: int, completed: Optional[bool] = None) -> Iterator[bytes]:
+    """The bytes of a user's export in `fmt` (a key of EXPORT_FORMATS)."""
+    if fmt == "csv":
+        return iter_csv(iter_export_rows(bind, user_id, completed))
+    if fmt == "excel":
+        return iter_excel(bind, user_id, completed)
+    if fmt == "pdf":
+        return iter_pdf(bind, user_id, completed)
+    raise ValueError(f"Unknown export format {fmt!r}")
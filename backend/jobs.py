@@ -0,0 +1,277 @@
+"""Background jobs run inside the API process.
+
+The maintenance jobs (tombstone compaction, task_stats reconciliation,
+export cleanup) and the Google token renewal work on every user's rows, so
+they must not run in every API worker: enable them in one designated worker
+(MAINTENANCE_JOBS_ENABLED, GOOGLE_TOKEN_RENEWAL_ENABLED) or run them from
+cron instead:
+
+    python -m jobs [compact-tombstones] [reconcile-stats] [purge-exports] [renew-google-tokens]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, select
+
+import crud
+import export_jobs
+from auth import is_valid_refresh_token, refresh_google_tokens_for_user
+from database.database import SessionLocal
+from models import User
+
+
+logger = logging.getLogger(__name__)
+
+# Off by default: turn on in exactly one API worker, or use the CLI above
+MAINTENANCE_JOBS_ENABLED = os.environ.get("MAINTENANCE_JOBS_ENABLED", "false").lower() in {"1", "true", "yes"}
+# Off by default, like the maintenance jobs: SingleFlight only collapses
+# refreshes within one process, so renewers in several workers would refresh
+# the same users in parallel and overwrite each other's tokens.
+GOOGLE_TOKEN_RENEWAL_ENABLED = os.environ.get("GOOGLE_TOKEN_RENEWAL_ENABLED", "false").lower() in {"1", "true", "yes"}
+GOOGLE_TOKEN_RENEWAL_INTERVAL_SECONDS = float(os.environ.get("GOOGLE_TOKEN_RENEWAL_INTERVAL_SECONDS", "60"))
+# Renew tokens expiring within this window; keep it wider than the interval
+GOOGLE_TOKEN_RENEWAL_WINDOW_SECONDS = int(os.environ.get("GOOGLE_TOKEN_RENEWAL_WINDOW_SECONDS", "900"))
+GOOGLE_TOKEN_RENEWAL_BATCH_SIZE = int(os.environ.get("GOOGLE_TOKEN_RENEWAL_BATCH_SIZE", "100"))
+GOOGLE_TOKEN_RENEWAL_CONCURRENCY = int(os.environ.get("GOOGLE_TOKEN_RENEWAL_CONCURRENCY", "4"))
+# After a failed refresh (e.g. revoked grant) leave the user alone for a while
+GOOGLE_TOKEN_RENEWAL_RETRY_SECONDS = float(os.environ.get("GOOGLE_TOKEN_RENEWAL_RETRY_SECONDS", "900"))
+
+# Tombstones let GET /tasks/changes report deletions; clients that have not
+# synced within the retention window get a reset and reload the full list.
+TASK_TOMBSTONE_RETENTION_SECONDS = float(os.environ.get("TASK_TOMBSTONE_RETENTION_SECONDS", str(30 * 24 * 3600)))
+TASK_TOMBSTONE_COMPACTION_INTERVAL_SECONDS = float(os.environ.get("TASK_TOMBSTONE_COMPACTION_INTERVAL_SECONDS", "3600"))
+
+# The task_stats counters are updated by every mutation; this job only
+# corrects drift (e.g. rows changed outside the API).
+TASK_STATS_RECONCILE_INTERVAL_SECONDS = float(os.environ.get("TASK_STATS_RECONCILE_INTERVAL_SECONDS", "3600"))
+TASK_STATS_RECONCILE_BATCH_SIZE = int(os.environ.get("TASK_STATS_RECONCILE_BATCH_SIZE", "200"))
+
+# Expired export jobs (see export_jobs.py) and their files are removed this often
+EXPORT_CLEANUP_INTERVAL_SECONDS = float(os.environ.get("EXPORT_CLEANUP_INTERVAL_SECONDS", "300"))
+
+
+class PeriodicJob:
+    """Run `fn` every `interval` seconds on a daemon thread.
+
+    The first run is one interval after `start`, so a worker's boot is not
+    slowed by it and workers restarted together do not all run it at once.
+    """
+
+    def __init__(self, name: str, interval: float, fn: Callable[[], object]):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.fn()
+            except Exception:
+                logger.exception("Background job %s failed", self.name)
+
+
+class GoogleTokenRenewer:
+    """Refresh Google access tokens shortly before they expire.
+
+    Users are selected through the index on users.google_token_expiry, a batch
+    at a time, and refreshed with bounded concurrency. Each refresh goes through
+    refresh_google_tokens_for_user, so it shares the per-user single-flight
+    with request-time refreshes and persists via save_google_tokens_for_user.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        window_seconds: int = GOOGLE_TOKEN_RENEWAL_WINDOW_SECONDS,
+        batch_size: int = GOOGLE_TOKEN_RENEWAL_BATCH_SIZE,
+        concurrency: int = GOOGLE_TOKEN_RENEWAL_CONCURRENCY,
+        retry_seconds: float = GOOGLE_TOKEN_RENEWAL_RETRY_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.window_seconds = window_seconds
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.retry_seconds = retry_seconds
+        self._retry_after: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def run_once(self) -> Dict[str, int]:
+        """Renew every token expiring inside the window. Returns per-outcome counts."""
+        counts = {"renewed": 0, "failed": 0, "skipped": 0}
+        horizon = datetime.utcnow() + timedelta(seconds=self.window_seconds)
+        cursor = None
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="google-renewal") as pool:
+            while True:
+                batch = self._next_batch(horizon, cursor)
+                if not batch:
+                    break
+                for outcome in pool.map(self._renew_user, [user_id for user_id, _ in batch]):
+                    counts[outcome] += 1
+                last_id, last_expiry = batch[-1]
+                cursor = (last_expiry, last_id)
+                if len(batch) < self.batch_size:
+                    break
+        if counts["renewed"] or counts["failed"]:
+            logger.info("Google token renewal: %s", counts)
+        return counts
+
+    def _next_batch(self, horizon: datetime, cursor):
+        stmt = (
+            select(User.id, User.google_token_expiry)
+            .where(
+                User.google_token_expiry.is_not(None),
+                User.google_token_expiry <= horizon,
+                User.google_refresh_token.is_not(None),
+            )
+            .order_by(User.google_token_expiry, User.id)
+            .limit(self.batch_size)
+        )
+        if cursor is not None:
+            last_expiry, last_id = cursor
+            stmt = stmt.where(
+                or_(
+                    User.google_token_expiry > last_expiry,
+                    and_(User.google_token_expiry == last_expiry, User.id > last_id),
+                )
+            )
+        db = self.session_factory()
+        try:
+            return db.execute(stmt).all()
+        finally:
+            db.close()
+
+    def _renew_user(self, user_id: int) -> str:
+        now = time.monotonic()
+        with self._lock:
+            if self._retry_after.get(user_id, 0) > now:
+                return "skipped"
+
+        db = self.session_factory()
+        try:
+            user = db.get(User, user_id)
+            if user is None or not is_valid_refresh_token(user.google_refresh_token):
+                return "skipped"
+            refresh_google_tokens_for_user(db, user, skew_seconds=self.window_seconds)
+        except HTTPException as exc:
+            logger.warning("Could not renew Google token for user %s: %s", user_id, exc.detail)
+            with self._lock:
+                self._retry_after[user_id] = now + self.retry_seconds
+            return "failed"
+        finally:
+            db.close()
+
+        with self._lock:
+            self._retry_after.pop(user_id, None)
+        return "renewed"
+
+
+def renew_google_tokens(session_factory=SessionLocal) -> Dict[str, int]:
+    return GoogleTokenRenewer(session_factory).run_once()
+
+
+def google_token_renewal_job(renewer: Optional[GoogleTokenRenewer] = None) -> PeriodicJob:
+    renewer = renewer or GoogleTokenRenewer()
+    return PeriodicJob("google-token-renewal", GOOGLE_TOKEN_RENEWAL_INTERVAL_SECONDS, renewer.run_once)
+
+
+def compact_task_tombstones(session_factory=SessionLocal, retention_seconds: float = TASK_TOMBSTONE_RETENTION_SECONDS) -> int:
+    db = session_factory()
+    try:
+        return crud.compact_tombstones(db, datetime.utcnow() - timedelta(seconds=retention_seconds))
+    finally:
+        db.close()
+
+
+def tombstone_compaction_job() -> PeriodicJob:
+    return PeriodicJob("task-tombstone-compaction", TASK_TOMBSTONE_COMPACTION_INTERVAL_SECONDS, compact_task_tombstones)
+
+
+def reconcile_task_stats(session_factory=SessionLocal, batch_size: int = TASK_STATS_RECONCILE_BATCH_SIZE) -> int:
+    """Recompute every user's task_stats, a batch of users per transaction."""
+    corrected = 0
+    last_id = 0
+    while True:
+        db = session_factory()
+        try:
+            user_ids = db.execute(
+                select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+            ).scalars().all()
+            if not user_ids:
+                break
+            corrected += crud.reconcile_task_stats(db, user_ids)
+        finally:
+            db.close()
+        last_id = user_ids[-1]
+    if corrected:
+        logger.warning("Corrected %d drifted task_stats counters", corrected)
+    return corrected
+
+
+def task_stats_reconcile_job() -> PeriodicJob:
+    return PeriodicJob("task-stats-reconcile", TASK_STATS_RECONCILE_INTERVAL_SECONDS, reconcile_task_stats)
+
+
+def purge_export_jobs(session_factory=SessionLocal) -> int:
+    db = session_factory()
+    try:
+        return export_jobs.purge_expired(db)
+    finally:
+        db.close()
+
+
+def export_cleanup_job() -> PeriodicJob:
+    return PeriodicJob("export-cleanup", EXPORT_CLEANUP_INTERVAL_SECONDS, purge_export_jobs)
+
+
+def maintenance_jobs() -> List[PeriodicJob]:
+    return [tombstone_compaction_job(), task_stats_reconcile_job(), export_cleanup_job()]
+
+
+MAINTENANCE_TASKS: Dict[str, Callable[[], object]] = {
+    "compact-tombstones": compact_task_tombstones,
+    "reconcile-stats": reconcile_task_stats,
+    "purge-exports": purge_export_jobs,
+    "renew-google-tokens": renew_google_tokens,
+}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run SmartTask maintenance jobs once")
+    parser.add_argument("tasks", nargs="*", metavar="task",
+                        help=f"one of {', '.join(MAINTENANCE_TASKS)} (default: all)")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.tasks if name not in MAINTENANCE_TASKS]
+    if unknown:
+        parser.error(f"unknown task {unknown[0]!r}")
+    for name in args.tasks or MAINTENANCE_TASKS:
+        print(f"{name}: {MAINTENANCE_TASKS[name]()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
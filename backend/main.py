@@ -1,39 +1,49 @@
 """Main application file for the SmartTask backend."""
 
+from contextlib import asynccontextmanager
 from typing import List, Optional
-import csv
-import io
+import threading
 from datetime import datetime, timedelta
-from auth import refresh_access_token_with_refresh_token, save_google_tokens_for_user
-from jose import JWTError, jwt
+from jose import jwt
 
-from fastapi import Depends, FastAPI, HTTPException, status, Body,Request
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, RedirectResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, RedirectResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy import case, desc, text, inspect
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-import requests
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
 
 from auth import (
     create_access_token,
     get_current_user,
     get_db,
-    get_password_hash,
-    verify_password,
-    verify_google_id_token_and_get_email, 
-    refresh_access_token_with_refresh_token, 
-    save_google_tokens_for_user,
-    exchange_code_for_tokens
+    get_password_hash_async,
+    verify_and_update_password_async,
+    verify_google_id_token_and_get_email,
+    invalidate_user_cache,
+    prewarm_google_certs,
+    refresh_google_tokens_for_user,
+    get_google_access_token,
+    GOOGLE_CERTS_PREWARM,
+    GOOGLE_CLIENT_SECRET,
+)
+import crud
+import events
+import search
+import exports
+import export_cache
+import export_jobs
+from database.database import engine, USE_ASYNC_DB
+from database.migrations import ensure_schema
+from jobs import (
+    GOOGLE_TOKEN_RENEWAL_ENABLED,
+    MAINTENANCE_JOBS_ENABLED,
+    google_token_renewal_job,
+    maintenance_jobs,
 )
-from database.database import Base, engine
 from models import Task as TaskModel, User
+from reminders import REMINDERS_ENABLED, ReminderScheduler
 from schemas.schemas import (
     TaskCreate,
     TaskRead,
@@ -43,97 +53,87 @@ from schemas.schemas import (
     TaskCompletedUpdate,
     GoogleSaveToken,
     CalendarEventCreate,
+    TaskBatchRequest,
+    TaskBatchResponse,
+    TaskChanges,
+    TaskSearchHit,
+    TaskStats,
+    ExportJobCreate,
+    ExportJobRead,
 )
 from pydantic import BaseModel
 
-app = FastAPI()
 
-# Configura CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:5173", "http://localhost:3000"],  # Frontend dev origins
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Schema: one version check per worker. Deploys run
+    # `python -m database.migrations upgrade` before starting workers.
+    ensure_schema(engine)
+    if GOOGLE_CERTS_PREWARM:
+        # Off the startup path: a slow certs endpoint must not delay readiness
+        threading.Thread(target=prewarm_google_certs, name="google-certs-prewarm", daemon=True).start()
+    # Maintenance and token renewal touch every user's rows: one designated
+    # worker (or cron) runs them
+    background_jobs = maintenance_jobs() if MAINTENANCE_JOBS_ENABLED else []
+    if GOOGLE_TOKEN_RENEWAL_ENABLED and GOOGLE_CLIENT_SECRET:
+        background_jobs.append(google_token_renewal_job())
+    if REMINDERS_ENABLED:
+        background_jobs.append(ReminderScheduler())
+    for job in background_jobs:
+        job.start()
+    try:
+        yield
+    finally:
+        for job in background_jobs:
+            job.stop()
+        export_jobs.shutdown()
 
-# Crea tabelle
-Base.metadata.create_all(bind=engine)
 
-# Lightweight migration: ensure new columns exist in SQLite when upgrading
-try:
-    inspector = inspect(engine)
-    # tasks table: add completed (already present in your file), add google_event_id if missing
-    try:
-        task_columns = [c["name"] for c in inspector.get_columns("tasks")]
-        with engine.connect() as conn:
-            if "completed" not in task_columns:
-                conn.execute(text("ALTER TABLE tasks ADD COLUMN completed BOOLEAN DEFAULT 0"))
-                conn.commit()
-            if "google_event_id" not in task_columns:
-                conn.execute(text("ALTER TABLE tasks ADD COLUMN google_event_id TEXT"))
-                conn.commit()
-            if "all_day" not in task_columns:
-                # default 0 (False)
-                conn.execute(text("ALTER TABLE tasks ADD COLUMN all_day BOOLEAN DEFAULT 0"))
-                conn.commit()
-            # Add location columns if missing
-            if "address" not in task_columns:
-                conn.execute(text("ALTER TABLE tasks ADD COLUMN address TEXT"))
-                conn.commit()
-            if "latitude" not in task_columns:
-                conn.execute(text("ALTER TABLE tasks ADD COLUMN latitude FLOAT"))
-                conn.commit()
-            if "longitude" not in task_columns:
-                conn.execute(text("ALTER TABLE tasks ADD COLUMN longitude FLOAT"))
-                conn.commit()
-    except Exception:
-        pass
-
-    # users table: add google token fields if missing
-    try:
-        user_columns = [c["name"] for c in inspector.get_columns("users")]
-        with engine.connect() as conn:
-            if "google_access_token" not in user_columns:
-                conn.execute(text("ALTER TABLE users ADD COLUMN google_access_token TEXT"))
-                conn.commit()
-            if "google_refresh_token" not in user_columns:
-                conn.execute(text("ALTER TABLE users ADD COLUMN google_refresh_token TEXT"))
-                conn.commit()
-            if "google_token_expiry" not in user_columns:
-                conn.execute(text("ALTER TABLE users ADD COLUMN google_token_expiry DATETIME"))
-                conn.commit()
-    except Exception:
-        pass
-except Exception:
-    # Best-effort; avoid crashing the app if introspection fails
-    pass
-
-
-@app.post("/register", response_model=UserRead)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+router = APIRouter()
+
+
+def _find_user_by_email(db: Session, email: str) -> Optional[User]:
+    return db.query(User).filter(User.email == email).first()
+
+
+def _save_user(db: Session, user: User) -> User:
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+# /register and /login are async so bcrypt runs on the password executor
+# (see auth.py) instead of pinning a request worker thread.
+@router.post("/register", response_model=UserRead)
+async def register(user: UserCreate, db: Session = Depends(get_db)):
     """Registers a new user."""
-    db_user = db.query(User).filter(User.email == user.email).first()
+    db_user = await run_in_threadpool(_find_user_by_email, db, user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     db_user = User(email=user.email, hashed_password=hashed_password)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    return await run_in_threadpool(_save_user, db, db_user)
 
 
-@app.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+@router.post("/login", response_model=Token)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     """Authenticates a user and returns an access token."""
-    user = db.query(User).filter(User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    user = await run_in_threadpool(_find_user_by_email, db, form_data.username)
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await verify_and_update_password_async(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Stored hash was made with a different bcrypt cost; upgrade it transparently
+        user.hashed_password = new_hash
+        await run_in_threadpool(_save_user, db, user)
+        invalidate_user_cache(user)
     access_token = create_access_token(data={"sub": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -142,7 +142,7 @@ class GoogleAuthPayload(BaseModel):
     credential: str
 
 
-@app.post("/auth/google", response_model=Token)
+@router.post("/auth/google", response_model=Token)
 def google_auth(payload: GoogleAuthPayload, db: Session = Depends(get_db)):
     """Login/Register via Google ID token. Creates user if not exists, then issues JWT."""
     email = verify_google_id_token_and_get_email(payload.credential)
@@ -158,7 +158,7 @@ def google_auth(payload: GoogleAuthPayload, db: Session = Depends(get_db)):
     return {"access_token": access_token, "token_type": "bearer"}
 
 
-@app.get("/me")
+@router.get("/me")
 def get_me(current_user: User = Depends(get_current_user)):
     """
     Return minimal user info for frontend usage.
@@ -172,7 +172,7 @@ def get_me(current_user: User = Depends(get_current_user)):
         "google_connected": bool(current_user.google_access_token),
     }
 
-@app.get("/auth/google-calendar/connect")
+@router.get("/auth/google-calendar/connect")
 def google_calendar_connect():
     """Generate Google OAuth URL for calendar connection."""
     from urllib.parse import urlencode
@@ -199,7 +199,7 @@ def google_calendar_connect():
         "redirect_uri": redirect_uri
     }
 
-@app.get("/auth/google-calendar/callback")
+@router.get("/auth/google-calendar/callback")
 def google_calendar_callback(
     code: str,
     state: Optional[str] = None,
@@ -242,7 +242,7 @@ def google_calendar_callback(
     return RedirectResponse(url="http://localhost:5173/") 
 
 
-@app.post("/google-auth")
+@router.post("/google-auth")
 def save_google_token(
     payload: GoogleSaveToken,
     db: Session = Depends(get_db),
@@ -269,10 +269,11 @@ def save_google_token(
     db.add(current_user)
     db.commit()
     db.refresh(current_user)
+    invalidate_user_cache(current_user)
     return {"detail": "google token saved"}
 
 
-@app.get("/google-auth/status")
+@router.get("/google-auth/status")
 def get_google_auth_status(current_user: User = Depends(get_current_user)):
     """Get the current Google authentication status for the user."""
     from auth import is_valid_refresh_token
@@ -304,7 +305,7 @@ def get_google_auth_status(current_user: User = Depends(get_current_user)):
     return status
 
 
-@app.post("/google-auth/refresh")
+@router.post("/google-auth/refresh")
 def manually_refresh_google_token(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
@@ -314,12 +315,12 @@ def manually_refresh_google_token(
         raise HTTPException(status_code=400, detail="No refresh token available. Please reconnect your Google account.")
     
     try:
-        refreshed = refresh_access_token_with_refresh_token(current_user.google_refresh_token)
-        new_access = refreshed.get("access_token")
-        expires_in = refreshed.get("expires_in", 3600)
-        
-        save_google_tokens_for_user(db, current_user, new_access, expires_in=expires_in)
-        
+        refresh_google_tokens_for_user(db, current_user, force=True)
+        db.refresh(current_user)
+        expires_in = None
+        if current_user.google_token_expiry:
+            expires_in = max(int((current_user.google_token_expiry - datetime.utcnow()).total_seconds()), 0)
+
         return {
             "detail": "Token refreshed successfully",
             "expires_in": expires_in,
@@ -331,14 +332,15 @@ def manually_refresh_google_token(
         raise HTTPException(status_code=500, detail=f"Unexpected error during token refresh: {str(e)}")
 
 
-@app.post("/google-calendar/events")
+@router.post("/google-calendar/events")
 def create_google_event(
     event: CalendarEventCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Crea o aggiorna un evento nel calendario Google dell'utente."""
-    token_to_use = current_user.google_access_token
+    # Refreshes up front when the token is inside the skew window
+    token_to_use = get_google_access_token(db, current_user)
     if not token_to_use:
         raise HTTPException(status_code=400, detail="Google account non collegato")
 
@@ -374,6 +376,9 @@ def create_google_event(
             raise HTTPException(status_code=404, detail="Task not found or not authorized")
         event_id = task.google_event_id
 
+    # Imported on first use (Google Calendar calls) to keep startup fast
+    import requests  # pylint: disable=import-outside-toplevel
+
     if event_id:
         # Update existing event (PATCH for partial update)
         url = f"https://www.googleapis.com/calendar/v3/calendars/primary/events/{event_id}"
@@ -385,10 +390,7 @@ def create_google_event(
 
     if resp.status_code == 401 and current_user.google_refresh_token:
         try:
-            refreshed = refresh_access_token_with_refresh_token(current_user.google_refresh_token)
-            new_access = refreshed.get("access_token")
-            expires_in = refreshed.get("expires_in", 3600)
-            save_google_tokens_for_user(db, current_user, new_access, expires_in=expires_in)
+            new_access = refresh_google_tokens_for_user(db, current_user, stale_access_token=token_to_use)
 
             # Retry with new token
             headers["Authorization"] = f"Bearer {new_access}"
@@ -413,19 +415,22 @@ def create_google_event(
         # `all_day` or `deadline` fields. The frontend decides how tasks are
         # stored locally; Google events may be all-day (use `start.date`) but
         # we intentionally avoid mutating the SmartTask model here.
-        task.google_event_id = new_event_id
-        db.commit()
-        db.refresh(task)
+        crud.set_google_event_id(db, task, new_event_id)
 
     return event_data
 
 
 
-@app.get("/tasks", response_model=List[TaskRead])
+@router.get("/tasks", response_model=List[TaskRead])
 def get_tasks(
+    request: Request,
+    response: Response,
     sort_by: Optional[str] = None,
     sort_order: Optional[str] = "asc",
     completed: Optional[str] = None,  # values: 'true' | 'false' | None (all)
+    limit: Optional[int] = Query(None, ge=1, le=crud.TASKS_PAGE_MAX),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
@@ -434,68 +439,175 @@ def get_tasks(
     sort_by: 'insertion' | 'deadline' | 'priority' | None
     sort_order: 'asc' | 'desc'
     completed: 'true' | 'false' | None
+    limit, cursor: keyset pagination; the cursor for the next page is
+        returned in the X-Next-Cursor header (absent on the last page)
+    fields: comma-separated TaskRead fields; only those columns are loaded
+        and returned
+
+    The weak ETag comes from the user's data version, so a matching
+    If-None-Match gets a 304 before any task is read.
     """
-    query = db.query(TaskModel).filter(TaskModel.user_id == current_user.id)
-
-    # Filter by completion if requested
-    if completed is not None:
-        if completed.lower() == "true":
-            query = query.filter(TaskModel.completed.is_(True))
-        elif completed.lower() == "false":
-            query = query.filter(TaskModel.completed.is_(False))
-
-    # Sorting logic
-    if sort_by == "priority":
-        priority_order = case(
-            (TaskModel.priority == "High", 3),
-            (TaskModel.priority == "Medium", 2),
-            (TaskModel.priority == "Low", 1),
-            else_=0,
+    try:
+        result = crud.list_tasks_page(
+            db, current_user.id, request.headers.get("if-none-match"),
+            sort_by, sort_order, completed, limit, cursor, fields,
         )
-        query = query.order_by(priority_order.desc() if sort_order == "desc" else priority_order.asc())
-    elif sort_by == "deadline":
-        # Interpreting "desc" as: items with closer deadlines should come first.
-        query = query.order_by(TaskModel.deadline.asc() if sort_order == "desc" else TaskModel.deadline.desc())
-    else:
-        query = query.order_by(TaskModel.id.asc() if sort_order == "asc" else TaskModel.id.desc())
-
-    return query.all()
-
-
-@app.post("/tasks", response_model=TaskRead)
+    except (crud.InvalidFields, crud.InvalidCursor) as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    headers = crud.cache_headers(result.etag)
+    if result.rows is None:
+        return Response(status_code=304, headers=headers)
+    if result.next_cursor:
+        headers["X-Next-Cursor"] = result.next_cursor
+    if result.projected:
+        # Plain column rows: serialize directly instead of through TaskRead
+        return JSONResponse(result.rows, headers=headers)
+    response.headers.update(headers)
+    return result.rows
+
+
+@router.post("/tasks", response_model=TaskRead)
 def create_task(
     task: TaskCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Creates a new task for the current user."""
-    payload = task.model_dump()
-    # ensure all_day default
-    if 'all_day' not in payload or payload.get('all_day') is None:
-        payload['all_day'] = False
-    db_task = TaskModel(**payload, user_id=current_user.id)
-    db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
-    return db_task
+    return crud.create_task(db, current_user.id, task)
+
+
+@router.post("/tasks/batch", response_model=TaskBatchResponse)
+def batch_tasks(
+    batch: TaskBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Applies create/update/complete/delete operations in one transaction.
+
+    All or nothing: if any operation is invalid the batch is rejected with
+    422 and per-operation errors, and nothing is written.
+    """
+    applied, results = crud.apply_task_batch(db, current_user.id, batch.operations)
+    response = TaskBatchResponse(applied=applied, results=results)
+    if not applied:
+        return JSONResponse(status_code=422, content=jsonable_encoder(response))
+    return response
+
+
+@router.get("/tasks/search", response_model=List[TaskSearchHit])
+def search_tasks(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=search.SEARCH_PAGE_MAX),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Full-text search over title, description and address, best matches first.
+
+    The last word matches as a prefix. The cursor for the next page is
+    returned in the X-Next-Cursor header.
+    """
+    try:
+        hits, next_cursor = search.search_tasks(db, current_user.id, q, limit, cursor)
+    except crud.InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return hits
+
+
+@router.get("/tasks/stats", response_model=TaskStats)
+def get_task_stats(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Task counts by priority and completion, plus overdue open tasks.
+
+    Served from the task_stats counters kept up to date by every mutation.
+    """
+    return crud.task_stats(db, current_user.id)
+
+
+@router.get("/tasks/due", response_model=List[TaskRead])
+def get_due_tasks(
+    within: int = Query(3600, ge=1, le=crud.DUE_WITHIN_MAX_SECONDS),
+    include_overdue: bool = False,
+    limit: int = Query(50, ge=1, le=crud.DUE_PAGE_MAX),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Open tasks due within the next `within` seconds, earliest first.
+
+    All-day tasks count for their whole day; `include_overdue` adds tasks
+    whose deadline has already passed.
+    """
+    stmt = crud.due_tasks_select(current_user.id, timedelta(seconds=within), include_overdue, limit)
+    return db.execute(stmt).scalars().all()
+
+
+@router.get("/tasks/stream")
+async def stream_tasks(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Server-Sent Events: created/updated/deleted events for the user's tasks.
+
+    See events.sse_stream for the wire format.
+    """
+    subscription = events.bus.subscribe(current_user.id)
+    # Authentication is done; do not hold a DB connection for the whole stream
+    await run_in_threadpool(db.close)
+    return StreamingResponse(
+        events.sse_stream(subscription, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/tasks/changes", response_model=TaskChanges)
+def get_task_changes(
+    since: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Delta sync: tasks written and ids deleted after version `since`.
+
+    Start with since=0 (or after a reset) and pass the returned `version`
+    next time.
+    """
+    return crud.task_changes(db, current_user.id, since)
 
 
-@app.get("/tasks/{task_id}", response_model=TaskRead)
+def _get_owned_task(db: Session, user: User, task_id: int) -> TaskModel:
+    task = crud.get_task(db, user.id, task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found or not authorized")
+    return task
+
+
+@router.get("/tasks/{task_id}", response_model=TaskRead)
 def get_task(
     task_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Retrieves a specific task by ID for the current user."""
-    task = db.query(TaskModel).filter(
-        TaskModel.id == task_id, TaskModel.user_id == current_user.id
-    ).first()
+    """Retrieves a specific task by ID for the current user (ETag / If-None-Match aware)."""
+    etag, task, not_modified = crud.get_task_if_modified(
+        db, current_user.id, task_id, request.headers.get("if-none-match")
+    )
+    if not_modified:
+        return Response(status_code=304, headers=crud.cache_headers(etag))
     if not task:
         raise HTTPException(status_code=404, detail="Task not found or not authorized")
+    response.headers.update(crud.cache_headers(etag))
     return task
 
 
-@app.put("/tasks/{task_id}", response_model=TaskRead)
+@router.put("/tasks/{task_id}", response_model=TaskRead)
 def update_task(
     task_id: int,
     updated_task: TaskCreate,
@@ -503,22 +615,11 @@ def update_task(
     current_user: User = Depends(get_current_user),
 ):
     """Updates an existing task by ID for the current user."""
-    task = db.query(TaskModel).filter(
-        TaskModel.id == task_id, TaskModel.user_id == current_user.id
-    ).first()
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found or not authorized")
-    for key, value in updated_task.model_dump().items():
-        # preserve existing values if None provided
-        if value is None:
-            continue
-        setattr(task, key, value)
-    db.commit()
-    db.refresh(task)
-    return task
+    task = _get_owned_task(db, current_user, task_id)
+    return crud.update_task(db, task, updated_task)
 
 
-@app.patch("/tasks/{task_id}/completed", response_model=TaskRead)
+@router.patch("/tasks/{task_id}/completed", response_model=TaskRead)
 def set_task_completed(
     task_id: int,
     payload: TaskCompletedUpdate,
@@ -526,176 +627,162 @@ def set_task_completed(
     current_user: User = Depends(get_current_user),
 ):
     """Toggle or set task completion state for the current user's task."""
-    task = db.query(TaskModel).filter(
-        TaskModel.id == task_id, TaskModel.user_id == current_user.id
-    ).first()
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found or not authorized")
-    task.completed = payload.completed
-    db.commit()
-    db.refresh(task)
-    return task
+    task = _get_owned_task(db, current_user, task_id)
+    return crud.set_task_completed(db, task, payload.completed)
 
 
-@app.delete("/tasks/{task_id}")
+@router.delete("/tasks/{task_id}")
 def delete_task(
     task_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Deletes a task by ID for the current user."""
-    task = db.query(TaskModel).filter(
-        TaskModel.id == task_id, TaskModel.user_id == current_user.id
-    ).first()
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found or not authorized")
-    db.delete(task)
-    db.commit()
+    task = _get_owned_task(db, current_user, task_id)
+    crud.delete_task(db, task)
     return {"detail": "Task deleted"}
 
 
-@app.get("/tasks/export/csv")
+def _export_response(request: Request, db: Session, user: User, fmt: str, completed: Optional[str]) -> Response:
+    """Serves an export from the export cache, or renders it while filling the cache."""
+    completed_filter = crud.parse_completed_filter(completed)
+    data_version = db.execute(crud.data_version_select(user.id)).scalar_one()
+    key = export_cache.cache_key(user.id, fmt, completed_filter, data_version)
+    media_type, extension = exports.EXPORT_FORMATS[fmt]
+    headers = {'Content-Disposition': f'attachment; filename=tasks.{extension}'}
+
+    cached = export_cache.lookup(key)
+    if cached is None:
+        # The ETag (a digest of the bytes) is only known once rendered: sent from the next request on
+        bind = db.get_bind()
+
+        def still_current() -> bool:
+            # The rows are read by the render's own session, after the version above
+            with Session(bind) as check:
+                return check.execute(crud.data_version_select(user.id)).scalar_one() == data_version
+
+        chunks = exports.iter_export(fmt, bind, user.id, completed_filter)
+        return StreamingResponse(export_cache.tee(key, chunks, still_current), media_type=media_type, headers=headers)
+
+    headers.update(crud.cache_headers(cached.etag))
+    if crud.etag_matches(request.headers.get("if-none-match"), cached.etag):
+        cached.file.close()
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    headers['Content-Length'] = str(cached.size)
+    return StreamingResponse(
+        export_cache.read_chunks(cached, exports.EXPORT_CHUNK_BYTES), media_type=media_type, headers=headers
+    )
+
+
+@router.get("/tasks/export/csv")
 def export_tasks_csv(
+    request: Request,
+    completed: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Exports all tasks for the current user as CSV."""
-    tasks = db.query(TaskModel).filter(TaskModel.user_id == current_user.id).all()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow(['ID', 'Title', 'Description', 'Deadline', 'Priority', 'Completed'])
-    
-    # Write tasks
-    for task in tasks:
-        writer.writerow([
-            task.id,
-            task.title,
-            task.description or '',
-            task.deadline.strftime('%Y-%m-%d %H:%M:%S') if task.deadline else '',
-            task.priority,
-            'Yes' if task.completed else 'No'
-        ])
-    
-    output.seek(0)
-    
-    return StreamingResponse(
-        io.BytesIO(output.getvalue().encode('utf-8')),
-        media_type='text/csv',
-        headers={'Content-Disposition': 'attachment; filename=tasks.csv'}
-    )
+    return _export_response(request, db, current_user, "csv", completed)
 
 
-@app.get("/tasks/export/excel")
+@router.get("/tasks/export/excel")
 def export_tasks_excel(
+    request: Request,
+    completed: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Exports all tasks for the current user as Excel."""
-    tasks = db.query(TaskModel).filter(TaskModel.user_id == current_user.id).all()
-    
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Tasks"
-    
-    # Style for header
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    
-    # Write header
-    headers = ['ID', 'Title', 'Description', 'Deadline', 'Priority', 'Completed']
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-    
-    # Write tasks
-    for row, task in enumerate(tasks, 2):
-        ws.cell(row=row, column=1, value=task.id)
-        ws.cell(row=row, column=2, value=task.title)
-        ws.cell(row=row, column=3, value=task.description or '')
-        ws.cell(row=row, column=4, value=task.deadline.strftime('%Y-%m-%d %H:%M:%S') if task.deadline else '')
-        ws.cell(row=row, column=5, value=task.priority)
-        ws.cell(row=row, column=6, value='Yes' if task.completed else 'No')
-    
-    # Auto-adjust column widths
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    return StreamingResponse(
-        output,
-        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        headers={'Content-Disposition': 'attachment; filename=tasks.xlsx'}
-    )
+    return _export_response(request, db, current_user, "excel", completed)
 
 
-@app.get("/tasks/export/pdf")
+@router.get("/tasks/export/pdf")
 def export_tasks_pdf(
+    request: Request,
+    completed: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Exports all tasks for the current user as PDF."""
-    tasks = db.query(TaskModel).filter(TaskModel.user_id == current_user.id).all()
-    
-    output = io.BytesIO()
-    doc = SimpleDocTemplate(output, pagesize=letter)
-    styles = getSampleStyleSheet()
-    story = []
-    
-    # Title
-    title = Paragraph("SmartTask - Export Tasks", styles['Title'])
-    story.append(title)
-    story.append(Spacer(1, 12))
-    
-    # Table data
-    data = [['ID', 'Title', 'Description', 'Deadline', 'Priority', 'Completed']]
-    
-    for i, task in enumerate(tasks, start=1):
-        data.append([
-            str(i),
-            task.title,
-            task.description or '',
-            task.deadline.strftime('%Y-%m-%d %H:%M') if task.deadline else '',
-            task.priority,
-            'Yes' if task.completed else 'No'
-        ])
-    
-    # Create table
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(table)
-    doc.build(story)
-    output.seek(0)
-    
-    return StreamingResponse(
-        output,
-        media_type='application/pdf',
-        headers={'Content-Disposition': 'attachment; filename=tasks.pdf'}
+    return _export_response(request, db, current_user, "pdf", completed)
+
+
+def _export_job_read(job) -> ExportJobRead:
+    read = ExportJobRead.model_validate(job)
+    if job.status == "done":
+        read.download_url = f"/exports/{job.id}/download"
+    return read
+
+
+@router.post("/exports", response_model=ExportJobRead, status_code=status.HTTP_202_ACCEPTED)
+def create_export(
+    payload: ExportJobCreate,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Starts a background export; poll GET /exports/{id} until it is done."""
+    try:
+        job = export_jobs.create_job(db, current_user.id, payload.format, payload.completed)
+    except export_jobs.TooManyExports:
+        raise HTTPException(status_code=429, detail="Too many exports in progress") from None
+    response.headers["Location"] = f"/exports/{job.id}"
+    return _export_job_read(job)
+
+
+@router.get("/exports/{job_id}", response_model=ExportJobRead)
+def get_export(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Reports the status of one of the user's export jobs."""
+    job = export_jobs.get_job(db, current_user.id, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return _export_job_read(job)
+
+
+@router.get("/exports/{job_id}/download")
+def download_export(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Downloads a finished export; supports Range requests for resuming."""
+    job = export_jobs.get_job(db, current_user.id, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Export is {job.status}")
+    path = export_jobs.finished_artifact(job)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    media_type, extension = exports.EXPORT_FORMATS[job.format]
+    return FileResponse(path, media_type=media_type, filename=f"tasks.{extension}")
+
+
+def create_app() -> FastAPI:
+    """Build the ASGI app. DB setup and background jobs run in `lifespan`."""
+    application = FastAPI(lifespan=lifespan)
+
+    # Configura CORS
+    application.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:5173", "http://localhost:3000"],  # Frontend dev origins
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag"],
     )
+
+    if USE_ASYNC_DB:
+        from async_tasks import router as async_tasks_router  # pylint: disable=import-outside-toplevel
+
+        # Included first, so the async versions serve the task CRUD routes
+        application.include_router(async_tasks_router)
+    application.include_router(router)
+    return application
+
+
+app = create_app()
@@ -2,12 +2,36 @@
 
 This module defines SQLAlchemy models for users and tasks.
 """
-from sqlalchemy import Integer, String, DateTime, ForeignKey, Boolean, Text, Float
-from sqlalchemy.orm import relationship, Mapped, mapped_column
+from sqlalchemy import Integer, String, DateTime, ForeignKey, Boolean, Text, Float, Index, text
+from sqlalchemy.orm import relationship, Mapped, mapped_column, validates
 from datetime import datetime
 from database.database import Base
 
 
+# Stored sort key for Task.priority: rank 1 is the most urgent.
+PRIORITY_RANKS = {"High": 1, "Medium": 2, "Low": 3}
+UNRANKED_PRIORITY = 4
+
+
+def priority_rank_for(priority: str | None) -> int:
+    return PRIORITY_RANKS.get(priority, UNRANKED_PRIORITY)
+
+
+def _deadline_sort_indexes(name: str, *columns: str) -> tuple:
+    """Index on `columns` whose `deadline` matches the GET /tasks ORDER BY.
+
+    The sorts put NULL deadlines first ascending and last descending
+    (crud.task_sort_columns). That is SQLite's native order, but Postgres
+    indexes default to NULLS LAST, so there the deadline column is declared
+    NULLS FIRST; SQLite rejects NULLS FIRST in an index.
+    """
+    postgres = [text("deadline NULLS FIRST") if column == "deadline" else column for column in columns]
+    return (
+        Index(name, *columns).ddl_if(callable_=lambda *_, dialect, **__: dialect.name != "postgresql"),
+        Index(name, *postgres).ddl_if(dialect="postgresql"),
+    )
+
+
 class User(Base):  # pylint: disable=too-few-public-methods
     """User model representing application users.
     
@@ -18,6 +42,8 @@ class User(Base):  # pylint: disable=too-few-public-methods
         auth_provider: Authentication provider (default: local)
         tasks: Relationship to associated tasks
         google_access_token, google_refresh_token, google_token_expiry: tokens for Google Calendar integration
+        data_version: Bumped by every task mutation; GET /tasks ETags derive from it
+        sync_floor: Highest tombstone version compacted away; older delta syncs must reset
     """
     __tablename__ = "users"
 
@@ -30,7 +56,11 @@ class User(Base):  # pylint: disable=too-few-public-methods
     # Google Calendar tokens (optional)
     google_access_token: Mapped[str | None] = mapped_column(Text, nullable=True)
     google_refresh_token: Mapped[str | None] = mapped_column(Text, nullable=True)
-    google_token_expiry: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    # Indexed: the token renewal job scans users by upcoming expiry
+    google_token_expiry: Mapped[datetime | None] = mapped_column(DateTime, nullable=True, index=True)
+
+    data_version: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    sync_floor: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
 
 
 class Task(Base):  # pylint: disable=too-few-public-methods
@@ -46,15 +76,34 @@ class Task(Base):  # pylint: disable=too-few-public-methods
         user_id: Foreign key to the user who owns this task
         user: Relationship to the owning user
         google_event_id: optional id of the event created in Google Calendar (prevents duplicates)
+        priority_rank: integer form of priority (High=1 ... unknown=4), kept in sync on write
+        change_version: owner's data_version at the last write (GET /tasks/changes)
     """
     __tablename__ = "tasks"
+    # One index per GET /tasks sort mode, with and without the completed filter,
+    # so every listing is a range scan on (user_id[, completed], sort key, id).
+    __table_args__ = (
+        Index("ix_tasks_user_id_id", "user_id", "id"),
+        Index("ix_tasks_user_completed_id", "user_id", "completed", "id"),
+        *_deadline_sort_indexes("ix_tasks_user_deadline", "user_id", "deadline", "id"),
+        *_deadline_sort_indexes("ix_tasks_user_completed_deadline", "user_id", "completed", "deadline", "id"),
+        *_deadline_sort_indexes("ix_tasks_user_priority", "user_id", "priority_rank", "deadline", "id"),
+        *_deadline_sort_indexes(
+            "ix_tasks_user_completed_priority", "user_id", "completed", "priority_rank", "deadline", "id"
+        ),
+        Index("ix_tasks_user_change_version", "user_id", "change_version"),
+        # Across users: the reminder scheduler walks open tasks by deadline
+        Index("ix_tasks_completed_deadline", "completed", "deadline", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     title: Mapped[str] = mapped_column(String, index=True, nullable=False)
     description: Mapped[str | None] = mapped_column(String, nullable=True)
     deadline: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     priority: Mapped[str] = mapped_column(String, default="Medium", nullable=False)
+    priority_rank: Mapped[int] = mapped_column(Integer, default=PRIORITY_RANKS["Medium"], nullable=False)
     completed: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    change_version: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
     # Indicates if the task represents an all-day event (no specific time)
     all_day: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
 
@@ -67,3 +116,79 @@ class Task(Base):  # pylint: disable=too-few-public-methods
 
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
     user: Mapped["User"] = relationship("User", back_populates="tasks")
+
+    @validates("priority")
+    def _sync_priority_rank(self, _key, value):
+        self.priority_rank = priority_rank_for(value)
+        return value
+
+
+class TaskTombstone(Base):  # pylint: disable=too-few-public-methods
+    """Record of a deleted task, so delta syncs can report the deletion.
+
+    Attributes:
+        id: Primary key for the tombstone
+        user_id: Owner of the deleted task
+        task_id: Id the task had
+        version: Owner's data_version at deletion
+        deleted_at: When the task was deleted; compaction drops old tombstones
+    """
+    __tablename__ = "task_tombstones"
+    __table_args__ = (
+        Index("ix_task_tombstones_user_version", "user_id", "version"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
+    task_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    version: Mapped[int] = mapped_column(Integer, nullable=False)
+    deleted_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class TaskStat(Base):  # pylint: disable=too-few-public-methods
+    """Per-user task counter, maintained by every task mutation.
+
+    Attributes:
+        user_id: Owner of the counted tasks
+        priority: Task priority the row counts
+        completed: Completion state the row counts
+        count: Number of the user's tasks with that priority and state
+    """
+    __tablename__ = "task_stats"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    priority: Mapped[str] = mapped_column(String, primary_key=True)
+    completed: Mapped[bool] = mapped_column(Boolean, primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
+class ExportJob(Base):  # pylint: disable=too-few-public-methods
+    """A task export rendered in the background (POST /exports).
+
+    Attributes:
+        id: Random hex id, also the artifact's file name
+        user_id: Owner of the exported tasks
+        format: csv, excel or pdf
+        completed: Completion filter the export was requested with, if any
+        status: pending, running, done or failed
+        size: Artifact size in bytes, once done
+        error: Why rendering failed
+        created_at: When the job was requested
+        finished_at: When rendering ended
+        expires_at: When the job and its artifact are purged
+    """
+    __tablename__ = "export_jobs"
+    __table_args__ = (
+        Index("ix_export_jobs_user_status", "user_id", "status"),
+    )
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
+    format: Mapped[str] = mapped_column(String, nullable=False)
+    completed: Mapped[bool | None] = mapped_column(Boolean, nullable=True)
+    status: Mapped[str] = mapped_column(String, default="pending", nullable=False)
+    size: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
@@ -0,0 +1,233 @@
+"""Deadline reminders pushed to clients over the task event stream.
+
+`ReminderScheduler` keeps the open tasks due within the next
+lead + horizon window in a heap ordered by reminder time (deadline minus the
+lead time). The window is loaded a batch at a time from
+ix_tasks_completed_deadline and extended as time passes, so memory follows
+the number of tasks due soon rather than the size of the table, and nothing
+ever scans all tasks. Task events from the bus keep the heap current between
+loads; before a reminder goes out the task is read back by primary key, so a
+change the bus did not carry (another worker, a direct DB write) cannot
+produce a stale reminder.
+
+Reminders are published through `events.broker` as `event: reminder` on
+GET /tasks/stream. With `LocalBroker` every worker runs its own scheduler and
+reaches only its own connections; with a shared broker enable the scheduler
+(REMINDERS_ENABLED) on one worker only, or clients get one copy per worker.
+"""
+import heapq
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select
+
+import events
+from database.database import SessionLocal
+from models import Task as TaskModel
+
+logger = logging.getLogger(__name__)
+
+REMINDERS_ENABLED = os.environ.get("REMINDERS_ENABLED", "true").lower() in {"1", "true", "yes"}
+# How long before the deadline the reminder fires (the web client used 1 hour)
+REMINDER_LEAD_SECONDS = float(os.environ.get("REMINDER_LEAD_SECONDS", "3600"))
+# Deadlines loaded beyond the lead window; the heap is refilled halfway through it
+REMINDER_HORIZON_SECONDS = float(os.environ.get("REMINDER_HORIZON_SECONDS", "3600"))
+REMINDER_BATCH_SIZE = int(os.environ.get("REMINDER_BATCH_SIZE", "500"))
+
+
+def _utc_naive(value: datetime) -> datetime:
+    # Deadlines are stored as naive UTC, like the rest of the schema
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class ReminderScheduler:
+    """Timer heap of upcoming deadline reminders, run on a daemon thread."""
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        bus: events.EventBus = events.bus,
+        lead_seconds: float = REMINDER_LEAD_SECONDS,
+        horizon_seconds: float = REMINDER_HORIZON_SECONDS,
+        batch_size: int = REMINDER_BATCH_SIZE,
+        clock: Callable[[], datetime] = datetime.utcnow,
+    ):
+        self.session_factory = session_factory
+        self.bus = bus
+        self.lead = timedelta(seconds=lead_seconds)
+        self.horizon = timedelta(seconds=horizon_seconds)
+        self.batch_size = batch_size
+        self.clock = clock
+        # (remind_at, task_id, deadline); entries not matching _pending are stale
+        self._heap: List[Tuple[datetime, int, datetime]] = []
+        # task_id -> deadline currently scheduled
+        self._pending: Dict[int, datetime] = {}
+        # Every open task due in (start, _loaded_until] is scheduled
+        self._loaded_until: Optional[datetime] = None
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop = False
+        self.bus.add_listener(self.on_event)
+        self._thread = threading.Thread(target=self._run, name="task-reminders", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        self.bus.remove_listener(self.on_event)
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def _schedule(self, task_id: int, deadline: datetime) -> None:
+        # Caller holds self._cond
+        self._pending[task_id] = deadline
+        entry = (deadline - self.lead, task_id, deadline)
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._cond.notify()
+
+    def on_event(self, _user_id: int, event: dict) -> None:
+        """Bus listener: follow task creates, edits, completions and deletes."""
+        kind = event.get("type")
+        if kind == "deleted":
+            with self._cond:
+                self._pending.pop(event["id"], None)
+            return
+        if kind not in ("created", "updated"):
+            return
+        task = event["task"]
+        deadline = None
+        if task.get("deadline") and not task.get("completed"):
+            deadline = _utc_naive(datetime.fromisoformat(task["deadline"]))
+        with self._cond:
+            if deadline is not None and self._pending.get(task["id"]) == deadline:
+                return
+            if deadline is None or self._loaded_until is None or deadline > self._loaded_until:
+                # Beyond the window the next load picks it up
+                self._pending.pop(task["id"], None)
+            elif deadline > self.clock():
+                self._schedule(task["id"], deadline)
+
+    def _load(self, start: datetime, until: datetime) -> int:
+        """Schedule open tasks due in (start, until], walking the deadline index."""
+        loaded = 0
+        after: Optional[Tuple[datetime, int]] = None
+        with self.session_factory() as db:
+            while True:
+                stmt = select(TaskModel.id, TaskModel.deadline).where(
+                    TaskModel.completed.is_(False),
+                    TaskModel.deadline > start,
+                    TaskModel.deadline <= until,
+                )
+                if after is not None:
+                    stmt = stmt.where(
+                        TaskModel.deadline >= after[0],
+                        or_(TaskModel.deadline > after[0], and_(TaskModel.deadline == after[0], TaskModel.id > after[1])),
+                    )
+                rows = db.execute(stmt.order_by(TaskModel.deadline, TaskModel.id).limit(self.batch_size)).all()
+                with self._cond:
+                    for task_id, deadline in rows:
+                        # An event seen since the load began is newer than this read
+                        if task_id not in self._pending:
+                            self._schedule(task_id, deadline)
+                loaded += len(rows)
+                if len(rows) < self.batch_size:
+                    return loaded
+                after = (rows[-1].deadline, rows[-1].id)
+
+    def _refill(self, now: datetime) -> None:
+        with self._cond:
+            start = self._loaded_until
+            if start is not None and start >= now + self.lead + self.horizon / 2:
+                return
+            start = start or now
+            # Advanced before reading, so events for tasks in the new range
+            # are applied while the load runs
+            until = now + self.lead + self.horizon
+            self._loaded_until = until
+        self._load(start, until)
+
+    def _take_due(self, now: datetime) -> Dict[int, datetime]:
+        due: Dict[int, datetime] = {}
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                _, task_id, deadline = heapq.heappop(self._heap)
+                if self._pending.get(task_id) == deadline:
+                    del self._pending[task_id]
+                    due[task_id] = deadline
+            if len(self._heap) > 2 * len(self._pending) + 1024:
+                # Drop the stale entries left by edits and deletes
+                self._heap = [e for e in self._heap if self._pending.get(e[1]) == e[2]]
+                heapq.heapify(self._heap)
+        return due
+
+    def _fire(self, due: Dict[int, datetime], now: datetime) -> int:
+        sent = 0
+        with self.session_factory() as db:
+            rows = db.execute(
+                select(TaskModel.id, TaskModel.user_id, TaskModel.title, TaskModel.deadline, TaskModel.completed)
+                .where(TaskModel.id.in_(due))
+            ).all()
+        for row in rows:
+            if row.completed or row.deadline is None or row.deadline <= now:
+                continue
+            if row.deadline != due[row.id]:
+                # Moved by a change the bus did not carry
+                with self._cond:
+                    if row.id not in self._pending and row.deadline <= self._loaded_until:
+                        self._schedule(row.id, row.deadline)
+                continue
+            events.publish(row.user_id, {
+                "type": "reminder",
+                "id": row.id,
+                "title": row.title,
+                "deadline": row.deadline.isoformat(),
+            })
+            sent += 1
+        return sent
+
+    def tick(self) -> datetime:
+        """Load, send due reminders and return when the next tick is needed."""
+        now = self.clock()
+        self._refill(now)
+        due = self._take_due(now)
+        if due:
+            self._fire(due, now)
+        with self._cond:
+            wake = self._loaded_until - self.lead - self.horizon / 2
+            if self._heap:
+                wake = min(wake, self._heap[0][0])
+        return wake
+
+    def _run(self) -> None:
+        while True:
+            try:
+                wake = self.tick()
+            except Exception:
+                logger.exception("Reminder scheduler tick failed")
+                wake = self.clock() + timedelta(seconds=30)
+            with self._cond:
+                if self._stop:
+                    return
+                # Woken early by _schedule when a sooner reminder arrives
+                timeout = (wake - self.clock()).total_seconds()
+                if timeout > 0 and not (self._heap and self._heap[0][0] < wake):
+                    self._cond.wait(timeout)
+                if self._stop:
+                    return
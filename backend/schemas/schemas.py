@@ -1,9 +1,9 @@
 """Schemas for users, authentication tokens, and tasks."""
 
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Literal
 
-from pydantic import BaseModel, EmailStr, ConfigDict
+from pydantic import BaseModel, EmailStr, ConfigDict, Field
 
 
 # User Schemas
@@ -65,6 +65,68 @@ class TaskCompletedUpdate(BaseModel):
     completed: bool
 
 
+# Upper bound on operations in one POST /tasks/batch request
+TASK_BATCH_MAX_OPERATIONS = 1000
+
+
+class TaskBatchOperation(BaseModel):
+    """One operation of a batch: `data` is a TaskCreate for create/update,
+    a TaskCompletedUpdate for complete, and unused for delete."""
+    op: Literal["create", "update", "complete", "delete"]
+    id: Optional[int] = None
+    data: Optional[Dict[str, Any]] = None
+
+
+class TaskBatchRequest(BaseModel):
+    """Schema for POST /tasks/batch."""
+    operations: List[TaskBatchOperation] = Field(..., min_length=1, max_length=TASK_BATCH_MAX_OPERATIONS)
+
+
+class TaskBatchResult(BaseModel):
+    """Outcome of one batch operation, in request order."""
+    index: int
+    op: str
+    ok: bool
+    id: Optional[int] = None
+    task: Optional[TaskRead] = None
+    error: Optional[Any] = None
+
+
+class TaskBatchResponse(BaseModel):
+    """Schema for the POST /tasks/batch response."""
+    applied: bool
+    results: List[TaskBatchResult]
+
+
+class TaskChanges(BaseModel):
+    """Schema for GET /tasks/changes: apply `deleted`, then upsert `changed`."""
+    version: int
+    reset: bool = False
+    changed: List[TaskRead] = []
+    deleted: List[int] = []
+
+
+class TaskSearchHit(BaseModel):
+    """One GET /tasks/search result; highlights are escaped HTML with matches in <mark> tags."""
+    task: TaskRead
+    score: float
+    title_highlight: Optional[str] = None
+    snippet: Optional[str] = None
+
+
+class TaskCounts(BaseModel):
+    """Task counts split by completion state."""
+    total: int = 0
+    completed: int = 0
+    open: int = 0
+
+
+class TaskStats(TaskCounts):
+    """Schema for GET /tasks/stats."""
+    overdue: int = 0
+    by_priority: Dict[str, TaskCounts] = {}
+
+
 # Google / Calendar related schemas
 class GoogleSaveToken(BaseModel):
     """Payload for saving Google OAuth tokens from frontend."""
@@ -88,3 +150,25 @@ class CalendarEventCreate(BaseModel):
     end: Dict[str, Any]
     task_id: Optional[int] = None
     access_token: Optional[str] = None
+
+
+class ExportJobCreate(BaseModel):
+    """Schema for POST /exports: what to export and which tasks."""
+    format: Literal["csv", "excel", "pdf"]
+    completed: Optional[bool] = None
+
+
+class ExportJobRead(BaseModel):
+    """Schema for an export job; `download_url` is set once it is done."""
+    id: str
+    format: str
+    completed: Optional[bool] = None
+    status: Literal["pending", "running", "done", "failed"]
+    size: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    expires_at: datetime
+    download_url: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,177 @@
+"""Full-text search over task title, description and address.
+
+SQLite uses the `tasks_fts` FTS5 table (ranked with bm25); Postgres uses the
+`tasks.search_vector` tsvector column with a GIN index (ranked with
+ts_rank_cd). Both are created by migration 6 and kept in sync by the
+database itself (triggers / a generated column). Results are scoped to one
+user and paginated with a keyset cursor on (score, id); lower scores rank
+first on both backends.
+
+Highlights are HTML: the database marks matches with private-use sentinel
+characters, the text is escaped, and only then do the sentinels become
+<mark> tags, so task text can never inject markup.
+"""
+import html
+import re
+from typing import Any, List, Optional, Sequence
+
+from sqlalchemy import bindparam, select, text
+from sqlalchemy.orm import Session
+
+import crud
+from models import Task as TaskModel
+
+
+SEARCH_PAGE_MAX = 100
+# Search terms beyond this are ignored
+SEARCH_MAX_TERMS = 8
+HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE = "<mark>", "</mark>"
+# Match delimiters passed to the database; Unicode private-use characters
+_SENTINEL_OPEN, _SENTINEL_CLOSE = "\ue000", "\ue001"
+
+# bm25 column weights for title, description, address, owner (owner only scopes)
+_FTS_WEIGHTS = "10.0, 4.0, 2.0, 0.0"
+_FTS_SCORE = f"bm25(tasks_fts, {_FTS_WEIGHTS})"
+
+# Ranking queries; "{after}" becomes the keyset condition on later pages
+_SQLITE_RANK = f"""
+    SELECT tasks_fts.rowid AS id, {_FTS_SCORE} AS score
+    FROM tasks_fts
+    WHERE tasks_fts MATCH :match {{after}}
+    ORDER BY score, tasks_fts.rowid
+    LIMIT :limit
+"""
+_SQLITE_AFTER = (
+    f"AND ({_FTS_SCORE} > :after_score OR ({_FTS_SCORE} = :after_score AND tasks_fts.rowid > :after_id))"
+)
+
+_SQLITE_HIGHLIGHTS = text("""
+    SELECT tasks_fts.rowid AS id,
+           highlight(tasks_fts, 0, :open, :close) AS title_highlight,
+           snippet(tasks_fts, 1, :open, :close, '…', 16) AS description_snippet,
+           snippet(tasks_fts, 2, :open, :close, '…', 16) AS address_snippet
+    FROM tasks_fts
+    WHERE tasks_fts MATCH :match AND tasks_fts.rowid IN :ids
+""").bindparams(bindparam("ids", expanding=True))
+
+_POSTGRES_RANK = """
+    SELECT id, score FROM (
+        SELECT t.id, -ts_rank_cd(t.search_vector, to_tsquery('simple', :tsquery)) AS score
+        FROM tasks t
+        WHERE t.user_id = :user_id AND t.search_vector @@ to_tsquery('simple', :tsquery)
+    ) ranked
+    {after}
+    ORDER BY score, id
+    LIMIT :limit
+"""
+_POSTGRES_AFTER = "WHERE score > :after_score OR (score = :after_score AND id > :after_id)"
+
+_POSTGRES_HIGHLIGHTS = text("""
+    SELECT t.id,
+           ts_headline('simple', t.title, q.query,
+                       'StartSel=' || :open || ', StopSel=' || :close || ', HighlightAll=true') AS title_highlight,
+           ts_headline('simple', coalesce(t.description, ''), q.query,
+                       'StartSel=' || :open || ', StopSel=' || :close || ', MaxWords=16, MinWords=5')
+               AS description_snippet,
+           ts_headline('simple', coalesce(t.address, ''), q.query,
+                       'StartSel=' || :open || ', StopSel=' || :close || ', MaxWords=16, MinWords=5')
+               AS address_snippet
+    FROM tasks t, (SELECT to_tsquery('simple', :tsquery) AS query) q
+    WHERE t.user_id = :user_id AND t.id IN :ids
+""").bindparams(bindparam("ids", expanding=True))
+
+
+def search_terms(q: str) -> List[str]:
+    """Words of the query; punctuation and FTS operators are dropped."""
+    return [term.lower() for term in re.findall(r"\w+", q)][:SEARCH_MAX_TERMS]
+
+
+def fts5_match(user_id: int, terms: Sequence[str]) -> str:
+    """FTS5 MATCH expression: all terms (the last one as a prefix) within one user's rows."""
+    phrases = [f'"{term}"' for term in terms]
+    phrases[-1] += "*"
+    return f'owner:u{user_id} AND {{title description address}} : ({" ".join(phrases)})'
+
+
+def tsquery(terms: Sequence[str]) -> str:
+    """Postgres to_tsquery text: all terms, the last one as a prefix."""
+    return " & ".join(terms[:-1] + [f"{terms[-1]}:*"])
+
+
+def encode_search_cursor(q: str, score: float, task_id: int) -> str:
+    return crud.pack_cursor({"q": q, "r": score, "i": task_id})
+
+
+def decode_search_cursor(cursor: str, q: str):
+    payload = crud.unpack_cursor(cursor)
+    if payload.get("q") != q:
+        raise crud.InvalidCursor("Cursor was issued for a different query")
+    score, task_id = payload.get("r"), payload.get("i")
+    if not isinstance(score, (int, float)) or not isinstance(task_id, int):
+        raise crud.InvalidCursor("Malformed cursor")
+    return float(score), task_id
+
+
+def _to_html(marked: Optional[str]) -> Optional[str]:
+    """Escape sentinel-delimited database output and turn the sentinels into <mark> tags."""
+    if marked is None:
+        return None
+    return html.escape(marked).replace(_SENTINEL_OPEN, HIGHLIGHT_OPEN).replace(_SENTINEL_CLOSE, HIGHLIGHT_CLOSE)
+
+
+def _pick_snippet(row: Any) -> Optional[str]:
+    for snippet in (row.description_snippet, row.address_snippet):
+        if snippet and _SENTINEL_OPEN in snippet:
+            return _to_html(snippet)
+    return None
+
+
+def search_tasks(db: Session, user_id: int, q: str, limit: int, cursor: Optional[str] = None):
+    """One page of search hits as (hits, next cursor or None).
+
+    Each hit is a dict with the task, its score and highlighted title and
+    snippet: HTML-escaped text with HIGHLIGHT_OPEN/CLOSE around matches.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return [], None
+    if db.get_bind().dialect.name == "postgresql":
+        query = {"user_id": user_id, "tsquery": tsquery(terms)}
+        rank, after, highlights = _POSTGRES_RANK, _POSTGRES_AFTER, _POSTGRES_HIGHLIGHTS
+    else:
+        query = {"match": fts5_match(user_id, terms)}
+        rank, after, highlights = _SQLITE_RANK, _SQLITE_AFTER, _SQLITE_HIGHLIGHTS
+
+    params = {**query, "limit": limit + 1}
+    if cursor:
+        params["after_score"], params["after_id"] = decode_search_cursor(cursor, q)
+    else:
+        after = ""
+    ranked = db.execute(text(rank.format(after=after)), params).all()
+    next_cursor = None
+    if len(ranked) > limit:
+        ranked = ranked[:limit]
+        next_cursor = encode_search_cursor(q, ranked[-1].score, ranked[-1].id)
+    if not ranked:
+        return [], None
+
+    # Snippets and rows only for the page, not for every match
+    ids = [row.id for row in ranked]
+    marked = {
+        row.id: row
+        for row in db.execute(highlights, {**query, "ids": ids, "open": _SENTINEL_OPEN, "close": _SENTINEL_CLOSE})
+    }
+    tasks = {task.id: task for task in db.execute(select(TaskModel).where(TaskModel.id.in_(ids))).scalars()}
+    hits = []
+    for row in ranked:
+        task = tasks.get(row.id)
+        if task is None or task.user_id != user_id:
+            continue
+        mark = marked.get(row.id)
+        hits.append({
+            "task": task,
+            "score": row.score,
+            "title_highlight": _to_html(mark.title_highlight) if mark else None,
+            "snippet": _pick_snippet(mark) if mark else None,
+        })
+    return hits, next_cursor
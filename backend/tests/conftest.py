@@ -8,10 +8,12 @@ from sqlalchemy.orm import sessionmaker
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from main import app, get_db  # type: ignore
-from database.database import Base  # type: ignore
+from database.database import engine as app_engine  # type: ignore
+from database.migrations import upgrade  # type: ignore
 
 
-TEST_DB_URL = "sqlite:///./test_suite.db"
+TEST_DB_PATH = "./test_suite.db"
+TEST_DB_URL = f"sqlite:///{TEST_DB_PATH}"
 engine = create_engine(TEST_DB_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -24,14 +26,25 @@ def override_get_db():
         db.close()
 
 
+def _remove_test_database():
+    engine.dispose()
+    if os.path.exists(TEST_DB_PATH):
+        os.remove(TEST_DB_PATH)
+
+
 @pytest.fixture(scope="session", autouse=True)
 def setup_database():
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+    # Built through the migrations: the search index (FTS5 table and
+    # triggers) is not part of Base.metadata.
+    _remove_test_database()
+    upgrade(engine)
+    # TestClient is used without a context manager, so the lifespan hook
+    # never runs; tests that use SessionLocal directly need the app schema.
+    upgrade(app_engine)
     app.dependency_overrides[get_db] = override_get_db
     yield
     app.dependency_overrides.clear()
-    Base.metadata.drop_all(bind=engine)
+    _remove_test_database()
 
 
 @pytest.fixture()
@@ -45,13 +58,22 @@ def clear_tasks():
     db = TestingSessionLocal()
     try:
         # Only clear tasks, not users (users are needed for auth)
-        from models import Task
+        from models import Task, TaskStat
         db.query(Task).delete()
+        # Counters maintained by the API would be stale after a raw delete
+        db.query(TaskStat).delete()
         db.commit()
     finally:
         db.close()
 
 
+@pytest.fixture(autouse=True)
+def export_cache_dir(tmp_path, monkeypatch):
+    """A fresh export cache per test: clear_tasks deletes tasks without bumping data versions."""
+    import export_cache
+    monkeypatch.setattr(export_cache, "EXPORT_CACHE_DIR", str(tmp_path / "export-cache"))
+
+
 @pytest.fixture()
 def user_credentials():
     return {"email": "testuser@example.com", "password": "testpassword"}
@@ -0,0 +1,116 @@
+"""Tests for the async task endpoints (USE_ASYNC_DB path)."""
+
+import datetime
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy.ext.asyncio import async_sessionmaker  # noqa: E402
+
+from async_tasks import router  # noqa: E402
+from auth import create_access_token, get_async_db  # noqa: E402
+from database.database import build_async_engine, build_engine  # noqa: E402
+from database.migrations import upgrade  # noqa: E402
+from models import User  # noqa: E402
+
+
+@pytest.fixture()
+def async_client(tmp_path):
+    url = f"sqlite:///{tmp_path / 'async.db'}"
+    sync_engine = build_engine(url)
+    upgrade(sync_engine)
+    # NullPool: aiosqlite connections must not outlive the event loop that opened them
+    async_engine = build_async_engine(url, poolclass=NullPool)
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+
+    db = sessionmaker(bind=sync_engine)()
+    email = f"async_{uuid.uuid4().hex[:8]}@example.com"
+    db.add(User(email=email, hashed_password="x"))
+    db.commit()
+    db.close()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': email})}"}
+
+    with TestClient(app) as client:
+        yield client, headers
+    sync_engine.dispose()
+
+
+def test_async_crud_flow(async_client):
+    client, headers = async_client
+    payload = {
+        "title": "Async task",
+        "deadline": (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=2)).isoformat(),
+        "priority": "High",
+    }
+    res = client.post("/tasks", json=payload, headers=headers)
+    assert res.status_code == 200, res.text
+    task_id = res.json()["id"]
+    client.post("/tasks", json={**payload, "title": "Second", "priority": "Low"}, headers=headers)
+
+    res = client.get("/tasks", headers=headers, params={"sort_by": "priority", "sort_order": "asc"})
+    assert [t["title"] for t in res.json()] == ["Second", "Async task"]
+
+    etag = res.headers["ETag"]
+    res = client.get("/tasks", headers={**headers, "If-None-Match": etag}, params={"sort_by": "priority", "sort_order": "asc"})
+    assert res.status_code == 304
+
+    res = client.put(f"/tasks/{task_id}", json={**payload, "title": "Renamed"}, headers=headers)
+    assert res.json()["title"] == "Renamed"
+    assert [h["task"]["id"] for h in client.get("/tasks/search", headers=headers, params={"q": "renam"}).json()] == [task_id]
+
+    res = client.patch(f"/tasks/{task_id}/completed", json={"completed": True}, headers=headers)
+    assert res.json()["completed"] is True
+    assert [t["id"] for t in client.get("/tasks", headers=headers, params={"completed": "true"}).json()] == [task_id]
+    assert client.get("/tasks/stats", headers=headers).json()["completed"] == 1
+
+    res = client.post("/tasks/batch", headers=headers, json={"operations": [
+        {"op": "create", "data": {"title": "Batched", "priority": "Medium"}},
+        {"op": "complete", "id": task_id, "data": {"completed": False}},
+    ]})
+    assert res.status_code == 200, res.text
+    assert [r["task"]["title"] for r in res.json()["results"]] == ["Batched", "Renamed"]
+
+    assert client.delete(f"/tasks/{task_id}", headers=headers).status_code == 200
+    assert client.get("/tasks/changes", headers=headers, params={"since": 0}).json()["deleted"] == [task_id]
+    assert client.get(f"/tasks/{task_id}", headers=headers).status_code == 404
+
+
+def test_async_paging_projection_and_single_task_etag(async_client):
+    client, headers = async_client
+    ids = [client.post("/tasks", json={"title": f"P{i}", "priority": "Low"}, headers=headers).json()["id"] for i in range(5)]
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, "fields": "id,title", **({"cursor": cursor} if cursor else {})}
+        res = client.get("/tasks", headers=headers, params=params)
+        assert all(set(t) == {"id", "title"} for t in res.json())
+        seen += [t["id"] for t in res.json()]
+        cursor = res.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == ids
+    assert client.get("/tasks", headers=headers, params={"cursor": "garbage"}).status_code == 400
+    assert client.get("/tasks", headers=headers, params={"fields": "hashed_password"}).status_code == 400
+
+    etag = client.get(f"/tasks/{ids[0]}", headers=headers).headers["ETag"]
+    assert client.get(f"/tasks/{ids[0]}", headers={**headers, "If-None-Match": etag}).status_code == 304
+
+
+def test_async_endpoints_require_auth(async_client):
+    client, _ = async_client
+    assert client.get("/tasks").status_code == 401
+    assert client.get("/tasks", headers={"Authorization": "Bearer invalid"}).status_code == 401
@@ -59,14 +59,14 @@ def test_get_current_user_invalid_token(fake_db_session):
         auth.get_current_user("invalidtoken", db=fake_db_session)
 
 
-@patch("auth.google_id_token.verify_oauth2_token")
+@patch("google.oauth2.id_token.verify_oauth2_token")
 def test_verify_google_id_token_success(mock_verify):
     mock_verify.return_value = {"aud": auth.GOOGLE_CLIENT_ID, "email": "test@gmail.com"}
     email = auth.verify_google_id_token_and_get_email("fake_token")
     assert email == "test@gmail.com"
 
 
-@patch("auth.google_id_token.verify_oauth2_token", side_effect=ValueError("Invalid"))
+@patch("google.oauth2.id_token.verify_oauth2_token", side_effect=ValueError("Invalid"))
 def test_verify_google_id_token_fallback(mock_verify):
     with patch("auth.GOOGLE_DEV_ALLOW_INSECURE", True):
         with patch("auth.jwt.get_unverified_claims", return_value={"email": "insecure@gmail.com"}):
@@ -74,7 +74,7 @@ def test_verify_google_id_token_fallback(mock_verify):
             assert email == "insecure@gmail.com"
 
 
-@patch("auth.google_id_token.verify_oauth2_token", side_effect=ValueError("Invalid"))
+@patch("google.oauth2.id_token.verify_oauth2_token", side_effect=ValueError("Invalid"))
 def test_verify_google_id_token_failure(mock_verify):
     with patch("auth.GOOGLE_DEV_ALLOW_INSECURE", False):
         with pytest.raises(HTTPException):
@@ -114,7 +114,7 @@ def test_refresh_access_token_missing_secret(monkeypatch):
         auth.refresh_access_token_with_refresh_token("1//valid_refresh_token_long_enough_to_pass_check")
 
 
-@patch("auth.requests.post")
+@patch("requests.post")
 def test_refresh_access_token_google_failure(mock_post):
     mock_resp = MagicMock()
     mock_resp.ok = False
@@ -128,7 +128,7 @@ def test_refresh_access_token_google_failure(mock_post):
         assert "refresh token is invalid" in str(exc.value.detail).lower()
 
 
-@patch("auth.requests.post")
+@patch("requests.post")
 def test_refresh_access_token_google_success(mock_post):
     mock_resp = MagicMock()
     mock_resp.ok = True
@@ -139,7 +139,7 @@ def test_refresh_access_token_google_success(mock_post):
         assert data["access_token"] == "new_token"
 
 
-@patch("auth.requests.post")
+@patch("requests.post")
 def test_exchange_code_for_tokens_success(mock_post):
     mock_resp = MagicMock()
     mock_resp.ok = True
@@ -150,7 +150,7 @@ def test_exchange_code_for_tokens_success(mock_post):
         assert "access_token" in data
 
 
-@patch("auth.requests.post")
+@patch("requests.post")
 def test_exchange_code_for_tokens_failure(mock_post):
     mock_resp = MagicMock()
     mock_resp.ok = False
@@ -159,4 +159,119 @@ def test_exchange_code_for_tokens_failure(mock_post):
     mock_post.return_value = mock_resp
     with patch("auth.GOOGLE_CLIENT_SECRET", "secret"):
         with pytest.raises(HTTPException):
-            auth.exchange_code_for_tokens("invalidcode")
\ No newline at end of file
+            auth.exchange_code_for_tokens("invalidcode")
+
+def test_identity_cache_evicts_least_recently_used():
+    cache = auth.IdentityCache(max_entries=2, ttl=60)
+    for i in range(3):
+        user = User(id=i, email=f"user{i}@example.com", hashed_password="x", auth_provider="local")
+        cache.put(f"token{i}", user, None, cache.epoch)
+    assert cache.get("token0") is None
+    assert cache.get("token2").email == "user2@example.com"
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_identity_cache_respects_token_expiry_and_invalidation():
+    cache = auth.IdentityCache(max_entries=10, ttl=60)
+    user = User(id=1, email="cached@example.com", hashed_password="x", auth_provider="local")
+    cache.put("expired", user, 0, cache.epoch)
+    assert cache.get("expired") is None
+
+    stale_epoch = cache.epoch
+    cache.invalidate_user("someone@example.com")
+    cache.put("raced", user, None, stale_epoch)
+    assert cache.get("raced") is None
+
+    cache.put("fresh", user, None, cache.epoch)
+    assert cache.get("fresh") is not None
+    cache.invalidate_user("cached@example.com")
+    assert cache.get("fresh") is None
+
+
+def test_get_current_user_served_from_cache(client, auth_headers):
+    auth.identity_cache.clear()
+    hits_before = auth.identity_cache.hits
+    assert client.get("/me", headers=auth_headers).status_code == 200
+    assert client.get("/me", headers=auth_headers).status_code == 200
+    assert auth.identity_cache.hits == hits_before + 1
+
+    # Saving Google tokens writes the user row and must invalidate the cache
+    res = client.post("/google-auth", json={"access_token": "cached_access"}, headers=auth_headers)
+    assert res.status_code == 200
+    me = client.get("/me", headers=auth_headers)
+    assert me.json()["google_access_token"] == "cached_access"
+
+
+def test_verify_and_update_password_flags_cost_change(monkeypatch):
+    hashed = auth.get_password_hash("secret")
+    assert auth.verify_and_update_password("secret", hashed) == (True, None)
+    assert auth.verify_and_update_password("secret", None) == (False, None)
+
+    monkeypatch.setattr(auth, "pwd_context", auth.CryptContext(schemes=["bcrypt"], bcrypt__rounds=5))
+    valid, new_hash = auth.verify_and_update_password("secret", hashed)
+    assert valid
+    assert new_hash.startswith("$2b$05$")
+
+
+def test_login_rehashes_password_when_cost_changes(client, monkeypatch):
+    from tests.conftest import TestingSessionLocal
+
+    email = "rehash@example.com"
+    client.post("/register", json={"email": email, "password": "pw-rehash"})
+    monkeypatch.setattr(auth, "pwd_context", auth.CryptContext(schemes=["bcrypt"], bcrypt__rounds=5))
+
+    res = client.post("/login", data={"username": email, "password": "pw-rehash"})
+    assert res.status_code == 200
+
+    db = TestingSessionLocal()
+    try:
+        stored = db.query(User).filter(User.email == email).first().hashed_password
+    finally:
+        db.close()
+    assert stored.startswith("$2b$05$")
+
+
+def test_login_returns_503_when_hash_queue_full(client, monkeypatch):
+    import threading
+
+    client.post("/register", json={"email": "busy@example.com", "password": "pw"})
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    monkeypatch.setattr(auth, "_password_slots", slots)
+
+    res = client.post("/login", data={"username": "busy@example.com", "password": "pw"})
+    assert res.status_code == 503
+    assert res.headers["Retry-After"] == str(auth.PASSWORD_HASH_RETRY_AFTER_SECONDS)
+
+
+def test_caching_google_request_honors_max_age():
+    session = MagicMock()
+    raw = MagicMock()
+    raw.status_code = 200
+    raw.headers = {"Cache-Control": "public, max-age=19809, must-revalidate", "Age": "9"}
+    raw.content = b"{}"
+    session.request.return_value = raw
+
+    transport = auth.CachingGoogleRequest(session=session)
+    first = transport("https://certs.example/", method="GET")
+    second = transport("https://certs.example/", method="GET")
+    assert first is second
+    assert session.request.call_count == 1
+
+    raw.headers = {"Cache-Control": "no-store"}
+    transport.clear()
+    transport("https://certs.example/")
+    transport("https://certs.example/")
+    assert session.request.call_count == 3
+
+
+@patch("google.oauth2.id_token.verify_oauth2_token")
+def test_verify_google_id_token_reuses_transport(mock_verify):
+    mock_verify.return_value = {"aud": auth.GOOGLE_CLIENT_ID, "email": "test@gmail.com"}
+    auth.verify_google_id_token_and_get_email("t1")
+    auth.verify_google_id_token_and_get_email("t2")
+    transports = {id(call.args[1]) for call in mock_verify.call_args_list}
+    assert transports == {id(auth.get_google_transport())}
@@ -0,0 +1,37 @@
+"""Tests for engine construction in database.database."""
+
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from database import database
+
+
+def test_sqlite_file_engine_applies_pragmas(tmp_path):
+    engine = database.build_engine(f"sqlite:///{tmp_path / 'tuned.db'}")
+    try:
+        assert isinstance(engine.pool, QueuePool)
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == database.SQLITE_BUSY_TIMEOUT_MS
+            assert conn.execute(text("PRAGMA cache_size")).scalar() == -database.SQLITE_CACHE_SIZE_KIB
+            assert conn.execute(text("PRAGMA temp_store")).scalar() == 2  # MEMORY
+    finally:
+        engine.dispose()
+
+
+def test_sqlite_memory_engine_shares_one_connection():
+    engine = database.build_engine("sqlite://")
+    try:
+        assert isinstance(engine.pool, StaticPool)
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE t (x INTEGER)"))
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT count(*) FROM t")).scalar() == 0
+    finally:
+        engine.dispose()
+
+
+def test_is_sqlite_url():
+    assert database.is_sqlite_url("sqlite:///./tasks.db")
+    assert not database.is_sqlite_url("postgresql+psycopg2://user:pw@localhost/smarttask")
@@ -0,0 +1,92 @@
+"""Tests for the task event bus and the SSE stream."""
+
+import asyncio
+import json
+import threading
+
+import pytest
+
+import events
+
+
+def test_bus_fans_out_per_user_and_drops_oldest():
+    async def scenario():
+        bus = events.EventBus(queue_size=2)
+        mine, other = bus.subscribe(1), bus.subscribe(2)
+
+        # Published from another thread, as the sync handlers do
+        def publish():
+            for version in range(1, 4):
+                bus.deliver(1, {"type": "updated", "version": version})
+
+        thread = threading.Thread(target=publish)
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0)
+
+        assert mine.dropped == 1
+        assert [(await mine.get(1))["version"], (await mine.get(1))["version"]] == [2, 3]
+        assert await other.get(0.01) is None
+
+        mine.close()
+        other.close()
+        assert bus.subscriber_count() == 0
+
+    asyncio.run(scenario())
+
+
+def test_hub_fans_out_across_workers():
+    async def scenario():
+        hub = events.LocalHub()
+        # Two workers, each with its own bus and broker on the shared hub
+        first, second = events.EventBus(), events.EventBus()
+        first_broker = events.HubBroker(hub, first.deliver)
+        events.HubBroker(hub, second.deliver)
+        here, there = first.subscribe(1), second.subscribe(1)
+
+        first_broker.publish(1, {"type": "updated", "version": 7})
+        await asyncio.sleep(0)
+        assert (await there.get(1))["version"] == 7
+        assert (await here.get(1))["version"] == 7
+
+        first_broker.close()
+        first_broker.publish(1, {"type": "updated", "version": 8})
+        await asyncio.sleep(0)
+        assert (await there.get(1))["version"] == 8
+        assert await here.get(0.01) is None
+
+    asyncio.run(scenario())
+
+
+def test_broker_requires_publish():
+    with pytest.raises(TypeError):
+        events.Broker(lambda user_id, event: None)  # pylint: disable=abstract-class-instantiated
+
+
+def test_stream_pushes_committed_changes(client, auth_headers):
+    user_id = client.get("/me", headers=auth_headers).json()["id"]
+
+    async def scenario():
+        subscription = events.bus.subscribe(user_id)
+        task = client.post("/tasks", json={"title": "Live", "priority": "High"}, headers=auth_headers).json()
+        client.delete(f"/tasks/{task['id']}", headers=auth_headers)
+
+        chunks = []
+
+        async def is_disconnected():
+            return len(chunks) >= 3
+
+        async for chunk in events.sse_stream(subscription, is_disconnected, heartbeat=1):
+            chunks.append(chunk)
+        return task, chunks
+
+    task, (hello, created, deleted) = asyncio.run(scenario())
+    assert hello.startswith("retry:")
+    assert created.startswith("event: task\n")
+    created = json.loads(created.split("data: ", 1)[1])
+    assert created["type"] == "created" and created["task"]["title"] == "Live"
+    assert f"id: {created['version'] + 1}\n" in deleted
+    assert json.loads(deleted.split("data: ", 1)[1]) == {
+        "type": "deleted", "version": created["version"] + 1, "id": task["id"],
+    }
+    assert events.bus.subscriber_count(user_id) == 0
@@ -176,3 +176,240 @@ def test_export_empty_tasks(client):
     lines = csv_content.strip().split('\n')
     assert len(lines) == 1  # Only header
     assert "ID,Title,Description,Deadline,Priority,Completed" in lines[0]
+
+
+def test_export_csv_is_streamed_in_chunks(client, monkeypatch):
+    """The CSV export is produced in chunks from batched reads, in id order."""
+    import csv
+    import io
+    import uuid
+    import exports
+    from tests.conftest import engine
+
+    unique_email = f"stream_{uuid.uuid4().hex[:8]}@example.com"
+    client.post("/register", json={"email": unique_email, "password": "testpassword"})
+    token = client.post("/login", data={"username": unique_email, "password": "testpassword"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    for i in range(30):
+        client.post("/tasks", json={"title": f"Task, \"{i}\"", "priority": "Low"}, headers=headers)
+    user_id = client.get("/me", headers=headers).json()["id"]
+
+    monkeypatch.setattr(exports, "EXPORT_BATCH_ROWS", 7)
+    monkeypatch.setattr(exports, "EXPORT_CHUNK_BYTES", 200)
+    chunks = list(exports.iter_csv(exports.iter_export_rows(engine, user_id)))
+    assert len(chunks) > 1
+
+    rows = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+    assert rows[0] == exports.EXPORT_HEADERS
+    assert [row[1] for row in rows[1:]] == [f"Task, \"{i}\"" for i in range(30)]
+
+    response = client.get("/tasks/export/csv", headers=headers)
+    assert response.content == b"".join(chunks)
+
+
+def test_export_excel_rows_and_column_widths(client, monkeypatch):
+    """The write-only workbook holds every task and sizes columns up front."""
+    import io
+    import uuid
+    import openpyxl
+    import exports
+
+    unique_email = f"xlsx_{uuid.uuid4().hex[:8]}@example.com"
+    client.post("/register", json={"email": unique_email, "password": "testpassword"})
+    token = client.post("/login", data={"username": unique_email, "password": "testpassword"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/tasks", json={"title": "x" * 80, "priority": "Medium",
+                                "deadline": "2025-03-01T09:30:00"}, headers=headers)
+    for i in range(12):
+        client.post("/tasks", json={"title": f"Task {i}", "description": "Twelve chars", "priority": "Low"},
+                    headers=headers)
+
+    monkeypatch.setattr(exports, "EXPORT_BATCH_ROWS", 5)
+    monkeypatch.setattr(exports, "EXPORT_CHUNK_BYTES", 1024)
+    response = client.get("/tasks/export/excel", headers=headers)
+    assert response.status_code == 200
+
+    ws = openpyxl.load_workbook(io.BytesIO(response.content))["Tasks"]
+    rows = list(ws.iter_rows(values_only=True))
+    assert list(rows[0]) == exports.EXPORT_HEADERS
+    assert rows[1][1:] == ("x" * 80, None, "2025-03-01 09:30:00", "Medium", "No")
+    assert [row[1] for row in rows[2:]] == [f"Task {i}" for i in range(12)]
+    assert rows[0][0] is not None and ws["A1"].font.bold
+    widths = [ws.column_dimensions[letter].width for letter in "ABCDEF"]
+    assert widths == [4, 50, 14, 21, 10, 11]
+
+
+def test_export_pdf_lays_out_one_table_per_page(client):
+    """Rows are packed into page-sized tables: no table spills onto a second page."""
+    import io
+    import uuid
+    from reportlab.pdfgen.canvas import Canvas
+    import exports
+    from tests.conftest import TestingSessionLocal
+
+    unique_email = f"pdf_{uuid.uuid4().hex[:8]}@example.com"
+    client.post("/register", json={"email": unique_email, "password": "testpassword"})
+    token = client.post("/login", data={"username": unique_email, "password": "testpassword"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    for i in range(90):
+        description = ("a fairly long description <with> markup & words " * (i % 7 * 4))
+        if i % 10 == 0:
+            description += "\nsecond line\nthird line"
+        client.post("/tasks", json={"title": f"Task {i} " * (i % 5 + 1), "description": description,
+                                    "priority": "High"}, headers=headers)
+    user_id = client.get("/me", headers=headers).json()["id"]
+
+    layout = exports._pdf_layout()
+    with TestingSessionLocal() as db:
+        pages = list(exports._pdf_pages(layout, db.execute(exports.export_select(user_id))))
+    assert sum(len(page[-1]._cellvalues) - 1 for page in pages) == 90
+
+    # The title shares the first page with the first table
+    assert len(pages) > 1
+    assert exports._draw_pdf(Canvas(io.BytesIO(), pagesize=layout.pagesize), layout, iter(pages)) == len(pages)
+
+    # Pages are built as they are drawn, not up front
+    pulled = []
+
+    def counted(rows):
+        for row in rows:
+            pulled.append(row)
+            yield row
+
+    with TestingSessionLocal() as db:
+        lazy = exports._pdf_pages(layout, counted(db.execute(exports.export_select(user_id))))
+        first = next(lazy)
+        assert len(pulled) == len(first[-1]._cellvalues)  # its rows plus the one that did not fit
+
+    response = client.get("/tasks/export/pdf", headers=headers)
+    assert response.content.startswith(b"%PDF")
+
+
+def test_export_pdf_trims_cells_taller_than_a_page(client, auth_headers):
+    """A short but newline-heavy description is cut to fit, instead of failing the layout."""
+    import exports
+
+    client.post("/tasks", json={"title": "Tall", "description": "x\n" * 300, "priority": "Low"}, headers=auth_headers)
+    client.post("/tasks", json={"title": "After", "priority": "Low"}, headers=auth_headers)
+
+    layout = exports._pdf_layout()
+    paragraph, height = layout.cell("x\n" * 300, 2)
+    assert height <= layout.max_cell_height
+    assert paragraph.text.endswith("\u2026")
+
+    response = client.get("/tasks/export/pdf", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.content.startswith(b"%PDF")
+
+
+def test_export_job_renders_in_background_and_serves_ranges(
+    client, auth_headers, second_user_auth_headers, monkeypatch, tmp_path
+):
+    """POST /exports renders on the process pool; the artifact supports Range and expires."""
+    import time
+    from datetime import datetime, timedelta
+    import export_jobs
+    from tests.conftest import TestingSessionLocal
+
+    monkeypatch.setenv("EXPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(export_jobs, "EXPORT_DIR", str(tmp_path))
+    export_jobs.shutdown()
+    try:
+        for i in range(5):
+            res = client.post("/tasks", json={"title": f"Job task {i}", "priority": "Low"}, headers=auth_headers)
+            if i % 2:
+                client.patch(f"/tasks/{res.json()['id']}/completed", json={"completed": True}, headers=auth_headers)
+
+        res = client.post("/exports", json={"format": "csv", "completed": False}, headers=auth_headers)
+        assert res.status_code == 202
+        job = res.json()
+        assert res.headers["location"] == f"/exports/{job['id']}"
+        assert job["status"] in ("pending", "running") and job["download_url"] is None
+
+        deadline = time.monotonic() + 60
+        while job["status"] in ("pending", "running") and time.monotonic() < deadline:
+            time.sleep(0.2)
+            job = client.get(f"/exports/{job['id']}", headers=auth_headers).json()
+        assert job["status"] == "done", job
+        assert client.get(f"/exports/{job['id']}", headers=second_user_auth_headers).status_code == 404
+
+        full = client.get(job["download_url"], headers=auth_headers)
+        assert full.status_code == 200
+        assert full.headers["content-type"].startswith("text/csv")
+        lines = full.content.decode().strip().splitlines()
+        assert [line.split(",")[1] for line in lines[1:]] == ["Job task 0", "Job task 2", "Job task 4"]
+        assert len(full.content) == job["size"]
+
+        part = client.get(job["download_url"], headers={**auth_headers, "Range": "bytes=3-10"})
+        assert part.status_code == 206
+        assert part.content == full.content[3:11]
+        assert part.headers["content-range"] == f"bytes 3-10/{job['size']}"
+
+        with TestingSessionLocal() as db:
+            assert export_jobs.purge_expired(db, now=datetime.utcnow() + timedelta(days=1)) >= 1
+        assert list(tmp_path.iterdir()) == []
+        assert client.get(job["download_url"], headers=auth_headers).status_code == 404
+    finally:
+        export_jobs.shutdown()
+
+
+def test_export_cache_serves_unchanged_data_with_strong_etag(client, auth_headers):
+    """Repeated exports of unchanged tasks come from the cache; any mutation renders anew."""
+    import os
+    import export_cache
+
+    task = client.post("/tasks", json={"title": "Cached", "priority": "High"}, headers=auth_headers).json()
+
+    first = client.get("/tasks/export/pdf", headers=auth_headers)
+    assert first.status_code == 200 and "etag" not in first.headers
+
+    second = client.get("/tasks/export/pdf", headers=auth_headers)
+    etag = second.headers["etag"]
+    assert not etag.startswith("W/") and second.content == first.content
+    assert second.headers["content-length"] == str(len(first.content))
+
+    revalidated = client.get("/tasks/export/pdf", headers={**auth_headers, "If-None-Match": etag})
+    assert revalidated.status_code == 304 and revalidated.content == b""
+
+    # Filters are part of the key
+    assert "etag" not in client.get("/tasks/export/pdf?completed=true", headers=auth_headers).headers
+
+    client.patch(f"/tasks/{task['id']}/completed", json={"completed": True}, headers=auth_headers)
+    changed = client.get("/tasks/export/csv", headers=auth_headers)
+    assert "etag" not in changed.headers and b"Yes" in changed.content
+    assert client.get("/tasks/export/csv", headers=auth_headers).headers["etag"] != etag
+
+    entries = [name for name in os.listdir(export_cache.EXPORT_CACHE_DIR) if not name.endswith(".sha256")]
+    assert len(entries) == 3
+    # Least recently used first: the just-read CSV survives
+    budget = int(len(changed.content) / export_cache.EXPORT_CACHE_LOW_WATER) + 1
+    assert export_cache.evict(max_bytes=budget) == 2
+    assert client.get("/tasks/export/csv", headers=auth_headers).headers["etag"]
+    assert "etag" not in client.get("/tasks/export/pdf", headers=auth_headers).headers
+
+
+def test_export_cache_skips_renders_outrun_by_a_change():
+    """A render whose data changed before it finished is served but not cached; stale parts are cleaned up."""
+    import os
+    import time
+    import export_cache
+
+    key = export_cache.cache_key(1, "csv", None, 1)
+    assert b"".join(export_cache.tee(key, [b"a,", b"b"], still_current=lambda: False)) == b"a,b"
+    assert export_cache.lookup(key) is None
+    assert os.listdir(export_cache.EXPORT_CACHE_DIR) == []
+
+    assert b"".join(export_cache.tee(key, [b"a,", b"b"], still_current=lambda: True)) == b"a,b"
+    entry = export_cache.lookup(key)
+    assert entry is not None and entry.size == 3
+    entry.file.close()
+    assert sorted(os.listdir(export_cache.EXPORT_CACHE_DIR)) == [key, key + ".sha256"]
+
+    stale, fresh = (os.path.join(export_cache.EXPORT_CACHE_DIR, f"{key}.{name}.part") for name in ("old", "new"))
+    for name in (stale, fresh):
+        with open(name, "wb") as part:
+            part.write(b"x")
+    old = time.time() - export_cache.EXPORT_CACHE_PART_MAX_AGE_SECONDS - 60
+    os.utime(stale, (old, old))
+    assert export_cache.evict() == 0
+    assert not os.path.exists(stale) and os.path.exists(fresh)
@@ -76,7 +76,7 @@ def test_save_google_token_status_and_refresh(client, auth_headers):
     assert js["has_refresh_token"] is True
 
     # Patch the token refresh helper and call manual refresh
-    with patch("main.refresh_access_token_with_refresh_token") as mock_refresh:
+    with patch("auth.refresh_access_token_with_refresh_token") as mock_refresh:
         mock_refresh.return_value = {"access_token": "new_access", "expires_in": 3600}
         res2 = client.post("/google-auth/refresh", headers=auth_headers)
         assert res2.status_code == 200
@@ -125,9 +125,9 @@ def test_create_google_event_with_refresh_flow(client, auth_headers, example_tas
             return MockResp(ok=False, status_code=401, json_data={"error": "unauthorized"}, text="401")
         return MockResp(ok=True, status_code=200, json_data={"id": "evt_123"})
 
-    # Patch main.requests.post and main.refresh_access_token_with_refresh_token
-    with patch("main.requests.post", side_effect=fake_post) as mock_post:
-        with patch("main.refresh_access_token_with_refresh_token") as mock_refresh:
+    # Patch requests.post and auth.refresh_access_token_with_refresh_token
+    with patch("requests.post", side_effect=fake_post) as mock_post:
+        with patch("auth.refresh_access_token_with_refresh_token") as mock_refresh:
             mock_refresh.return_value = {"access_token": "refreshed_access", "expires_in": 3600}
 
             res = client.post("/google-calendar/events", json=event_payload, headers=auth_headers)
@@ -139,3 +139,115 @@ def test_create_google_event_with_refresh_flow(client, auth_headers, example_tas
     task_res = client.get(f"/tasks/{task_id}", headers=auth_headers)
     assert task_res.status_code == 200
     assert task_res.json().get("google_event_id") == "evt_123"
+
+
+def test_single_flight_collapses_concurrent_calls():
+    import threading
+    import time
+
+    from auth import SingleFlight
+
+    flight = SingleFlight()
+    calls = {"count": 0}
+    started = threading.Event()
+
+    def slow_refresh():
+        calls["count"] += 1
+        started.set()
+        time.sleep(0.2)
+        return "token"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do(1, slow_refresh)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flight.do(1, slow_refresh))) for _ in range(5)]
+    for t in followers:
+        t.start()
+    for t in [leader, *followers]:
+        t.join()
+
+    assert calls["count"] == 1
+    assert results == ["token"] * 6
+
+
+def test_create_google_event_refreshes_proactively(client, auth_headers):
+    # Token expires inside the skew window, so it is refreshed before calling Google
+    client.post(
+        "/google-auth",
+        json={"access_token": "almost_expired", "refresh_token": "1//valid_refresh_token_for_skew_tests", "expires_in": 30},
+        headers=auth_headers,
+    )
+    event_payload = {
+        "summary": "Evento",
+        "start": {"dateTime": "2025-10-11T10:00:00Z"},
+        "end": {"dateTime": "2025-10-11T11:00:00Z"},
+    }
+    seen_tokens = []
+
+    def fake_post(url, json=None, headers=None):
+        seen_tokens.append(headers["Authorization"])
+        resp = MagicMock(ok=True, status_code=200)
+        resp.json.return_value = {"id": "evt_proactive"}
+        return resp
+
+    with patch("requests.post", side_effect=fake_post):
+        with patch("auth.refresh_access_token_with_refresh_token") as mock_refresh:
+            mock_refresh.return_value = {"access_token": "fresh_access", "expires_in": 3600}
+            res = client.post("/google-calendar/events", json=event_payload, headers=auth_headers)
+
+    assert res.status_code == 200
+    assert mock_refresh.call_count == 1
+    assert seen_tokens == ["Bearer fresh_access"]
+
+
+def test_saving_event_id_invalidates_task_etags(client, auth_headers, example_task_payload):
+    task_id = client.post("/tasks", json=example_task_payload, headers=auth_headers).json()["id"]
+    client.post(
+        "/google-auth",
+        json={"access_token": "valid_access", "refresh_token": "1//valid_refresh_token_for_etag_tests", "expires_in": 3600},
+        headers=auth_headers,
+    )
+    etag = client.get("/tasks", headers=auth_headers).headers["ETag"]
+    single_etag = client.get(f"/tasks/{task_id}", headers=auth_headers).headers["ETag"]
+
+    resp = MagicMock(ok=True, status_code=200)
+    resp.json.return_value = {"id": "evt_etag"}
+    with patch("requests.post", return_value=resp):
+        res = client.post("/google-calendar/events", headers=auth_headers, json={
+            "summary": "Evento",
+            "start": {"dateTime": "2025-10-11T10:00:00Z"},
+            "end": {"dateTime": "2025-10-11T11:00:00Z"},
+            "task_id": task_id,
+        })
+    assert res.status_code == 200
+
+    res = client.get("/tasks", headers={**auth_headers, "If-None-Match": etag})
+    assert res.status_code == 200
+    assert [t["google_event_id"] for t in res.json() if t["id"] == task_id] == ["evt_etag"]
+    res = client.get(f"/tasks/{task_id}", headers={**auth_headers, "If-None-Match": single_etag})
+    assert res.status_code == 200
+
+
+def test_delta_sync_reports_saved_event_id(client, auth_headers, example_task_payload):
+    task_id = client.post("/tasks", json=example_task_payload, headers=auth_headers).json()["id"]
+    client.post(
+        "/google-auth",
+        json={"access_token": "valid_access", "refresh_token": "1//valid_refresh_token_for_delta_tests", "expires_in": 3600},
+        headers=auth_headers,
+    )
+    version = client.get("/tasks/changes", headers=auth_headers, params={"since": 0}).json()["version"]
+
+    resp = MagicMock(ok=True, status_code=200)
+    resp.json.return_value = {"id": "evt_delta"}
+    with patch("requests.post", return_value=resp):
+        client.post("/google-calendar/events", headers=auth_headers, json={
+            "summary": "Evento",
+            "start": {"dateTime": "2025-10-11T10:00:00Z"},
+            "end": {"dateTime": "2025-10-11T11:00:00Z"},
+            "task_id": task_id,
+        })
+
+    delta = client.get("/tasks/changes", headers=auth_headers, params={"since": version}).json()
+    assert [(t["id"], t["google_event_id"]) for t in delta["changed"]] == [(task_id, "evt_delta")]
+    assert delta["version"] > version
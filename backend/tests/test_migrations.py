@@ -0,0 +1,85 @@
+"""Tests for the versioned schema migrations."""
+
+import os
+
+import pytest
+from sqlalchemy import event, inspect, text
+
+from database import migrations
+from database.database import build_engine
+
+
+@pytest.fixture()
+def engine(tmp_path):
+    eng = build_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    yield eng
+    eng.dispose()
+
+
+def test_upgrade_fresh_database_reaches_head(engine):
+    assert migrations.current_version(engine) is None
+    assert migrations.upgrade(engine) == migrations.head_version()
+    assert migrations.current_version(engine) == migrations.head_version()
+
+    index_names = {ix["name"] for ix in inspect(engine).get_indexes("tasks")}
+    assert {"ix_tasks_user_priority", "ix_tasks_user_completed_deadline"} <= index_names
+
+
+def test_upgrade_legacy_database_adds_columns_and_backfills(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR NOT NULL, "
+            "hashed_password VARCHAR NOT NULL, auth_provider VARCHAR NOT NULL)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE tasks (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, description VARCHAR, "
+            "deadline DATETIME, priority VARCHAR NOT NULL, user_id INTEGER NOT NULL REFERENCES users(id))"
+        ))
+        conn.execute(text("INSERT INTO users VALUES (1, 'old@example.com', 'x', 'local')"))
+        conn.execute(text("INSERT INTO tasks (id, title, priority, user_id) VALUES (1, 'a', 'High', 1), (2, 'b', 'Low', 1)"))
+
+    migrations.upgrade(engine)
+
+    columns = {c["name"] for c in inspect(engine).get_columns("tasks")}
+    assert {"completed", "all_day", "address", "priority_rank"} <= columns
+    with engine.connect() as conn:
+        ranks = dict(conn.execute(text("SELECT id, priority_rank FROM tasks")).all())
+    assert ranks == {1: 1, 2: 3}
+
+
+def test_ensure_schema_is_a_single_query_when_current(engine):
+    migrations.upgrade(engine)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    assert migrations.ensure_schema(engine, auto_upgrade=False) == migrations.head_version()
+    assert len(statements) == 1
+
+
+def test_ensure_schema_refuses_outdated_schema_without_auto_upgrade(engine):
+    with pytest.raises(RuntimeError, match="database.migrations upgrade"):
+        migrations.ensure_schema(engine, auto_upgrade=False)
+    assert migrations.ensure_schema(engine, auto_upgrade=True) == migrations.head_version()
+
+
+@pytest.mark.parametrize("dialect, deadline", [("sqlite", "deadline"), ("postgresql", "deadline NULLS FIRST")])
+def test_sort_indexes_match_null_ordering_per_dialect(dialect, deadline):
+    """Postgres indexes default to NULLS LAST; the /tasks sorts put NULL deadlines first."""
+    from sqlalchemy import create_mock_engine
+
+    import models  # noqa: F401  pylint: disable=unused-import
+    from database.database import Base
+
+    ddl = []
+    mock = create_mock_engine(f"{dialect}://", lambda sql, *_, **__: ddl.append(str(sql.compile(dialect=mock.dialect))))
+    Base.metadata.create_all(mock, checkfirst=False)
+    indexes = [s.strip() for s in ddl if s.strip().startswith("CREATE INDEX ix_tasks_user_deadline ")]
+    assert indexes == [f"CREATE INDEX ix_tasks_user_deadline ON tasks (user_id, {deadline}, id)"]
+
+
+@pytest.mark.skipif("AUTO_MIGRATE" in os.environ, reason="AUTO_MIGRATE set in the environment")
+def test_ensure_schema_does_not_migrate_by_default(engine):
+    # Workers booting together must not race each other through the migrations
+    with pytest.raises(RuntimeError):
+        migrations.ensure_schema(engine)
+    assert migrations.current_version(engine) is None
@@ -0,0 +1,96 @@
+"""Tests for the deadline reminder scheduler."""
+
+from datetime import datetime, timedelta
+
+import events
+from models import Task as TaskModel
+from reminders import ReminderScheduler
+from tests.conftest import TestingSessionLocal
+
+
+def test_reminders_follow_deadlines_and_task_changes(client, auth_headers):
+    start = datetime.utcnow().replace(microsecond=0)
+    clock = [start]
+
+    def create(title, delta, **extra):
+        payload = {"title": title, "priority": "Medium", "deadline": (start + delta).isoformat(), **extra}
+        return client.post("/tasks", json=payload, headers=auth_headers).json()["id"]
+
+    create("Soon", timedelta(minutes=30))
+    later = create("Later", timedelta(minutes=90))
+    create("Far", timedelta(hours=3))
+    done = create("Done", timedelta(minutes=20))
+    client.patch(f"/tasks/{done}/completed", json={"completed": True}, headers=auth_headers)
+    client.post("/tasks", json={"title": "Undated", "priority": "Low"}, headers=auth_headers)
+
+    sent = []
+
+    def capture(_user_id, event):
+        if event["type"] == "reminder":
+            sent.append(event["title"])
+
+    scheduler = ReminderScheduler(
+        session_factory=TestingSessionLocal, lead_seconds=3600, horizon_seconds=3600, batch_size=2,
+        clock=lambda: clock[0],
+    )
+    events.bus.add_listener(capture)
+    events.bus.add_listener(scheduler.on_event)
+    try:
+        # Only the next two hours are loaded; "Soon" is already inside the lead time
+        wake = scheduler.tick()
+        assert sent == ["Soon"]
+        assert scheduler.pending_count() == 1
+        assert wake == start + timedelta(minutes=30)
+
+        # Changes arrive through the bus, not through a reload
+        create("Added", timedelta(minutes=70))
+        client.patch(f"/tasks/{later}/completed", json={"completed": True}, headers=auth_headers)
+        assert scheduler.pending_count() == 1
+
+        clock[0] = start + timedelta(minutes=15)
+        scheduler.tick()
+        assert sent == ["Soon", "Added"]
+
+        # Moving the window forward loads "Far", which is now due for a reminder
+        clock[0] = start + timedelta(hours=2, minutes=10)
+        scheduler.tick()
+        assert sent == ["Soon", "Added", "Far"]
+        assert scheduler.pending_count() == 0
+    finally:
+        events.bus.remove_listener(scheduler.on_event)
+        events.bus.remove_listener(capture)
+
+
+def test_reminder_is_checked_against_the_database(client, auth_headers):
+    start = datetime.utcnow().replace(microsecond=0)
+    task_id = client.post(
+        "/tasks",
+        json={"title": "Moved", "priority": "High", "deadline": (start + timedelta(minutes=30)).isoformat()},
+        headers=auth_headers,
+    ).json()["id"]
+    sent = []
+
+    def capture(_user_id, event):
+        if event["type"] == "reminder":
+            sent.append(event)
+
+    scheduler = ReminderScheduler(session_factory=TestingSessionLocal, lead_seconds=600, clock=lambda: start)
+    events.bus.add_listener(capture)
+    try:
+        scheduler.tick()
+        # Changed behind the API's back: no event reaches the scheduler
+        db = TestingSessionLocal()
+        db.get(TaskModel, task_id).deadline = start + timedelta(minutes=50)
+        db.commit()
+        db.close()
+
+        scheduler.clock = lambda: start + timedelta(minutes=21)
+        scheduler.tick()
+        assert sent == []
+        assert scheduler.pending_count() == 1
+
+        scheduler.clock = lambda: start + timedelta(minutes=41)
+        scheduler.tick()
+        assert [e["id"] for e in sent] == [task_id]
+    finally:
+        events.bus.remove_listener(capture)
@@ -95,3 +95,308 @@ def test_sort_and_filter_completion_and_insertion_order(client, auth_headers):
     assert all(data_deadline[i]["deadline"] <= data_deadline[i+1]["deadline"] for i in range(len(data_deadline)-1))
 
 
+
+
+def test_priority_sort_uses_rank_after_update(client, auth_headers):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    ids = []
+    for title, priority in [("low", "Low"), ("high", "High"), ("medium", "Medium")]:
+        res = client.post(
+            "/tasks",
+            json={"title": title, "deadline": (now + datetime.timedelta(hours=1)).isoformat(), "priority": priority},
+            headers=auth_headers,
+        )
+        ids.append(res.json()["id"])
+
+    # Demote "high" to Low: the stored rank must follow
+    client.put(f"/tasks/{ids[1]}", json={"title": "high", "priority": "Low"}, headers=auth_headers)
+
+    res = client.get("/tasks", headers=auth_headers, params={"sort_by": "priority", "sort_order": "desc"})
+    assert [t["title"] for t in res.json()] == ["medium", "low", "high"]
+    res = client.get("/tasks", headers=auth_headers, params={"sort_by": "priority", "sort_order": "asc"})
+    assert [t["title"] for t in res.json()] == ["high", "low", "medium"]
+
+
+def test_keyset_pagination_matches_full_listing(client, auth_headers):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    shared = (now + datetime.timedelta(hours=5)).isoformat()
+    specs = [
+        ("High", shared), ("Low", None), ("Medium", shared), ("High", None),
+        ("Medium", (now + datetime.timedelta(hours=1)).isoformat()), ("Low", shared), ("High", shared),
+    ]
+    for i, (priority, deadline) in enumerate(specs):
+        client.post(
+            "/tasks",
+            json={"title": f"P{i}", "description": None, "deadline": deadline, "priority": priority},
+            headers=auth_headers,
+        )
+
+    for sort_by in ("insertion", "deadline", "priority"):
+        for sort_order in ("asc", "desc"):
+            params = {"sort_by": sort_by, "sort_order": sort_order}
+            full = [t["id"] for t in client.get("/tasks", headers=auth_headers, params=params).json()]
+            paged, cursor = [], None
+            while True:
+                page_params = {**params, "limit": 2, **({"cursor": cursor} if cursor else {})}
+                res = client.get("/tasks", headers=auth_headers, params=page_params)
+                assert res.status_code == 200
+                assert len(res.json()) <= 2
+                paged += [t["id"] for t in res.json()]
+                cursor = res.headers.get("X-Next-Cursor")
+                if not cursor:
+                    break
+            assert paged == full, (sort_by, sort_order)
+
+
+def test_invalid_cursor_is_rejected(client, auth_headers):
+    for i in range(3):
+        client.post("/tasks", json={"title": f"C{i}", "priority": "Low"}, headers=auth_headers)
+    res = client.get("/tasks", headers=auth_headers, params={"sort_by": "deadline", "limit": 1})
+    cursor = res.headers["X-Next-Cursor"]
+
+    res = client.get("/tasks", headers=auth_headers, params={"sort_by": "priority", "limit": 1, "cursor": cursor})
+    assert res.status_code == 400
+    res = client.get("/tasks", headers=auth_headers, params={"limit": 1, "cursor": "not-a-cursor"})
+    assert res.status_code == 400
+
+
+def test_conditional_get_with_etag(client, auth_headers):
+    res = client.post("/tasks", json={"title": "E1", "priority": "Low"}, headers=auth_headers)
+    task_id = res.json()["id"]
+
+    res = client.get("/tasks", headers=auth_headers)
+    etag = res.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert client.get("/tasks", headers={**auth_headers, "If-None-Match": etag}).status_code == 304
+    # Different query parameters get a different tag
+    other = client.get("/tasks", headers=auth_headers, params={"sort_by": "deadline"}).headers["ETag"]
+    assert other != etag
+
+    single = client.get(f"/tasks/{task_id}", headers=auth_headers)
+    single_etag = single.headers["ETag"]
+    res = client.get(f"/tasks/{task_id}", headers={**auth_headers, "If-None-Match": single_etag})
+    assert res.status_code == 304
+    assert res.headers["ETag"] == single_etag
+
+    # Any mutation bumps the version and invalidates both tags
+    client.patch(f"/tasks/{task_id}/completed", json={"completed": True}, headers=auth_headers)
+    res = client.get("/tasks", headers={**auth_headers, "If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
+    assert client.get(f"/tasks/{task_id}", headers={**auth_headers, "If-None-Match": single_etag}).status_code == 200
+
+
+def test_batch_applies_all_operations(client, auth_headers):
+    ids = [client.post("/tasks", json={"title": f"B{i}", "priority": "Low"}, headers=auth_headers).json()["id"] for i in range(3)]
+    etag = client.get("/tasks", headers=auth_headers).headers["ETag"]
+
+    res = client.post("/tasks/batch", headers=auth_headers, json={"operations": [
+        {"op": "create", "data": {"title": "New", "priority": "High"}},
+        {"op": "update", "id": ids[0], "data": {"title": "B0 renamed", "priority": "High"}},
+        {"op": "complete", "id": ids[1], "data": {"completed": True}},
+        {"op": "delete", "id": ids[2]},
+    ]})
+    assert res.status_code == 200, res.text
+    body = res.json()
+    assert body["applied"] is True
+    created, updated, completed, deleted = body["results"]
+    assert created["ok"] and created["task"]["title"] == "New"
+    assert updated["task"]["title"] == "B0 renamed"
+    assert completed["task"]["completed"] is True
+    assert deleted["id"] == ids[2] and deleted["task"] is None
+
+    res = client.get("/tasks", headers={**auth_headers, "If-None-Match": etag}, params={"sort_by": "priority", "sort_order": "desc"})
+    assert res.status_code == 200
+    titles = [t["title"] for t in res.json()]
+    assert set(titles[:2]) == {"New", "B0 renamed"}
+    assert ids[2] not in [t["id"] for t in res.json()]
+
+
+def test_batch_is_rejected_as_a_whole(client, auth_headers, second_user_auth_headers):
+    own = client.post("/tasks", json={"title": "Mine", "priority": "Low"}, headers=auth_headers).json()["id"]
+    other = client.post("/tasks", json={"title": "Theirs", "priority": "Low"}, headers=second_user_auth_headers).json()["id"]
+
+    res = client.post("/tasks/batch", headers=auth_headers, json={"operations": [
+        {"op": "complete", "id": own, "data": {"completed": True}},
+        {"op": "delete", "id": other},
+        {"op": "create", "data": {"description": "missing title"}},
+        {"op": "update", "id": own, "data": {"title": "twice"}},
+    ]})
+    assert res.status_code == 422
+    body = res.json()
+    assert body["applied"] is False
+    assert [r["ok"] for r in body["results"]] == [True, False, False, False]
+
+    assert client.get(f"/tasks/{own}", headers=auth_headers).json()["completed"] is False
+    assert client.get(f"/tasks/{other}", headers=second_user_auth_headers).status_code == 200
+
+
+def test_delta_sync_reports_changes_and_deletions(client, auth_headers):
+    ids = [client.post("/tasks", json={"title": f"D{i}", "priority": "Low"}, headers=auth_headers).json()["id"] for i in range(3)]
+
+    res = client.get("/tasks/changes", headers=auth_headers, params={"since": 0})
+    assert res.status_code == 200
+    first = res.json()
+    assert first["reset"] is False
+    assert set(ids) <= {t["id"] for t in first["changed"]}
+    version = first["version"]
+
+    client.patch(f"/tasks/{ids[0]}/completed", json={"completed": True}, headers=auth_headers)
+    client.delete(f"/tasks/{ids[1]}", headers=auth_headers)
+    client.post("/tasks/batch", headers=auth_headers, json={"operations": [{"op": "delete", "id": ids[2]}]})
+
+    delta = client.get("/tasks/changes", headers=auth_headers, params={"since": version}).json()
+    assert [t["id"] for t in delta["changed"]] == [ids[0]]
+    assert delta["changed"][0]["completed"] is True
+    assert delta["deleted"] == [ids[1], ids[2]]
+    assert delta["version"] > version
+
+    empty = client.get("/tasks/changes", headers=auth_headers, params={"since": delta["version"]}).json()
+    assert empty["changed"] == [] and empty["deleted"] == []
+
+
+def test_tombstone_compaction_forces_reset(client, auth_headers):
+    from jobs import compact_task_tombstones
+    from tests.conftest import TestingSessionLocal
+
+    task_id = client.post("/tasks", json={"title": "Gone", "priority": "Low"}, headers=auth_headers).json()["id"]
+    before = client.get("/tasks/changes", headers=auth_headers, params={"since": 0}).json()["version"]
+    client.delete(f"/tasks/{task_id}", headers=auth_headers)
+
+    assert compact_task_tombstones(TestingSessionLocal, retention_seconds=-60) >= 1
+
+    res = client.get("/tasks/changes", headers=auth_headers, params={"since": before}).json()
+    assert res["reset"] is True
+    latest = client.get("/tasks/changes", headers=auth_headers, params={"since": res["version"]}).json()
+    assert latest["reset"] is False
+
+
+def test_fields_projection(client, auth_headers, example_task_payload):
+    for i in range(3):
+        client.post("/tasks", json={**example_task_payload, "title": f"F{i}", "address": "x" * 2000}, headers=auth_headers)
+
+    params = {"sort_by": "deadline", "sort_order": "desc"}
+    full = client.get("/tasks", headers=auth_headers, params=params).json()
+    res = client.get("/tasks", headers=auth_headers, params={**params, "fields": "title,id,deadline", "limit": 2})
+    assert res.status_code == 200
+    assert res.json() == [{"id": t["id"], "title": t["title"], "deadline": t["deadline"]} for t in full[:2]]
+
+    rest = client.get(
+        "/tasks", headers=auth_headers,
+        params={**params, "fields": "title,id,deadline", "limit": 2, "cursor": res.headers["X-Next-Cursor"]},
+    )
+    assert [t["id"] for t in rest.json()] == [t["id"] for t in full[2:]]
+
+    assert client.get("/tasks", headers=auth_headers, params={"fields": "title,hashed_password"}).status_code == 400
+
+
+def test_search_ranks_scopes_and_paginates(client, auth_headers, second_user_auth_headers):
+    def create(headers, **fields):
+        return client.post("/tasks", json={"priority": "Low", **fields}, headers=headers).json()["id"]
+
+    title_hit = create(auth_headers, title="Pagare bolletta luce")
+    body_hit = create(auth_headers, title="Commissioni", description="ricordarsi la bolletta del gas")
+    create(auth_headers, title="Spesa", description="latte e pane")
+    create(second_user_auth_headers, title="Bolletta acqua")
+
+    res = client.get("/tasks/search", headers=auth_headers, params={"q": "bollet"})
+    assert res.status_code == 200
+    hits = res.json()
+    assert [h["task"]["id"] for h in hits] == [title_hit, body_hit]
+    assert hits[0]["title_highlight"] == "Pagare <mark>bolletta</mark> luce"
+    assert "<mark>bolletta</mark>" in hits[1]["snippet"]
+
+    # The index follows updates and deletes
+    client.put(f"/tasks/{title_hit}", json={"title": "Pagare affitto", "priority": "Low"}, headers=auth_headers)
+    client.delete(f"/tasks/{body_hit}", headers=auth_headers)
+    assert client.get("/tasks/search", headers=auth_headers, params={"q": "bolletta"}).json() == []
+    assert len(client.get("/tasks/search", headers=auth_headers, params={"q": "affitto"}).json()) == 1
+
+    ids = [create(auth_headers, title=f"Riunione {i}") for i in range(5)]
+    first_page = client.get("/tasks/search", headers=auth_headers, params={"q": "riunione", "limit": 2})
+    other_query = {"q": "altro", "cursor": first_page.headers["X-Next-Cursor"]}
+    assert client.get("/tasks/search", headers=auth_headers, params=other_query).status_code == 400
+
+    seen, cursor = [], None
+    while True:
+        params = {"q": "riunione", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        res = client.get("/tasks/search", headers=auth_headers, params=params)
+        seen += [h["task"]["id"] for h in res.json()]
+        cursor = res.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert sorted(seen) == ids
+
+
+def test_search_highlights_are_escaped(client, auth_headers):
+    client.post("/tasks", headers=auth_headers, json={
+        "title": "<script>alert(1)</script> bolletta", "description": "<img src=x onerror=alert(1)> bolletta",
+        "priority": "Low",
+    })
+    hit, = client.get("/tasks/search", headers=auth_headers, params={"q": "bolletta"}).json()
+    assert hit["title_highlight"] == "&lt;script&gt;alert(1)&lt;/script&gt; <mark>bolletta</mark>"
+    assert "<img" not in hit["snippet"] and "&lt;img src=x onerror=alert(1)&gt; <mark>bolletta</mark>" in hit["snippet"]
+    # The task itself is returned as stored
+    assert hit["task"]["title"] == "<script>alert(1)</script> bolletta"
+
+
+def test_task_stats_follow_every_mutation(client, auth_headers):
+    from jobs import reconcile_task_stats
+    from models import Task
+    from tests.conftest import TestingSessionLocal
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    late = (now - datetime.timedelta(hours=3)).isoformat()
+    ids = [
+        client.post("/tasks", json={"title": "S0", "priority": "High", "deadline": late}, headers=auth_headers).json()["id"],
+        client.post("/tasks", json={"title": "S1", "priority": "High", "deadline": late, "all_day": True}, headers=auth_headers).json()["id"],
+        client.post("/tasks", json={"title": "S2", "priority": "Low"}, headers=auth_headers).json()["id"],
+    ]
+    client.patch(f"/tasks/{ids[2]}/completed", json={"completed": True}, headers=auth_headers)
+    client.put(f"/tasks/{ids[2]}", json={"title": "S2", "priority": "Medium", "completed": True}, headers=auth_headers)
+    client.post("/tasks/batch", headers=auth_headers, json={"operations": [
+        {"op": "create", "data": {"title": "S3", "priority": "Low"}},
+        {"op": "delete", "id": ids[1]},
+    ]})
+
+    stats = client.get("/tasks/stats", headers=auth_headers).json()
+    assert stats["total"] == 3 and stats["completed"] == 1 and stats["open"] == 2
+    assert stats["by_priority"]["High"] == {"total": 1, "completed": 0, "open": 1}
+    assert stats["by_priority"]["Medium"] == {"total": 1, "completed": 1, "open": 0}
+    assert "Low" in stats["by_priority"]
+    # Only the timed task is overdue; the deleted all-day one would still be "today"
+    assert stats["overdue"] == 1
+
+    # Drift introduced behind the API is corrected by the reconcile job
+    db = TestingSessionLocal()
+    db.query(Task).filter(Task.id == ids[0]).update({"completed": True})
+    db.commit()
+    db.close()
+    assert reconcile_task_stats(TestingSessionLocal) >= 1
+    assert client.get("/tasks/stats", headers=auth_headers).json()["completed"] == 2
+
+
+def test_due_window(client, auth_headers):
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    def create(title, delta, **extra):
+        payload = {"title": title, "priority": "Low", "deadline": (now + delta).isoformat(), **extra}
+        return client.post("/tasks", json=payload, headers=auth_headers).json()["id"]
+
+    soon = create("soon", datetime.timedelta(minutes=30))
+    create("later", datetime.timedelta(hours=3))
+    late = create("late", -datetime.timedelta(minutes=30))
+    today = create("today", -datetime.timedelta(hours=2), all_day=True)
+    yesterday = create("yesterday", -datetime.timedelta(hours=30), all_day=True)
+    done = create("done", datetime.timedelta(minutes=10))
+    client.patch(f"/tasks/{done}/completed", json={"completed": True}, headers=auth_headers)
+
+    res = client.get("/tasks/due", headers=auth_headers, params={"within": 3600})
+    assert res.status_code == 200
+    assert [t["id"] for t in res.json()] == [today, soon]
+
+    res = client.get("/tasks/due", headers=auth_headers, params={"within": 3600, "include_overdue": True})
+    assert [t["id"] for t in res.json()] == [yesterday, today, late, soon]
+
+    res = client.get("/tasks/due", headers=auth_headers, params={"within": 3600, "include_overdue": True, "limit": 2})
+    assert [t["id"] for t in res.json()] == [yesterday, today]
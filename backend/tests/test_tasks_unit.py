@@ -28,3 +28,13 @@ def test_task_schema_default_priority():
     assert task.priority == "Medium"
 
 
+
+
+def test_priority_rank_follows_priority():
+    from models import Task, priority_rank_for
+
+    task = Task(title="A", priority="High", user_id=1)
+    assert task.priority_rank == 1
+    task.priority = "Low"
+    assert task.priority_rank == 3
+    assert priority_rank_for("Someday") == 4
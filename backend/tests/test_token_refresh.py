@@ -123,7 +123,7 @@ def print_google_oauth_setup_instructions():
     print("4. You can also test manually via FastAPI endpoints.\n")
 
 
-@patch("auth.requests.post")
+@patch("requests.post")
 def test_refresh_token_google_success(mock_post):
     """Simulate a successful response from Google's token endpoint."""
     mock_resp = MagicMock()
@@ -141,7 +141,7 @@ def test_refresh_token_google_success(mock_post):
     print("✅ Successful token refresh covered.")
 
 
-@patch("auth.requests.post")
+@patch("requests.post")
 def test_refresh_token_google_invalid_grant(mock_post):
     """Simulate Google's invalid_grant error."""
     mock_resp = MagicMock()
@@ -162,7 +162,7 @@ def test_refresh_token_google_invalid_grant(mock_post):
         assert "expired" in e.detail.lower()
 
 
-@patch("auth.requests.post")
+@patch("requests.post")
 def test_refresh_token_google_missing_secret(mock_post):
     """Simulate missing client secret."""
     os.environ["GOOGLE_CLIENT_SECRET"] = ""
@@ -174,7 +174,7 @@ def test_refresh_token_google_missing_secret(mock_post):
         assert "client secret" in e.detail.lower()
 
 
-@patch("auth.requests.post")
+@patch("requests.post")
 def test_refresh_token_http_error(mock_post):
     """Simulate a network or HTTP error (non-JSON body)."""
     mock_resp = MagicMock()
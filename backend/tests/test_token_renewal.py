@@ -0,0 +1,157 @@
+"""Tests for the background Google token renewal job against a local OAuth stand-in."""
+
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+import auth
+from jobs import GoogleTokenRenewer, PeriodicJob
+from models import User
+from tests.conftest import TestingSessionLocal
+
+
+REVOKED_TOKEN = "1//revoked_refresh_token_for_renewal_tests"
+
+
+class FakeGoogleTokenEndpoint(BaseHTTPRequestHandler):
+    """Minimal stand-in for https://oauth2.googleapis.com/token."""
+
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    calls = 0
+
+    def do_POST(self):
+        cls = type(self)
+        with cls.lock:
+            cls.calls += 1
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            form = parse_qs(self.rfile.read(length).decode())
+            time.sleep(0.05)
+            if form["refresh_token"][0] == REVOKED_TOKEN:
+                status, body = 400, {"error": "invalid_grant", "error_description": "Token has been revoked"}
+            else:
+                status, body = 200, {"access_token": f"renewed-{uuid.uuid4().hex[:8]}", "expires_in": 3600}
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def google_token_endpoint(monkeypatch):
+    FakeGoogleTokenEndpoint.calls = 0
+    FakeGoogleTokenEndpoint.max_in_flight = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGoogleTokenEndpoint)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(auth, "GOOGLE_OAUTH_TOKEN_URL", f"http://127.0.0.1:{server.server_port}/token")
+    monkeypatch.setattr(auth, "GOOGLE_CLIENT_SECRET", "local-secret")
+    yield FakeGoogleTokenEndpoint
+    server.shutdown()
+    server.server_close()
+
+
+def _create_users(expiry_offsets, refresh_token=None):
+    db = TestingSessionLocal()
+    try:
+        ids = []
+        for offset in expiry_offsets:
+            user = User(
+                email=f"renew_{uuid.uuid4().hex[:8]}@example.com",
+                hashed_password="",
+                google_access_token="old_access",
+                google_refresh_token=refresh_token or f"1//valid_refresh_token_{uuid.uuid4().hex}",
+                google_token_expiry=datetime.utcnow() + timedelta(seconds=offset),
+            )
+            db.add(user)
+            db.commit()
+            ids.append(user.id)
+        return ids
+    finally:
+        db.close()
+
+
+def _access_tokens(ids):
+    db = TestingSessionLocal()
+    try:
+        return {u.id: u.google_access_token for u in db.query(User).filter(User.id.in_(ids))}
+    finally:
+        db.close()
+
+
+def _clear_google_tokens():
+    db = TestingSessionLocal()
+    try:
+        db.query(User).update({User.google_token_expiry: None})
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_renewer_refreshes_expiring_tokens_in_bounded_batches(google_token_endpoint):
+    _clear_google_tokens()
+    expiring = _create_users([60] * 7)
+    later = _create_users([6 * 3600])
+
+    renewer = GoogleTokenRenewer(TestingSessionLocal, window_seconds=600, batch_size=3, concurrency=2)
+    counts = renewer.run_once()
+
+    assert counts == {"renewed": 7, "failed": 0, "skipped": 0}
+    assert google_token_endpoint.calls == 7
+    assert google_token_endpoint.max_in_flight <= 2
+    tokens = _access_tokens(expiring + later)
+    assert all(tokens[i].startswith("renewed-") for i in expiring)
+    assert tokens[later[0]] == "old_access"
+
+    # Renewed tokens are now outside the window
+    assert renewer.run_once() == {"renewed": 0, "failed": 0, "skipped": 0}
+
+
+def test_renewer_backs_off_after_failed_refresh(google_token_endpoint):
+    _clear_google_tokens()
+    revoked = _create_users([30], refresh_token=REVOKED_TOKEN)
+
+    renewer = GoogleTokenRenewer(TestingSessionLocal, window_seconds=600, batch_size=10, concurrency=2)
+    assert renewer.run_once()["failed"] == 1
+    assert renewer.run_once()["skipped"] == 1
+    assert google_token_endpoint.calls == 1
+    assert _access_tokens(revoked)[revoked[0]] == "old_access"
+
+
+def test_periodic_job_runs_until_stopped():
+    runs = []
+    job = PeriodicJob("test-job", 0.01, lambda: runs.append(1))
+    job.start()
+    time.sleep(0.1)
+    job.stop()
+    count = len(runs)
+    time.sleep(0.05)
+    assert count >= 2
+    assert len(runs) == count
+
+
+def test_periodic_job_waits_one_interval_before_first_run():
+    runs = []
+    job = PeriodicJob("test-job", 60, lambda: runs.append(1))
+    job.start()
+    time.sleep(0.05)
+    job.stop()
+    assert runs == []